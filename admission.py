@@ -0,0 +1,233 @@
+# admission.py - admission control and load shedding for the prediction endpoints
+"""Bounded concurrency, per-client quotas and request deadlines.
+
+ConcurrencyLimiter lets at most max_in_flight requests score at once and
+up to max_queue more wait (at most queue_timeout) for a slot. Anything
+beyond that is shed at once with 503 and a Retry-After estimated from
+recent service times, instead of piling up and timing out upstream.
+
+ClientQuotas keeps a token bucket per client (the SPAM_QUOTA_HEADER
+header, default X-Client-Id, or the remote address) and answers 429 with
+Retry-After when a client runs out of tokens.
+
+A request may carry X-Request-Deadline, an absolute Unix time in seconds.
+Requests whose deadline has passed - on arrival or while queued - are
+dropped with 504 before they are scored; the queue wait is capped at the
+deadline.
+
+Configured with SPAM_MAX_IN_FLIGHT (0, the default, means no limit),
+SPAM_MAX_QUEUE, SPAM_QUEUE_TIMEOUT_MS, SPAM_QUOTA_RATE (tokens per second
+per client, 0 = off), SPAM_QUOTA_BURST and SPAM_QUOTA_HEADER. Limits are
+per process. Behind serve.py, give each worker more --threads than
+SPAM_MAX_IN_FLIGHT + SPAM_MAX_QUEUE so excess requests get a thread to
+be rejected on instead of waiting in the accept backlog.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+DEADLINE_HEADER = 'X-Request-Deadline'
+
+# Why a request was not admitted: HTTP status, outcome label, Retry-After seconds
+Rejection = namedtuple('Rejection', ['status', 'reason', 'retry_after'])
+
+def parse_deadline(value):
+    """Absolute deadline (Unix seconds) from the header value, None if absent
+
+    Raises ValueError for anything that is not a positive number.
+    """
+    if value is None or not value.strip():
+        return None
+    try:
+        deadline = float(value)
+    except ValueError:
+        deadline = None
+    if deadline is None or not math.isfinite(deadline) or deadline <= 0:
+        raise ValueError(f'{DEADLINE_HEADER} must be a Unix time in seconds')
+    return deadline
+
+class ConcurrencyLimiter:
+    """At most max_in_flight holders, up to max_queue waiters, the rest shed"""
+
+    def __init__(self, max_in_flight, max_queue=0, queue_timeout=1.0, smoothing=0.1):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.smoothing = smoothing
+        self._condition = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.expired = 0
+        self.max_wait_seen = 0.0
+        self._service_time = None
+
+    def acquire(self, deadline=None):
+        """Take a slot; returns None, or a Rejection when the request is shed"""
+        with self._condition:
+            if self.in_flight < self.max_in_flight and not self.waiting:
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+            if self.waiting >= self.max_queue:
+                self.shed += 1
+                return Rejection(503, 'shed', self._retry_after())
+
+            timeout = self.queue_timeout
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.time())
+            start = time.monotonic()
+            end = start + timeout
+            self.waiting += 1
+            self.queued += 1
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.max_wait_seen = max(self.max_wait_seen, time.monotonic() - start)
+
+            if deadline is not None and time.time() >= deadline:
+                self.expired += 1
+                self._condition.notify()
+                return Rejection(504, 'expired', None)
+            if self.in_flight >= self.max_in_flight:
+                self.timed_out += 1
+                return Rejection(503, 'shed', self._retry_after())
+            self.in_flight += 1
+            self.admitted += 1
+            return None
+
+    def release(self, seconds=None):
+        """Give the slot back; seconds (time spent holding it) feeds Retry-After"""
+        with self._condition:
+            self.in_flight -= 1
+            if seconds is not None:
+                if self._service_time is None:
+                    self._service_time = seconds
+                else:
+                    self._service_time += self.smoothing * (seconds - self._service_time)
+            self._condition.notify()
+
+    def _retry_after(self):
+        # Roughly how long until the current backlog has drained, at least 1s
+        service_time = self._service_time or 0.0
+        backlog = self.in_flight + self.waiting
+        return max(1, math.ceil(backlog * service_time / max(1, self.max_in_flight)))
+
+    def stats(self):
+        with self._condition:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'queue_timeout_ms': self.queue_timeout * 1000,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'shed': self.shed,
+                'timed_out_in_queue': self.timed_out,
+                'expired_in_queue': self.expired,
+                'max_queue_wait_ms': round(self.max_wait_seen * 1000, 3),
+                'service_time_ms': round(self._service_time * 1000, 3) if self._service_time else None,
+            }
+
+class ClientQuotas:
+    """Token bucket per client: rate tokens per second, up to burst saved"""
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> [tokens, last refill time], least recently seen first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def take(self, client, cost=1.0):
+        """None if the client may proceed, else a 429 Rejection"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [float(self.burst), now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return None
+            self.limited += 1
+            return Rejection(429, 'rate_limited', max(1, math.ceil((cost - bucket[0]) / self.rate)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate_per_s': self.rate,
+                'burst': self.burst,
+                'clients': len(self._buckets),
+                'rate_limited': self.limited,
+            }
+
+class AdmissionControl:
+    """Deadline check, client quota and concurrency limit, in that order"""
+
+    def __init__(self, limiter=None, quotas=None, client_header='X-Client-Id'):
+        self.limiter = limiter
+        self.quotas = quotas
+        self.client_header = client_header
+        self._lock = threading.Lock()
+        self.expired = 0
+
+    def admit(self, client, deadline=None):
+        """None when the request may be scored (call release() after), else a Rejection"""
+        if deadline is not None and time.time() >= deadline:
+            with self._lock:
+                self.expired += 1
+            return Rejection(504, 'expired', None)
+        if self.quotas is not None:
+            rejection = self.quotas.take(client)
+            if rejection is not None:
+                return rejection
+        if self.limiter is not None:
+            return self.limiter.acquire(deadline)
+        return None
+
+    def release(self, seconds=None):
+        if self.limiter is not None:
+            self.limiter.release(seconds)
+
+    def stats(self):
+        return {
+            'expired_on_arrival': self.expired,
+            'concurrency': self.limiter.stats() if self.limiter is not None else None,
+            'quotas': self.quotas.stats() if self.quotas is not None else None,
+        }
+
+def admission_from_env():
+    """Build the app's admission control from SPAM_MAX_IN_FLIGHT / SPAM_QUOTA_* variables"""
+    limiter = None
+    max_in_flight = int(os.environ.get('SPAM_MAX_IN_FLIGHT', 0))
+    if max_in_flight > 0:
+        limiter = ConcurrencyLimiter(
+            max_in_flight,
+            max_queue=int(os.environ.get('SPAM_MAX_QUEUE', 2 * max_in_flight)),
+            queue_timeout=float(os.environ.get('SPAM_QUEUE_TIMEOUT_MS', 1000)) / 1000,
+        )
+    quotas = None
+    rate = float(os.environ.get('SPAM_QUOTA_RATE', 0))
+    if rate > 0:
+        quotas = ClientQuotas(rate, burst=float(os.environ.get('SPAM_QUOTA_BURST', max(1.0, rate))))
+    return AdmissionControl(limiter, quotas,
+                            client_header=os.environ.get('SPAM_QUOTA_HEADER', 'X-Client-Id'))
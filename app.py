@@ -1,122 +1,265 @@
 # app.py - UPDATED TO USE YOUR EXISTING TF-IDF MODELS
-from flask import Flask, render_template, request, jsonify
-import pickle
-import re
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
+from werkzeug.exceptions import ClientDisconnected
+import atexit
+import hmac
 import os
-import joblib
+import queue
+import threading
+import time
+import traceback
+
+from admission import DEADLINE_HEADER, admission_from_env, parse_deadline
+from inference import InferencePipeline
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, ServiceMetrics, outcome_for_status
+from model_loader import load_model_pair
+from model_reload import ModelWatcher, new_model_handle
+from online_model import load_online_pair, online_enabled, online_learner_from_env
+from body_extractor import extraction_stats
+from campaign_index import campaign_index_from_env
+from cascade import cascade_enabled, load_first_stage
+from micro_batcher import micro_batcher_from_env
+from ndjson_stream import StreamScorer, iter_lines
+from prediction_cache import cache_from_env
+from shadow_eval import shadow_from_env
+from structured_log import logger_from_env
 
 app = Flask(__name__)
 
-# Global variables for model and vectorizer
-model = None
-vectorizer = None
-model_loaded = False
+# Maximum number of emails accepted by a single /api/predict/batch call
+app.config['MAX_BATCH_SIZE'] = int(os.environ.get('SPAM_MAX_BATCH_SIZE', 1000))
 
-# Clean email function (same as training)
-def clean_email(text):
-    """Clean email text - MUST MATCH THE TRAINING PREPROCESSOR"""
-    try:
-        # Split to remove headers (after first \n\n)
-        parts = text.split('\n\n', 1)
-        if len(parts) > 1:
-            text = parts[1]
-        else:
-            text = parts[0]
-            
-        text = text.lower()
-        text = re.sub(r'http\S+', 'URL', text)
-        text = re.sub(r'\d+', 'NUMBER', text)
-        text = re.sub(r'[^\w\s]', '', text)
-        return text
-    except Exception as e:
-        print(f"Warning in clean_email: {e}")
-        return text.lower() if text else ""
+# /api/predict/stream: emails (and input bytes) scored per chunk, and the
+# longest input line accepted; together they cap the memory one stream uses
+app.config['STREAM_CHUNK_SIZE'] = int(os.environ.get('SPAM_STREAM_CHUNK_SIZE', 64))
+app.config['STREAM_CHUNK_BYTES'] = int(os.environ.get('SPAM_STREAM_CHUNK_BYTES', 8 * 2 ** 20))
+app.config['STREAM_MAX_LINE_BYTES'] = int(os.environ.get('SPAM_STREAM_MAX_LINE_BYTES', 4 * 2 ** 20))
+
+# Terms per direction returned by "explain": true, and the most a caller may ask for
+app.config['EXPLAIN_TOP_K'] = 10
+app.config['MAX_EXPLAIN_TOP_K'] = 50
+
+# Current model: an immutable ModelHandle (pipeline, version, loaded_at).
+# Reloads swap this reference atomically; requests read it once and finish
+# on whichever model they started with.
+model_handle = None
+
+# Serialises reloads and records the outcome of the most recent one
+reload_lock = threading.Lock()
+last_reload = {'status': None, 'error': None, 'at': None}
+
+# Prediction cache shared by every scoring path (configured via SPAM_CACHE_*)
+prediction_cache = cache_from_env()
+
+# Optional near-duplicate campaign index (enabled with SPAM_CAMPAIGN_INDEX=1)
+campaign_index = campaign_index_from_env()
+
+# Per-stage latency histograms and request counters, served on /metrics
+service_metrics = ServiceMetrics()
+
+# Optional coalescing of concurrent single-email requests (SPAM_MICROBATCH=1)
+micro_batcher = micro_batcher_from_env(metrics=service_metrics)
+
+# Optional shadow evaluation of a candidate model from SPAM_SHADOW_DIR:
+# sampled requests are re-scored by it on background threads
+shadow = shadow_from_env()
+
+# Admission control for the scoring endpoints: in-flight limit and queue
+# (SPAM_MAX_IN_FLIGHT, SPAM_MAX_QUEUE), per-client quotas (SPAM_QUOTA_*)
+# and X-Request-Deadline
+admission = admission_from_env()
+ADMISSION_ENDPOINTS = ('predict', 'api_predict', 'api_predict_batch', 'api_predict_stream')
+REJECTION_MESSAGES = {
+    'shed': 'Server overloaded, retry later',
+    'rate_limited': 'Client quota exceeded, retry later',
+    'expired': 'Request deadline passed before it could be scored',
+}
+
+# Request and error events as JSON lines, written off the request thread
+# (SPAM_LOG_SAMPLE_RATE samples request events; errors are always kept)
+request_log = logger_from_env()
+
+# Online learning mode (SPAM_ONLINE=1): serve the incrementally updated
+# model from SPAM_ONLINE_DIR and accept labeled feedback on /api/feedback
+online_mode = online_enabled()
+online_learner = None
 
 def load_model():
-    """Load the trained model and vectorizer"""
-    global model, vectorizer, model_loaded
+    """Load, smoke-test and swap in the model from models/
+
+    On any failure the currently served model (if any) stays in place.
+    """
+    global model_handle, online_learner
     
-    try:
-        print("🔍 Checking for model files...")
-        
-        # Check if model files exist - try different formats
-        model_files = [
-            ('spam_model.joblib', 'joblib'),
-            ('spam_model.pkl', 'pickle'),
-            ('best_spam_model.pkl', 'pickle')
-        ]
-        
-        vectorizer_files = [
-            ('tfidf_vectorizer.joblib', 'joblib'),
-            ('tfidf_vectorizer.pkl', 'pickle'),
-            ('count_vectorizer.pkl', 'pickle')
-        ]
-        
-        # Try to load vectorizer
-        vectorizer_loaded = False
-        for filename, loader_type in vectorizer_files:
-            filepath = os.path.join('models', filename)
-            if os.path.exists(filepath):
-                print(f"📦 Loading vectorizer from: {filename}")
-                try:
-                    if loader_type == 'joblib':
-                        vectorizer = joblib.load(filepath)
-                    else:  # pickle
-                        with open(filepath, 'rb') as f:
-                            vectorizer = pickle.load(f)
-                    print(f"✅ Vectorizer loaded from {filename}")
-                    vectorizer_loaded = True
-                    break
-                except Exception as e:
-                    print(f"⚠️ Failed to load {filename}: {e}")
-                    continue
-        
-        if not vectorizer_loaded:
-            print("❌ Could not load any vectorizer file!")
-            return False
-        
-        # Try to load model
-        model_loaded_flag = False
-        for filename, loader_type in model_files:
-            filepath = os.path.join('models', filename)
-            if os.path.exists(filepath):
-                print(f"🤖 Loading model from: {filename}")
-                try:
-                    if loader_type == 'joblib':
-                        model = joblib.load(filepath)
-                    else:  # pickle
-                        with open(filepath, 'rb') as f:
-                            model = pickle.load(f)
-                    print(f"✅ Model loaded from {filename}")
-                    model_loaded_flag = True
-                    break
-                except Exception as e:
-                    print(f"⚠️ Failed to load {filename}: {e}")
-                    continue
-        
-        if not model_loaded_flag:
-            print("❌ Could not load any model file!")
-            return False
-        
-        # Test the loaded model with a simple prediction
-        print("🧪 Testing loaded model...")
+    with reload_lock:
         try:
-            test_text = "This is a test email"
-            cleaned = clean_email(test_text)
-            test_vec = vectorizer.transform([cleaned])
-            prediction = model.predict(test_vec)
-            print(f"✅ Model test successful! Prediction shape: {prediction.shape}")
+            print("🔍 Checking for model files...")
+            start_time = time.perf_counter()
+            
+            if online_mode:
+                pair = load_online_pair(os.environ.get('SPAM_ONLINE_DIR', os.path.join('models', 'online')))
+            else:
+                pair = load_model_pair('models')
+            if pair is None:
+                return _record_reload('failed', 'Could not load model files')
+            vectorizer, model = pair
+            first_stage = load_cascade_first_stage('models') if not online_mode else None
+            
+            # Test the loaded model with a simple prediction
+            print("🧪 Testing loaded model...")
+            try:
+                test_pipeline = InferencePipeline(vectorizer, model, first_stage=first_stage)
+                prediction, _ = test_pipeline.classify("This is a test email")
+                print(f"✅ Model test successful! Test prediction: {prediction}")
+                print(f"⏱️ Model {test_pipeline.version} loaded in {time.perf_counter() - start_time:.2f}s")
+            except Exception as e:
+                print(f"❌ Model test failed: {e}")
+                return _record_reload('failed', f'Model test failed: {e}')
+            
+            # Results from a previous model must never be served
+            prediction_cache.flush()
+            test_pipeline.cache = prediction_cache
+            test_pipeline.metrics = service_metrics
+            if campaign_index is not None:
+                campaign_index.flush()
+                test_pipeline.campaign_index = campaign_index
+            
+            model_handle = new_model_handle(test_pipeline)
+            if shadow is not None:
+                load_shadow_candidate(model_handle)
+            
+            if online_mode:
+                if online_learner is None:
+                    online_learner = online_learner_from_env(vectorizer, model, publish_online_update)
+                    atexit.register(online_learner.stop)
+                else:
+                    online_learner.reset(vectorizer, model)
+            return _record_reload('ok')
             
-            model_loaded = True
-            return True
         except Exception as e:
-            print(f"❌ Model test failed: {e}")
-            return False
-        
+            print(f"❌ Error loading model: {e}")
+            print(f"   Error type: {type(e).__name__}")
+            return _record_reload('failed', str(e))
+
+def _record_reload(status, error=None):
+    last_reload.update({
+        'status': status,
+        'error': error,
+        'at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    })
+    return status == 'ok'
+
+def load_cascade_first_stage(models_dir):
+    """The cascade first stage from models_dir when SPAM_CASCADE=1, else None
+
+    Without a usable first stage every email goes to the full model.
+    """
+    if not cascade_enabled():
+        return None
+    try:
+        first_stage = load_first_stage(models_dir)
+    except Exception as e:
+        print(f"⚠️ Cascade first stage not loaded, scoring with the full model only: {e}")
+        return None
+    if first_stage is None:
+        print(f"⚠️ SPAM_CASCADE=1 but {models_dir} has no first stage; run create_model.py")
+    else:
+        print(f"🪜 Cascade first stage loaded (bands {first_stage.low} / {first_stage.high})")
+    return first_stage
+
+def load_shadow_candidate(handle):
+    """(Re)load the shadow candidate and compare it against handle from now on
+
+    If the candidate cannot be loaded the previous one (if any) stays.
+    """
+    print(f"🕶️ Loading shadow candidate from {shadow.candidate_dir}...")
+    try:
+        pair = load_model_pair(shadow.candidate_dir)
+        if pair is None:
+            raise RuntimeError(f'Could not load model files from {shadow.candidate_dir}')
+        candidate = InferencePipeline(*pair, first_stage=load_cascade_first_stage(shadow.candidate_dir))
     except Exception as e:
-        print(f"❌ Error loading model: {e}")
-        print(f"   Error type: {type(e).__name__}")
+        print(f"⚠️ Shadow candidate not loaded: {e}")
+        shadow.last_error = str(e)
+        shadow.reset(handle.version)
+        return False
+    shadow.reset(handle.version, candidate)
+    print(f"✅ Shadow candidate {candidate.version} loaded")
+    return True
+
+def publish_online_update(vectorizer, model):
+    """Swap in a model updated by the online learner (runs on its thread)"""
+    global model_handle
+    
+    pipeline = InferencePipeline(vectorizer, model, cache=prediction_cache,
+                                 metrics=service_metrics)
+    # Cache keys include the model version; campaign verdicts do not
+    if campaign_index is not None:
+        campaign_index.flush()
+        pipeline.campaign_index = campaign_index
+    with reload_lock:
+        model_handle = new_model_handle(pipeline)
+        if shadow is not None:
+            shadow.reset(model_handle.version)
+
+def start_background_reload():
+    """Reload the model on a background thread; False if one is already running"""
+    if reload_lock.locked():
         return False
+    threading.Thread(target=load_model, name='model-reload', daemon=True).start()
+    return True
+
+def classify_email(handle, email_text):
+    """Score one email, through the micro-batcher when it is enabled"""
+    if micro_batcher is not None:
+        return micro_batcher.classify(handle.pipeline, email_text)
+    return handle.pipeline.classify(email_text)
+
+def offer_to_shadow(handle, email_text, prediction, prediction_proba):
+    """Hand a served verdict to the shadow evaluator (sampled, never blocks)"""
+    if shadow is not None:
+        shadow.offer(email_text, handle.version, prediction, prediction_proba[1])
+
+def parse_explain(value):
+    """Top-k for an "explain" option (true, or a number of terms); None when off
+
+    Raises ValueError for anything else.
+    """
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ('', '0', 'false', 'no', 'off'):
+            return None
+        if value in ('true', 'yes', 'on'):
+            value = True
+        elif value.isdigit():
+            value = int(value)
+    if value is True:
+        return app.config['EXPLAIN_TOP_K']
+    if value is None or value is False or value == 0:
+        return None
+    if isinstance(value, int) and 0 < value <= app.config['MAX_EXPLAIN_TOP_K']:
+        return value
+    raise ValueError(f'"explain" must be true or a number of terms '
+                     f'(1-{app.config["MAX_EXPLAIN_TOP_K"]})')
+
+def model_fields(handle):
+    """Model version fields included in every prediction response"""
+    return {
+        'model_version': handle.version,
+        'model_loaded_at': handle.loaded_at
+    }
+
+def format_api_result(prediction, prediction_proba):
+    """Build the JSON payload returned by the API endpoints"""
+    return {
+        'prediction': 'spam' if prediction == 1 else 'ham',
+        'probabilities': {
+            'ham': float(prediction_proba[0]),
+            'spam': float(prediction_proba[1])
+        },
+        'is_spam': bool(prediction == 1),
+        'confidence': float(max(prediction_proba))
+    }
 
 # Load model when the app starts
 print("🚀 Initializing Flask application...")
@@ -127,13 +270,79 @@ if os.path.exists('models'):
 
 load_model()
 
+# Optional hot reload when files in models/ change (SPAM_MODEL_WATCH_INTERVAL seconds)
+model_watch_interval = float(os.environ.get('SPAM_MODEL_WATCH_INTERVAL', 0))
+model_watcher = None
+
+def start_model_watcher():
+    """Start the models/ watcher thread if enabled (threads do not survive fork,
+    so serve.py calls this again in every worker)"""
+    global model_watcher
+    if model_watch_interval > 0:
+        model_watcher = ModelWatcher('models', load_model, interval=model_watch_interval)
+        model_watcher.start()
+
+start_model_watcher()
+
+def _endpoint_label():
+    # The URL rule, not the raw path, so unknown URLs cannot grow the label set
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.endpoint_label = _endpoint_label()
+    service_metrics.request_started(g.endpoint_label)
+
+@app.before_request
+def admit_request():
+    """Shed, rate-limit or drop expired scoring requests before any work is done"""
+    if request.endpoint not in ADMISSION_ENDPOINTS:
+        return None
+    try:
+        deadline = parse_deadline(request.headers.get(DEADLINE_HEADER))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    client = request.headers.get(admission.client_header) or request.remote_addr
+    rejection = admission.admit(client, deadline)
+    if rejection is not None:
+        g.outcome = rejection.reason
+        response = jsonify({'error': REJECTION_MESSAGES[rejection.reason]})
+        response.status_code = rejection.status
+        if rejection.retry_after is not None:
+            response.headers['Retry-After'] = str(rejection.retry_after)
+        return response
+    g.admitted_at = time.perf_counter()
+    return None
+
+@app.after_request
+def record_response_status(response):
+    g.status_code = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    if 'admitted_at' in g:
+        admission.release(time.perf_counter() - g.admitted_at)
+    if 'request_start' not in g:
+        return
+    seconds = time.perf_counter() - g.request_start
+    status_code = 500 if error is not None else g.get('status_code', 500)
+    # /predict reports failures in a 200 body for the web UI
+    outcome = g.get('outcome') or outcome_for_status(status_code)
+    service_metrics.request_finished(g.endpoint_label, outcome, seconds)
+    request_log.log('request', method=request.method, endpoint=g.endpoint_label,
+                    status=status_code, outcome=outcome, duration_ms=round(seconds * 1000, 3),
+                    model_version=g.get('model_version'), prediction=g.get('prediction'))
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    if not model_loaded:
+    handle = model_handle
+    if handle is None:
         return jsonify({
             'error': 'Model not loaded. Please run create_model.py first.',
             'prediction': 'ERROR',
@@ -146,8 +355,21 @@ def predict():
     try:
         # Get email text from form
         email_text = request.form.get('email', '')
+        try:
+            top_k = parse_explain(request.form.get('explain'))
+        except ValueError as e:
+            g.outcome = 'client_error'
+            return jsonify({
+                'error': str(e),
+                'prediction': 'INVALID',
+                'confidence': 0,
+                'ham_probability': 0,
+                'spam_probability': 0,
+                'is_spam': False
+            })
         
         if not email_text.strip():
+            g.outcome = 'client_error'
             return jsonify({
                 'error': 'Please enter email text',
                 'prediction': 'INVALID',
@@ -157,36 +379,13 @@ def predict():
                 'is_spam': False
             })
         
-        # Clean the email
-        cleaned_email = clean_email(email_text)
-        
-        print(f"📧 Processing email (cleaned length: {len(cleaned_email)})")
-        print(f"📧 First 200 chars of cleaned email: {cleaned_email[:200]}")
-        
-        # Vectorize
-        email_vec = vectorizer.transform([cleaned_email])
-        print(f"📊 Vector shape: {email_vec.shape}")
-        
-        # Make prediction
-        prediction = model.predict(email_vec)[0]
-        print(f"📊 Raw prediction: {prediction}")
-        
-        # Get probabilities (check if model has predict_proba)
-        if hasattr(model, 'predict_proba'):
-            prediction_proba = model.predict_proba(email_vec)[0]
-            print(f"📊 Probabilities: {prediction_proba}")
+        # Clean, vectorize and score in a single pass
+        explanation = None
+        if top_k:
+            prediction, prediction_proba, explanation = handle.pipeline.explain([email_text], top_k)[0]
         else:
-            # For models without predict_proba, use decision function or default
-            print("⚠️ Model doesn't have predict_proba method")
-            if hasattr(model, 'decision_function'):
-                decision = model.decision_function(email_vec)[0]
-                # Convert to probability-like scores
-                ham_prob = max(0, min(100, 100 - (decision * 10)))
-                spam_prob = 100 - ham_prob
-                prediction_proba = [ham_prob/100, spam_prob/100]
-            else:
-                # Default probabilities
-                prediction_proba = [0.5, 0.5] if prediction == 1 else [0.5, 0.5]
+            prediction, prediction_proba = classify_email(handle, email_text)
+        offer_to_shadow(handle, email_text, prediction, prediction_proba)
         
         # Get probabilities
         ham_prob = prediction_proba[0] * 100
@@ -201,14 +400,18 @@ def predict():
             'is_spam': bool(prediction == 1),
             'error': None
         }
+        if top_k:
+            result['explanation'] = explanation
+        result.update(model_fields(handle))
+        g.model_version = handle.version
+        g.prediction = result['prediction']
         
-        print(f"📊 Prediction result: {result}")
         return jsonify(result)
         
     except Exception as e:
-        print(f"❌ Prediction error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        g.outcome = 'server_error'
+        request_log.log('prediction_error', level='error', endpoint='/predict',
+                        error=str(e), traceback=traceback.format_exc())
         
         return jsonify({
             'error': f'Prediction error: {str(e)}',
@@ -222,7 +425,8 @@ def predict():
 @app.route('/api/predict', methods=['POST'])
 def api_predict():
     """API endpoint for programmatic access"""
-    if not model_loaded:
+    handle = model_handle
+    if handle is None:
         return jsonify({'error': 'Model not loaded'}), 503
     
     try:
@@ -235,53 +439,252 @@ def api_predict():
         if not email_text.strip():
             return jsonify({'error': 'Email text is required'}), 400
         
-        # Clean and predict
-        cleaned_email = clean_email(email_text)
-        email_vec = vectorizer.transform([cleaned_email])
-        prediction = model.predict(email_vec)[0]
+        try:
+            top_k = parse_explain(data.get('explain'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Get probabilities
-        if hasattr(model, 'predict_proba'):
-            prediction_proba = model.predict_proba(email_vec)[0]
+        # Clean and predict (explanations come from the same feature vector)
+        if top_k:
+            prediction, prediction_proba, explanation = handle.pipeline.explain([email_text], top_k)[0]
         else:
-            prediction_proba = [0.5, 0.5] if prediction == 1 else [0.5, 0.5]
+            prediction, prediction_proba = classify_email(handle, email_text)
+        offer_to_shadow(handle, email_text, prediction, prediction_proba)
         
+        result = format_api_result(prediction, prediction_proba)
+        if top_k:
+            result['explanation'] = explanation
+        result.update(model_fields(handle))
+        g.model_version = handle.version
+        g.prediction = result['prediction']
+        return jsonify(result)
+        
+    except Exception as e:
+        request_log.log('prediction_error', level='error', endpoint='/api/predict',
+                        error=str(e), traceback=traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/predict/batch', methods=['POST'])
+def api_predict_batch():
+    """Batch API endpoint: score many emails with one vectorizer/model call
+
+    Expects JSON like {"emails": [{"id": "msg-1", "email": "..."}, ...]}.
+    Results come back in request order, each tagged with its id. Invalid
+    items get a per-item error instead of failing the whole batch. With
+    "explain": true (or a number of terms) every result also carries the
+    n-grams that pushed it toward spam and toward ham.
+    """
+    handle = model_handle
+    if handle is None:
+        return jsonify({'error': 'Model not loaded'}), 503
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('emails'), list):
+        return jsonify({'error': 'JSON with "emails" list is required'}), 400
+    
+    items = data['emails']
+    max_batch_size = app.config['MAX_BATCH_SIZE']
+    if len(items) > max_batch_size:
         return jsonify({
-            'prediction': 'spam' if prediction == 1 else 'ham',
-            'probabilities': {
-                'ham': float(prediction_proba[0]),
-                'spam': float(prediction_proba[1])
-            },
-            'is_spam': bool(prediction == 1),
-            'confidence': float(max(prediction_proba))
-        })
+            'error': f'Batch too large: {len(items)} emails (max {max_batch_size})'
+        }), 413
+    
+    try:
+        top_k = parse_explain(data.get('explain'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Validate each item, keeping per-item errors
+    results = []
+    valid_indices = []
+    valid_texts = []
+    for index, item in enumerate(items):
+        item_id = item.get('id', index) if isinstance(item, dict) else index
+        email_text = item.get('email') if isinstance(item, dict) else None
         
+        if not isinstance(email_text, str):
+            results.append({'id': item_id, 'error': 'Item must be an object with an "email" string'})
+        elif not email_text.strip():
+            results.append({'id': item_id, 'error': 'Email text is required'})
+        else:
+            results.append({'id': item_id})
+            valid_indices.append(index)
+            valid_texts.append(email_text)
+    
+    try:
+        if valid_texts and top_k:
+            scores = handle.pipeline.explain(valid_texts, top_k)
+            for index, (prediction, prediction_proba, explanation) in zip(valid_indices, scores):
+                results[index].update(format_api_result(prediction, prediction_proba))
+                results[index]['explanation'] = explanation
+        elif valid_texts:
+            scores = handle.pipeline.score(valid_texts)
+            for index, (prediction, prediction_proba) in zip(valid_indices, scores):
+                results[index].update(format_api_result(prediction, prediction_proba))
+        if shadow is not None and valid_texts:
+            for email_text, (prediction, prediction_proba, *_) in zip(valid_texts, scores):
+                offer_to_shadow(handle, email_text, prediction, prediction_proba)
     except Exception as e:
+        request_log.log('prediction_error', level='error', endpoint='/api/predict/batch',
+                        error=str(e), traceback=traceback.format_exc())
         return jsonify({'error': str(e)}), 500
+    g.model_version = handle.version
+    
+    return jsonify({
+        'results': results,
+        'count': len(results),
+        'errors': len(results) - len(valid_texts),
+        **model_fields(handle)
+    })
+
+@app.route('/api/predict/stream', methods=['POST'])
+def api_predict_stream():
+    """Streaming API endpoint: NDJSON in, NDJSON out
+
+    Each request line is an object like {"id": "msg-1", "email": "..."}.
+    The body is read and scored in bounded chunks and results are streamed
+    back as they are produced, one line per input line, followed by a
+    {"done": true, ...} summary. ?explain=true (or a number of terms) adds
+    explanations. The whole stream is scored by the model it started with.
+    """
+    handle = model_handle
+    if handle is None:
+        return jsonify({'error': 'Model not loaded'}), 503
+    
+    try:
+        top_k = parse_explain(request.args.get('explain'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def log_error(error):
+        request_log.log('prediction_error', level='error', endpoint='/api/predict/stream',
+                        error=str(error), traceback=traceback.format_exc())
+    
+    scorer = StreamScorer(
+        handle.pipeline, format_api_result,
+        chunk_size=app.config['STREAM_CHUNK_SIZE'],
+        chunk_bytes=app.config['STREAM_CHUNK_BYTES'],
+        max_line_bytes=app.config['STREAM_MAX_LINE_BYTES'],
+        top_k=top_k, on_error=log_error,
+    )
+    lines = iter_lines(request.stream, app.config['STREAM_MAX_LINE_BYTES'])
+    
+    def generate():
+        try:
+            yield from scorer.iter_results(lines, summary=model_fields(handle))
+        except ClientDisconnected:
+            # The body ended before its declared length; no summary line is sent
+            g.outcome = 'client_error'
+            request_log.log('stream_aborted', level='warning', count=scorer.count)
+    
+    g.model_version = handle.version
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Model-Version': str(handle.version)})
+
+@app.route('/api/feedback', methods=['POST'])
+def api_feedback():
+    """Queue labeled emails for the online model (needs SPAM_ONLINE=1)
+
+    Accepts {"email": "...", "label": "spam"|"ham"} or
+    {"items": [{"email": "...", "label": "spam"}, ...]}. Updates are applied
+    in the background; the response only confirms they were queued.
+    """
+    if not online_mode:
+        return jsonify({'error': 'Online learning disabled (set SPAM_ONLINE=1)'}), 404
+    if online_learner is None:
+        return jsonify({'error': 'Online model not loaded'}), 503
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'JSON with "email" and "label" fields is required'}), 400
+    items = data['items'] if isinstance(data.get('items'), list) else [data]
+    
+    feedback = []
+    for index, item in enumerate(items):
+        email_text = item.get('email') if isinstance(item, dict) else None
+        label = item.get('label') if isinstance(item, dict) else None
+        if not isinstance(email_text, str) or not email_text.strip():
+            return jsonify({'error': f'Item {index}: email text is required'}), 400
+        if label not in ('spam', 'ham'):
+            return jsonify({'error': f'Item {index}: label must be "spam" or "ham"'}), 400
+        feedback.append((email_text, 1 if label == 'spam' else 0))
+    
+    accepted = 0
+    for email_text, label in feedback:
+        try:
+            online_learner.submit(email_text, label)
+        except queue.Full:
+            return jsonify({'error': 'Feedback queue is full, retry later', 'accepted': accepted}), 429
+        accepted += 1
+    
+    return jsonify({'status': 'queued', 'accepted': accepted,
+                    'queued': online_learner.stats()['queued']}), 202
 
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
+    handle = model_handle
+    model_loaded = handle is not None
     return jsonify({
         'status': 'ok' if model_loaded else 'error',
         'model_loaded': model_loaded,
-        'vectorizer_type': type(vectorizer).__name__ if model_loaded else None,
-        'model_type': type(model).__name__ if model_loaded else None,
+        'vectorizer_type': type(handle.pipeline.vectorizer).__name__ if model_loaded else None,
+        'model_type': type(handle.pipeline.model).__name__ if model_loaded else None,
+        'model_version': handle.version if model_loaded else None,
+        'model_loaded_at': handle.loaded_at if model_loaded else None,
+        'cache': prediction_cache.stats(),
+        'campaign_index': campaign_index.stats() if campaign_index is not None else None,
+        'micro_batching': micro_batcher.stats() if micro_batcher is not None else None,
+        'online_learning': online_learner.stats() if online_learner is not None else None,
+        'shadow': shadow.stats() if shadow is not None else None,
+        'cascade': handle.pipeline.first_stage.stats() if model_loaded and handle.pipeline.first_stage is not None else None,
+        'admission': admission.stats(),
+        'logging': request_log.stats(),
+        'body_extraction': extraction_stats(),
         'service': 'spam-detector',
         'message': 'Model loaded and ready' if model_loaded else 'Model not loaded. Run create_model.py first.'
     })
 
+@app.route('/ready')
+def readiness_check():
+    """Readiness probe: 200 once a model is loaded and requests can be served"""
+    handle = model_handle
+    if handle is None:
+        return jsonify({'ready': False}), 503
+    return jsonify({'ready': True, 'model_version': handle.version})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this process"""
+    return Response(service_metrics.render(model_handle, body_extraction=extraction_stats()),
+                    mimetype=METRICS_CONTENT_TYPE)
+
+@app.route('/shadow')
+def shadow_stats():
+    """How the shadow candidate compares with the served model on live traffic"""
+    if shadow is None:
+        return jsonify({'error': 'Shadow evaluation disabled (set SPAM_SHADOW_DIR)'}), 404
+    return jsonify(shadow.stats())
+
 @app.route('/test')
 def test_endpoint():
     """Test endpoint to verify the app is running"""
     return jsonify({
         'message': 'Flask app is running!',
-        'model_loaded': model_loaded,
+        'model_loaded': model_handle is not None,
         'endpoints': {
             'home': '/',
             'predict': '/predict (POST)',
             'api_predict': '/api/predict (POST)',
+            'api_predict_batch': '/api/predict/batch (POST)',
+            'api_predict_stream': '/api/predict/stream (POST, NDJSON)',
+            'api_feedback': '/api/feedback (POST, online mode)',
             'health': '/health',
+            'ready': '/ready',
+            'metrics': '/metrics',
+            'shadow': '/shadow (shadow mode)',
+            'model_info': '/model_info',
+            'admin_reload': '/admin/reload (POST, token)',
             'test': '/test'
         }
     })
@@ -289,10 +692,17 @@ def test_endpoint():
 @app.route('/model_info')
 def model_info():
     """Get model information"""
-    if not model_loaded:
-        return jsonify({'error': 'Model not loaded'}), 503
+    handle = model_handle
+    if handle is None:
+        return jsonify({'error': 'Model not loaded', 'last_reload': last_reload}), 503
     
+    vectorizer = handle.pipeline.vectorizer
+    model = handle.pipeline.model
     info = {
+        'version': handle.version,
+        'loaded_at': handle.loaded_at,
+        'last_reload': last_reload,
+        'watching_models_dir': model_watcher is not None,
         'vectorizer': {
             'type': type(vectorizer).__name__,
             'features': vectorizer.get_feature_names_out().shape[0] if hasattr(vectorizer, 'get_feature_names_out') else 'Unknown',
@@ -307,20 +717,42 @@ def model_info():
     
     return jsonify(info)
 
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Reload the model from models/ in the background (needs SPAM_ADMIN_TOKEN)"""
+    admin_token = os.environ.get('SPAM_ADMIN_TOKEN')
+    if not admin_token:
+        return jsonify({'error': 'Admin endpoint disabled (set SPAM_ADMIN_TOKEN)'}), 404
+    
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {admin_token}'.encode('utf-8')):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not start_background_reload():
+        return jsonify({'error': 'A reload is already in progress'}), 409
+    
+    handle = model_handle
+    return jsonify({
+        'status': 'reloading',
+        'current_version': handle.version if handle is not None else None
+    }), 202
+
 if __name__ == '__main__':
     print("\n" + "="*50)
     print("🌐 Spam Email Detector Web Application")
     print("="*50)
     
-    if model_loaded:
+    if model_handle is not None:
+        pipeline = model_handle.pipeline
         print("✅ Model is loaded and ready!")
-        print(f"   - Vectorizer type: {type(vectorizer).__name__}")
-        print(f"   - Model type: {type(model).__name__}")
+        print(f"   - Vectorizer type: {type(pipeline.vectorizer).__name__}")
+        print(f"   - Model type: {type(pipeline.model).__name__}")
+        print(f"   - Model version: {model_handle.version}")
         
         # Try to get feature count
         try:
-            if hasattr(vectorizer, 'get_feature_names_out'):
-                features = vectorizer.get_feature_names_out()
+            if hasattr(pipeline.vectorizer, 'get_feature_names_out'):
+                features = pipeline.vectorizer.get_feature_names_out()
                 print(f"   - Features: {len(features)}")
         except:
             pass
@@ -335,9 +767,17 @@ if __name__ == '__main__':
     print("   - Web interface: http://localhost:5000")
     print("   - Health check: http://localhost:5000/health")
     print("   - Model info: http://localhost:5000/model_info")
+    print("   - Metrics: http://localhost:5000/metrics")
     print("   - Test endpoint: http://localhost:5000/test")
     print("   - API: POST http://localhost:5000/api/predict")
-    print("\n🔧 Starting Flask server...")
+    print("   - Batch API: POST http://localhost:5000/api/predict/batch")
+    print("   - Streaming API: POST http://localhost:5000/api/predict/stream (NDJSON)")
+    if online_mode:
+        print("   - Feedback: POST http://localhost:5000/api/feedback")
+    if shadow is not None:
+        print("   - Shadow evaluation: http://localhost:5000/shadow")
+    print("   - Reload model: POST http://localhost:5000/admin/reload (Authorization: Bearer $SPAM_ADMIN_TOKEN)")
+    print("\n🔧 Starting Flask development server (use 'python serve.py' in production)...")
     print("="*50)
     
     app.run(
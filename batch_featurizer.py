@@ -0,0 +1,472 @@
+# batch_featurizer.py - array-based n-gram counting with sklearn-identical output
+"""Build CountVectorizer / TfidfVectorizer matrices a whole batch at a time.
+
+sklearn's word analyzer runs Python code for every n-gram of every
+document: a " ".join, a vocabulary lookup and a per-document counter.
+BatchFeaturizer does the same work on arrays:
+
+1. Documents go through the vectorizer's own decoder, preprocessor and
+   tokenizer on a process pool, a chunk of documents per task. A chunk's
+   tokens come back as integer ids (dict lookups in C, no per-token code).
+2. Stop words are dropped by id and every n-gram becomes one int64: its
+   token ids as the digits of a mixed-radix number. Unlike a hash these
+   keys never collide, which is what makes the output exact. N-grams
+   spanning two documents are never formed.
+3. Counting, vocabulary building and vocabulary lookup are np.unique and
+   np.searchsorted over the keys; the CSR arrays are written directly.
+
+The result equals the vectorizer's own fit_transform / transform output
+bit for bit - vocabulary_, column order, element order inside rows,
+dtypes and tf-idf values - because fit replays sklearn's sequence on the
+same intermediate matrix: features numbered by first occurrence, renumbered
+by name, pruned with CountVectorizer's min_df / max_df / max_features rule,
+then the vectorizer's own TfidfTransformer. Token ids are handed out in
+alphabetical order and shorter n-grams are zero-padded, so key order is
+the order of the space-joined names. Names are only built for the kept
+features, so unlike sklearn this fit sets no stop_words_ (introspection
+only; the training scripts drop it before saving anyway).
+
+Vectorizers this cannot reproduce (char or callable analyzers, custom
+tokenizers, a fixed vocabulary at fit time, tokens that contain spaces or
+control characters, or more distinct tokens than int64 keys can hold)
+simply go through sklearn. The training scripts use it via
+corpus.fit_on_cleaned / transform_cleaned and bulk_classify.py scores
+sparse-path models with it; the request path (InferencePipeline) stays
+on sklearn. SPAM_FEATURIZER=sklearn turns it off and
+SPAM_FEATURIZER_WORKERS sets the training pool size.
+
+    python batch_featurizer.py              # parity check on data/ and throughput vs sklearn
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from numbers import Integral
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+
+# Documents tokenized per pool task
+CHUNK_SIZE = 500
+
+_MAX_KEY = np.iinfo(np.int64).max
+
+def featurizer_enabled():
+    return os.environ.get('SPAM_FEATURIZER', 'batch').lower() != 'sklearn'
+
+def use_for(vectorizer):
+    """True if the training and bulk scoring paths should use BatchFeaturizer for this vectorizer
+
+    Only for n-gram vectorizers: counting single words is as fast in
+    sklearn's own loop on one core.
+    """
+    return featurizer_enabled() and supports(vectorizer) and vectorizer.ngram_range[1] > 1
+
+def supports(vectorizer):
+    """True if BatchFeaturizer can stand in for this vectorizer's fit_transform / transform"""
+    return (isinstance(vectorizer, CountVectorizer)
+            and vectorizer.analyzer == 'word'
+            and vectorizer.tokenizer is None
+            and vectorizer.input == 'content')
+
+def _tokenizer(vectorizer):
+    """The vectorizer's (decode, preprocess, tokenize) callables"""
+    return vectorizer.decode, vectorizer.build_preprocessor(), vectorizer.build_tokenizer()
+
+# Pool worker state: the tokenizer callables, set once by the initializer
+_worker_tokenizer = None
+
+def _init_worker(params):
+    global _worker_tokenizer
+    _worker_tokenizer = _tokenizer(CountVectorizer(**params))
+
+def _tokenize_in_worker(documents):
+    """Pool task: _tokenize_chunk with this worker's tokenizer"""
+    return _tokenize_chunk(documents, _worker_tokenizer)
+
+def _tokenize_chunk(documents, tokenizer):
+    """(distinct tokens, id into them per token, tokens per document) for a chunk"""
+    decode, preprocess, tokenize = tokenizer
+    token_lists = [tokenize(preprocess(decode(document))) for document in documents]
+    occurrences = list(itertools.chain.from_iterable(token_lists))
+    distinct = list(dict.fromkeys(occurrences))
+    index = dict(zip(distinct, range(len(distinct))))
+    ids = np.fromiter(map(index.__getitem__, occurrences), dtype=np.int64, count=len(occurrences))
+    lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=len(token_lists))
+    return distinct, ids, lengths
+
+def _safe_tokens(tokens):
+    """Joined with spaces, these tokens sort like their id sequences (nothing <= ' ' inside)"""
+    return all(token and ord(min(token)) > 32 for token in tokens)
+
+def _document_of(lengths):
+    """Document number of each token, for documents of the given token counts"""
+    ends = np.cumsum(lengths)
+    if not len(ends) or not ends[-1]:
+        return np.zeros(0, dtype=np.int64)
+    return np.cumsum(np.bincount(ends[:-1], minlength=ends[-1])[:ends[-1]])
+
+def _drop_stop_words(tokens, ids, lengths, stop_words):
+    """ids and per-document lengths without the stop word occurrences"""
+    stopped = np.fromiter(map(stop_words.__contains__, tokens), dtype=bool, count=len(tokens))
+    kept = ~stopped[ids]
+    return ids[kept], np.bincount(_document_of(lengths)[kept], minlength=len(lengths))
+
+# vectorizer -> (vocabulary_ it was built from, ngram_range, _term_table result)
+_term_tables = weakref.WeakKeyDictionary()
+
+def _term_table(vectorizer):
+    """(token digits, radix, sorted feature keys, their columns) for vocabulary_
+
+    Only feature names of min_n..max_n words can ever match. None if the
+    vocabulary has too many distinct words for int64 keys. Cached per
+    vectorizer until vocabulary_ is replaced by a new fit.
+    """
+    cached = _term_tables.get(vectorizer)
+    if cached is not None and cached[0] is vectorizer.vocabulary_ and cached[1] == vectorizer.ngram_range:
+        return cached[2]
+    min_n, max_n = vectorizer.ngram_range
+    terms = [(term.split(' '), column) for term, column in vectorizer.vocabulary_.items()]
+    terms = [(words, column) for words, column in terms if min_n <= len(words) <= max_n]
+    words = sorted(set(itertools.chain.from_iterable(words for words, _ in terms)))
+    radix = len(words) + 1
+    table = None
+    if radix ** max_n <= _MAX_KEY:
+        digit_of = dict(zip(words, range(1, radix)))
+        # Digit matrix, one row per feature, zero-padded on the right
+        sizes = np.fromiter((len(words) for words, _ in terms), dtype=np.int64, count=len(terms))
+        flat = itertools.chain.from_iterable(words for words, _ in terms)
+        digits = np.zeros((len(terms), max_n), dtype=np.int64)
+        digits[_document_of(sizes), np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)] = \
+            np.fromiter(map(digit_of.__getitem__, flat), dtype=np.int64, count=int(sizes.sum()))
+        term_keys = np.zeros(len(terms), dtype=np.int64)
+        for k in range(max_n):
+            term_keys = term_keys * radix + digits[:, k]
+        order = np.argsort(term_keys)
+        columns = np.fromiter((column for _, column in terms), dtype=np.int64, count=len(terms))
+        table = digit_of, radix, term_keys[order], columns[order]
+    _term_tables[vectorizer] = (vectorizer.vocabulary_, vectorizer.ngram_range, table)
+    return table
+
+class BatchFeaturizer:
+    """fit_transform / transform of a (Count|Tfidf)Vectorizer over whole batches"""
+
+    def __init__(self, vectorizer, workers=None, chunk_size=CHUNK_SIZE):
+        if not supports(vectorizer):
+            raise ValueError(f"BatchFeaturizer cannot reproduce this {type(vectorizer).__name__}")
+        self.vectorizer = vectorizer
+        if workers is None:
+            workers = int(os.environ.get('SPAM_FEATURIZER_WORKERS', os.cpu_count() or 1))
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def _tokenize(self, documents):
+        """(sorted distinct tokens, token id per occurrence, tokens per document)"""
+        chunks = [documents[i:i + self.chunk_size] for i in range(0, len(documents), self.chunk_size)]
+        if self.workers <= 1 or len(chunks) <= 1:
+            tokenizer = _tokenizer(self.vectorizer)
+            results = [_tokenize_chunk(chunk, tokenizer) for chunk in chunks]
+        else:
+            # Workers rebuild the tokenizer from the parameters, not the fitted vocabulary
+            params = {name: getattr(self.vectorizer, name) for name in CountVectorizer().get_params()}
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(params,)) as pool:
+                results = list(pool.map(_tokenize_in_worker, chunks))
+
+        # Renumber every chunk's ids into one alphabetical table
+        tokens = sorted(set(itertools.chain.from_iterable(distinct for distinct, _, _ in results)))
+        rank = dict(zip(tokens, range(len(tokens))))
+        ids = [np.fromiter(map(rank.__getitem__, distinct), dtype=np.int64, count=len(distinct))[chunk_ids]
+               for distinct, chunk_ids, _ in results]
+        ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        lengths = (np.concatenate([lengths for _, _, lengths in results]) if results
+                   else np.zeros(0, dtype=np.int64))
+        return tokens, ids, lengths
+
+    def _ngrams(self, codes, lengths, radix, ordered=True):
+        """(key, document) of every n-gram, in the order sklearn's analyzer yields them
+
+        codes are the documents' token digits back to back (stop words
+        already removed), 0 for a token that can be in no feature: n-grams
+        containing one are dropped. Per document the analyzer yields all
+        min_n-grams, then all (min_n + 1)-grams and so on, so with several
+        orders each is scattered into its slot of the document's run;
+        transform does not need the order and skips that.
+        """
+        min_n, max_n = self.vectorizer.ngram_range
+        doc_of = _document_of(lengths)
+        # Tokens from this one to the end of its document
+        remaining = np.cumsum(lengths)[doc_of] - np.arange(len(codes))
+        per_order = [np.maximum(lengths - n + 1, 0) for n in range(min_n, max_n + 1)]
+        scatter = ordered and len(per_order) > 1
+        if scatter:
+            run_lengths = np.sum(per_order, axis=0)
+            total = int(run_lengths.sum())
+            keys = np.empty(total, dtype=np.int64)
+            docs = np.empty(total, dtype=np.int64)
+            valid = np.zeros(total, dtype=bool)
+            # Stream position of order n's n-gram at token i: shift[doc] + i
+            shift = np.cumsum(run_lengths) - run_lengths - (np.cumsum(lengths) - lengths)
+
+        blocks = []
+        for n, counts in zip(range(min_n, max_n + 1), per_order):
+            size = max(len(codes) - n + 1, 0)
+            key = np.zeros(size, dtype=np.int64)
+            ok = remaining[:size] >= n
+            for k in range(max_n):
+                key *= radix
+                if k < n:
+                    digits = codes[k:k + size]
+                    key += digits
+                    ok &= digits > 0
+            starts = np.flatnonzero(ok)
+            doc = doc_of[starts]
+            if scatter:
+                position = shift[doc] + starts
+                keys[position] = key[starts]
+                docs[position] = doc
+                valid[position] = True
+                shift += counts
+            else:
+                blocks.append((key[starts], doc))
+        if scatter:
+            return keys[valid], docs[valid]
+        if len(blocks) == 1:
+            return blocks[0]
+        return np.concatenate([key for key, _ in blocks]), np.concatenate([doc for _, doc in blocks])
+
+    def _matrix(self, values, indices, indptr, n_features):
+        """csr_matrix built exactly like CountVectorizer._count_vocab builds it"""
+        index_dtype = np.int64 if indptr[-1] > np.iinfo(np.int32).max else np.int32
+        X = sp.csr_matrix(
+            (values.astype(np.intc), indices.astype(index_dtype), indptr.astype(index_dtype)),
+            shape=(len(indptr) - 1, n_features), dtype=self.vectorizer.dtype)
+        X.sort_indices()
+        return X
+
+    def _count(self, docs, features, n_docs, n_features):
+        """Count matrix of (document, feature) occurrences, rows sorted by feature"""
+        pairs, counts = np.unique(docs * n_features + features, return_counts=True)
+        indptr = np.zeros(n_docs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pairs // n_features, minlength=n_docs), out=indptr[1:])
+        return self._matrix(counts, pairs % n_features, indptr, n_features)
+
+    def fit_transform(self, raw_documents):
+        """vectorizer.fit_transform(raw_documents), computed on arrays"""
+        vectorizer = self.vectorizer
+        if isinstance(raw_documents, str):
+            raise ValueError("Iterable over raw text documents expected, string object received.")
+        documents = list(raw_documents)
+        if vectorizer.vocabulary is not None:
+            return vectorizer.fit_transform(documents)
+        vectorizer._validate_params()
+        vectorizer._validate_ngram_range()
+        vectorizer._warn_for_unused_params()
+        min_n, max_n = vectorizer.ngram_range
+
+        tokens, ids, lengths = self._tokenize(documents)
+        radix = len(tokens) + 1
+        if not _safe_tokens(tokens) or radix ** max_n > _MAX_KEY:
+            return vectorizer.fit_transform(documents)
+
+        stop_words = vectorizer.get_stop_words()
+        if stop_words:
+            ids, lengths = _drop_stop_words(tokens, ids, lengths, stop_words)
+        keys, docs = self._ngrams(ids + 1, lengths, radix)
+        if not len(keys):
+            raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+
+        # sklearn numbers features by first occurrence ("insertion" ids);
+        # np.unique numbers them by name
+        names, first_seen, by_name = np.unique(keys, return_index=True, return_inverse=True)
+        name_of = np.argsort(first_seen)
+        insertion_of = np.empty_like(name_of)
+        insertion_of[name_of] = np.arange(len(names))
+        X = self._count(docs, insertion_of[by_name], len(lengths), len(names))
+        if vectorizer.binary:
+            X.data.fill(1)
+
+        n_doc = X.shape[0]
+        max_df, min_df, max_features = vectorizer.max_df, vectorizer.min_df, vectorizer.max_features
+        max_doc_count = max_df if isinstance(max_df, Integral) else max_df * n_doc
+        min_doc_count = min_df if isinstance(min_df, Integral) else min_df * n_doc
+        if max_doc_count < min_doc_count:
+            raise ValueError("max_df corresponds to < documents than min_df")
+
+        # The vocabulary as (feature name id, column), in insertion order
+        if max_features is not None:
+            # CountVectorizer._sort_features, then _limit_features
+            X.indices = name_of.astype(X.indices.dtype).take(X.indices, mode='clip')
+            X, mask = self._limit(X, max_doc_count, min_doc_count, max_features)
+            columns = np.cumsum(mask) - 1
+            vocabulary = [(feature, columns[feature]) for feature in name_of.tolist() if mask[feature]]
+            kept_features = np.flatnonzero(mask)
+        else:
+            # ... or the other way round
+            X, mask = self._limit(X, max_doc_count, min_doc_count, None)
+            kept_names = name_of[mask]
+            order = np.argsort(kept_names)
+            map_index = np.empty(len(kept_names), dtype=X.indices.dtype)
+            map_index[order] = np.arange(len(kept_names))
+            X.indices = map_index.take(X.indices, mode='clip')
+            vocabulary = list(zip(kept_names.tolist(), map_index.tolist()))
+            kept_features = kept_names[order]
+
+        terms = self._names(names[[feature for feature, _ in vocabulary]], tokens, radix)
+        vectorizer.fixed_vocabulary_ = False
+        vectorizer.vocabulary_ = {term: column for term, (_, column) in zip(terms, vocabulary)}
+        # transform's lookup table comes for free: columns are in name order
+        table = (dict(zip(tokens, range(1, radix))), radix, names[kept_features],
+                 np.arange(len(kept_features), dtype=np.int64))
+        _term_tables[vectorizer] = (vectorizer.vocabulary_, vectorizer.ngram_range, table)
+
+        if not isinstance(vectorizer, TfidfVectorizer):
+            return X
+        vectorizer._tfidf = TfidfTransformer(norm=vectorizer.norm, use_idf=vectorizer.use_idf,
+                                             smooth_idf=vectorizer.smooth_idf,
+                                             sublinear_tf=vectorizer.sublinear_tf)
+        vectorizer._tfidf.fit(X)
+        return vectorizer._tfidf.transform(X, copy=False)
+
+    def _limit(self, X, high, low, limit):
+        """CountVectorizer._limit_features on the matrix: (pruned X, kept column mask)"""
+        dfs = np.bincount(X.indices, minlength=X.shape[1])
+        mask = np.ones(len(dfs), dtype=bool)
+        mask &= dfs <= high
+        mask &= dfs >= low
+        if limit is not None and mask.sum() > limit:
+            tfs = np.asarray(X.sum(axis=0)).ravel()
+            mask_inds = (-tfs[mask]).argsort()[:limit]
+            new_mask = np.zeros(len(dfs), dtype=bool)
+            new_mask[np.where(mask)[0][mask_inds]] = True
+            mask = new_mask
+        kept_indices = np.where(mask)[0]
+        if len(kept_indices) == 0:
+            raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+        return X[:, kept_indices], mask
+
+    def _names(self, keys, tokens, radix):
+        """Space-joined feature names of n-gram keys"""
+        max_n = self.vectorizer.ngram_range[1]
+        digits = np.empty((len(keys), max_n), dtype=np.int64)
+        for k in range(max_n - 1, -1, -1):
+            keys, digits[:, k] = np.divmod(keys, radix)
+        table = [None] + tokens
+        return [' '.join([table[digit] for digit in row if digit]) for row in digits.tolist()]
+
+    def transform(self, raw_documents):
+        """vectorizer.transform(raw_documents) against the fitted vocabulary_, computed on arrays"""
+        vectorizer = self.vectorizer
+        if isinstance(raw_documents, str):
+            raise ValueError("Iterable over raw text documents expected, string object received.")
+        documents = list(raw_documents)
+        vectorizer._check_vocabulary()
+        min_n, max_n = vectorizer.ngram_range
+
+        tokens, ids, lengths = self._tokenize(documents)
+        if not _safe_tokens(tokens):
+            return vectorizer.transform(documents)
+        stop_words = vectorizer.get_stop_words()
+        if stop_words:
+            ids, lengths = _drop_stop_words(tokens, ids, lengths, stop_words)
+
+        table = _term_table(vectorizer)
+        if table is None:
+            return vectorizer.transform(documents)
+        digit_of, radix, term_keys, term_columns = table
+        token_digits = np.fromiter(map(digit_of.get, tokens, itertools.repeat(0)), dtype=np.int64,
+                                   count=len(tokens))
+        keys, docs = self._ngrams(token_digits[ids], lengths, radix, ordered=False)
+        found = np.minimum(np.searchsorted(term_keys, keys), max(len(term_keys) - 1, 0))
+        if len(term_keys):
+            hit = term_keys[found] == keys
+        else:
+            hit = np.zeros(len(keys), dtype=bool)
+        X = self._count(docs[hit], term_columns[found[hit]], len(lengths), len(vectorizer.vocabulary_))
+        if vectorizer.binary:
+            X.data.fill(1)
+        if isinstance(vectorizer, TfidfVectorizer):
+            return vectorizer._tfidf.transform(X, copy=False)
+        return X
+
+def _same_matrix(ours, theirs):
+    return (ours.shape == theirs.shape and ours.dtype == theirs.dtype
+            and ours.indices.dtype == theirs.indices.dtype and ours.indptr.dtype == theirs.indptr.dtype
+            and np.array_equal(ours.indptr, theirs.indptr) and np.array_equal(ours.indices, theirs.indices)
+            and np.array_equal(ours.data, theirs.data))
+
+def _same_fit(ours, theirs):
+    """vocabulary_ (order and value types included) and idf_ are identical"""
+    if list(ours.vocabulary_.items()) != list(theirs.vocabulary_.items()):
+        return False
+    if [type(value) for value in ours.vocabulary_.values()] != [type(value) for value in theirs.vocabulary_.values()]:
+        return False
+    if isinstance(ours, TfidfVectorizer) and ours.use_idf:
+        return np.array_equal(ours.idf_, theirs.idf_)
+    return True
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    from sklearn.base import clone
+
+    from corpus import HAM_FOLDERS, SPAM_FOLDERS, load_corpus
+    from corpus_dedup import split_corpus
+    from inference import _identity
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    x, y = load_corpus(HAM_FOLDERS, SPAM_FOLDERS)
+    x_train, x_test, _, _, _ = split_corpus(x, y)
+    print(f"🧮 Featurizing {len(x_train)} training / {len(x_test)} test emails, "
+          f"{args.workers} tokenizer worker(s)")
+
+    # create_model.py's and train_model.py's vectorizers, plus the settings the other paths cover
+    vectorizers = {
+        'create_model tfidf': TfidfVectorizer(preprocessor=_identity, lowercase=True, stop_words='english',
+                                              max_features=8000, ngram_range=(1, 3),
+                                              token_pattern=r'\b[a-zA-Z]{2,}\b'),
+        'train_model count': CountVectorizer(preprocessor=_identity, stop_words='english', max_features=5000),
+        '1-2 grams, df limits': CountVectorizer(preprocessor=_identity, ngram_range=(1, 2), min_df=2, max_df=0.5),
+        'binary sublinear tfidf': TfidfVectorizer(preprocessor=_identity, ngram_range=(2, 3), binary=True,
+                                                  sublinear_tf=True, stop_words='english', max_features=20000),
+    }
+
+    print(f"{'vectorizer':>24} {'parity':>7} {'fit sklearn':>12} {'fit batch':>10} "
+          f"{'transform sklearn':>18} {'transform batch':>16} {'speedup':>8}")
+    failed = 0
+    for name, vectorizer in vectorizers.items():
+        reference = clone(vectorizer)
+        ours = clone(vectorizer)
+        featurizer = BatchFeaturizer(ours, workers=args.workers)
+        expected_fit, sklearn_fit = _timed(reference.fit_transform, x_train)
+        actual_fit, batch_fit = _timed(featurizer.fit_transform, x_train)
+        expected, sklearn_transform = _timed(reference.transform, x_test)
+        actual, batch_transform = _timed(featurizer.transform, x_test)
+
+        # A vectorizer fitted by sklearn (e.g. a saved model) transforms identically too
+        from_sklearn = BatchFeaturizer(reference, workers=args.workers).transform(x_test)
+        same = (_same_matrix(actual_fit, expected_fit) and _same_fit(ours, reference)
+                and _same_matrix(actual, expected) and _same_matrix(from_sklearn, expected))
+        failed += not same
+        speedup = (sklearn_fit + sklearn_transform) / (batch_fit + batch_transform)
+        print(f"{name:>24} {'✅' if same else '❌':>6} {sklearn_fit:>11.2f}s {batch_fit:>9.2f}s "
+              f"{sklearn_transform:>17.2f}s {batch_transform:>15.2f}s {speedup:>7.1f}x")
+
+    if failed:
+        print(f"❌ {failed} vectorizer(s) differ from sklearn")
+        return 1
+    print("✅ Every matrix, vocabulary_ and idf_ is identical to sklearn's")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
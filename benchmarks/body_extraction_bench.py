@@ -0,0 +1,108 @@
+# benchmarks/body_extraction_bench.py - cost of MIME-aware body extraction
+"""Compare the old header split with body_extractor on the largest files in
+data/ and on a synthetic oversized message.
+
+For each file it reports the raw size, the text handed to the regex passes
+(old split vs extractor), n-grams the TF-IDF analyzer would see, and the
+full clean_email time. The synthetic message holds a 15 MB base64
+attachment and a 5 MB HTML part, the case that used to tie up a worker;
+the unterminated ones repeat a `<!--`, `<script>` or `<` opener that never
+closes, which used to cost time quadratic in the HTML size.
+
+    python benchmarks/body_extraction_bench.py
+    python benchmarks/body_extraction_bench.py --largest 20 --repeat 5
+"""
+import argparse
+import base64
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from body_extractor import extract_body
+from corpus import HAM_FOLDERS, SPAM_FOLDERS
+from inference import NUMBER_PATTERN, PUNCTUATION_PATTERN, URL_PATTERN, clean_email
+
+TOKEN_PATTERN = re.compile(r'\b[a-zA-Z]{2,}\b')
+
+def old_clean_email(text):
+    """clean_email as it was before body extraction"""
+    text = text.split('\n\n', 1)[-1].lower()
+    text = URL_PATTERN.sub('URL', text)
+    text = NUMBER_PATTERN.sub('NUMBER', text)
+    return PUNCTUATION_PATTERN.sub('', text)
+
+def ngram_count(cleaned_text, max_n=3):
+    tokens = len(TOKEN_PATTERN.findall(cleaned_text))
+    return sum(max(0, tokens - n + 1) for n in range(1, max_n + 1))
+
+def best_time(function, text, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def synthetic_message(attachment_mb=15, html_mb=5):
+    attachment = base64.encodebytes(os.urandom(attachment_mb * 3 * 2 ** 20 // 4)).decode('ascii')
+    html = '<html><body>' + '<p><font color="red">Buy cheap meds now!</font></p>\n' * (html_mb * 2 ** 20 // 52)
+    return (
+        'From: promo@example.com\nSubject: huge\nMIME-Version: 1.0\n'
+        'Content-Type: multipart/mixed; boundary="XYZ"\n\n'
+        '--XYZ\nContent-Type: text/html; charset="us-ascii"\n\n' + html + '\n'
+        '--XYZ\nContent-Type: application/octet-stream\nContent-Transfer-Encoding: base64\n\n'
+        + attachment + '--XYZ--\n'
+    )
+
+def unterminated_message(opener, html_kb=200):
+    html = opener * (html_kb * 1024 // len(opener))
+    return ('From: promo@example.com\nSubject: unterminated\nMIME-Version: 1.0\n'
+            'Content-Type: text/html; charset="us-ascii"\n\n' + html + '\n')
+
+def report(name, raw, repeat):
+    old_body = raw.split('\n\n', 1)[-1]
+    extracted = extract_body(raw)
+    old_cleaned = old_clean_email(raw)
+    new_cleaned = clean_email(raw)
+    old_seconds = best_time(old_clean_email, raw, repeat)
+    new_seconds = best_time(clean_email, raw, repeat)
+    print(f"{name[:44]:<44} {len(raw) / 1024:>8.0f} {len(old_body) / 1024:>8.0f} "
+          f"{len(extracted.text) / 1024:>8.0f} {ngram_count(old_cleaned):>9} {ngram_count(new_cleaned):>9} "
+          f"{old_seconds * 1000:>8.2f} {new_seconds * 1000:>8.2f} "
+          f"{'yes' if extracted.truncated else '':>5} {extracted.skipped_parts:>5}")
+    return old_seconds, new_seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--largest', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    paths = []
+    for folder in HAM_FOLDERS + SPAM_FOLDERS:
+        if os.path.isdir(folder):
+            paths.extend(os.path.join(folder, name) for name in os.listdir(folder))
+    paths = sorted((p for p in paths if os.path.isfile(p)), key=os.path.getsize, reverse=True)
+
+    print(f"{'message':<44} {'raw KB':>8} {'old KB':>8} {'new KB':>8} {'old ngr':>9} {'new ngr':>9} "
+          f"{'old ms':>8} {'new ms':>8} {'trunc':>5} {'skip':>5}")
+    totals = [0.0, 0.0]
+    for path in paths[:args.largest]:
+        with open(path, 'r', encoding='latin-1') as f:
+            raw = f.read()
+        for index, seconds in enumerate(report(path, raw, args.repeat)):
+            totals[index] += seconds
+    print(f"⏱️ clean_email on the {args.largest} largest files: old {totals[0] * 1000:.1f} ms, "
+          f"new {totals[1] * 1000:.1f} ms")
+
+    print()
+    report('synthetic 15 MB attachment + 5 MB HTML', synthetic_message(), 1)
+    for opener in ('<!--', '<script>', '<'):
+        report(f'200 KB HTML of unterminated {opener}', unterminated_message(opener), 1)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+# benchmarks/campaign_index_bench.py - hit rate and latency of the campaign index
+"""Replay the data/ corpus through the near-duplicate campaign index.
+
+Emails are streamed folder by folder (spam_* by default) as if they were
+arriving live. Every email is scored by the full model for reference; the
+index path does a lookup first and only scores (and remembers) on a miss.
+
+    python benchmarks/campaign_index_bench.py
+    python benchmarks/campaign_index_bench.py --folders spam_1 spam_2 easy_ham_1
+    python benchmarks/campaign_index_bench.py --sklearn
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from campaign_index import CampaignIndex
+from inference import InferencePipeline, clean_email
+from model_loader import load_model_pair
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--folders', nargs='+',
+                        default=['spam_1', 'spam_2', 'spam_3', 'spam_4'])
+    parser.add_argument('--threshold', type=float, default=0.8)
+    parser.add_argument('--min-confidence', type=float, default=0.95)
+    parser.add_argument('--sklearn', action='store_true',
+                        help='score with sklearn transform/predict_proba instead of the fused scorer')
+    args = parser.parse_args()
+
+    pair = load_model_pair(args.models_dir)
+    if pair is None:
+        print("❌ Could not load a model; run create_model.py first")
+        return 1
+    pipeline = InferencePipeline(*pair)
+    if args.sklearn:
+        pipeline.scorer = None
+    index = CampaignIndex(threshold=args.threshold, min_confidence=args.min_confidence)
+
+    emails = []
+    for folder in args.folders:
+        folder_path = os.path.join(args.data_dir, folder)
+        for filename in sorted(os.listdir(folder_path)):
+            with open(os.path.join(folder_path, filename), 'r', encoding='latin-1') as f:
+                emails.append(clean_email(f.read()))
+    print(f"📧 Replaying {len(emails)} emails from {', '.join(args.folders)}")
+
+    full_time = 0.0
+    index_time = 0.0
+    hit_time = 0.0
+    hits = 0
+    disagreements = 0
+    for text in emails:
+        start = time.perf_counter()
+        reference = pipeline.score_cleaned([text])[0]
+        full_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        signature = index.signature(text)
+        verdict = index.lookup(text, signature)
+        if verdict is None:
+            verdict = pipeline.score_cleaned([text])[0]
+            index.add(text, verdict, signature)
+        else:
+            hits += 1
+            hit_time += time.perf_counter() - start
+            if verdict[0] != reference[0]:
+                disagreements += 1
+        index_time += time.perf_counter() - start
+
+    count = len(emails)
+    print(f"🎯 Hit rate: {hits / count:.1%} ({hits} of {count})")
+    print(f"⚖️ Reused verdicts that disagree with the model: {disagreements}")
+    print(f"⏱️ Full model:  {full_time * 1000 / count:.3f} ms/email, {full_time:.2f}s total")
+    print(f"⏱️ With index:  {index_time * 1000 / count:.3f} ms/email, {index_time:.2f}s total")
+    if hits:
+        print(f"⏱️ Index hit:   {hit_time * 1000 / hits:.3f} ms/email")
+    print(f"💾 Time saved:  {(full_time - index_time) / full_time:.1%}")
+    print(f"📦 Index entries: {index.stats()['entries']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+# benchmarks/load_test.py - throughput and latency of serve.py by worker count
+"""Start serve.py with 1, 2, 4 and 8 workers and hammer /api/predict.
+
+For each worker count the server is started from the current directory
+(so it loads ./models), the script waits for /ready and then runs a fixed
+duration closed-loop load from several client processes. The prediction
+cache is disabled in the server so every request is scored.
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --workers 1 4 --concurrency 64 --duration 20
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import Pool
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_sample_emails(data_dir, count=200, seed=0):
+    """A fixed random sample of corpus emails plus sample_mail.txt"""
+    paths = []
+    for folder in sorted(os.listdir(data_dir)):
+        folder_path = os.path.join(data_dir, folder)
+        if os.path.isdir(folder_path):
+            paths.extend(os.path.join(folder_path, name) for name in sorted(os.listdir(folder_path)))
+    random.Random(seed).shuffle(paths)
+
+    emails = []
+    for path in paths[:count] + [os.path.join(REPO_DIR, 'sample_mail.txt')]:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='latin-1') as f:
+                emails.append(f.read())
+    return emails
+
+def post_predict(host, port, body):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        connection.request('POST', '/api/predict', body=body,
+                           headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+def client_process(args):
+    """Run `threads` closed-loop clients for `duration` seconds; return latencies"""
+    host, port, threads, duration, emails = args
+    bodies = [json.dumps({'email': email}).encode('utf-8') for email in emails]
+    deadline = time.monotonic() + duration
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def run(seed):
+        rng = random.Random(seed)
+        local = []
+        local_errors = 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status = post_predict(host, port, rng.choice(bodies))
+            except OSError:
+                status = None
+            if status == 200:
+                local.append(time.perf_counter() - start)
+            else:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    workers = [threading.Thread(target=run, args=(os.getpid() * 1000 + i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, errors[0]
+
+def wait_until_ready(host, port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=2)
+            connection.request('GET', '/ready')
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_level(workers, args, emails):
+    env = dict(os.environ, SPAM_CACHE_MAX_ENTRIES='0')
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, 'serve.py'),
+         '--host', args.host, '--port', str(args.port),
+         '--workers', str(workers), '--threads', str(args.threads)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_until_ready(args.host, args.port):
+            raise RuntimeError("server did not become ready")
+        # Warm up every worker before measuring
+        client_process((args.host, args.port, args.concurrency, 1.0, emails))
+
+        threads_per_client = max(1, args.concurrency // args.clients)
+        jobs = [(args.host, args.port, threads_per_client, args.duration, emails)] * args.clients
+        with Pool(args.clients) as pool:
+            results = pool.map(client_process, jobs)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    errors = sum(error for _, error in results)
+    return {
+        'workers': workers,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / args.duration,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=4, help='threads per server worker')
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrent client connections')
+    parser.add_argument('--clients', type=int, default=4, help='client processes generating load')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per worker count')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--data-dir', default=os.path.join(REPO_DIR, 'data'))
+    parser.add_argument('--output', help='also write the results as JSON')
+    args = parser.parse_args()
+
+    emails = load_sample_emails(args.data_dir)
+    print(f"🖥️ {os.cpu_count()} CPUs, {args.concurrency} concurrent clients, "
+          f"{args.duration:.0f}s per run")
+    print(f"{'workers':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+
+    results = []
+    for workers in args.workers:
+        result = run_level(workers, args, emails)
+        results.append(result)
+        print(f"{result['workers']:>8} {result['rps']:>10.1f} {result['p50_ms']:>10.2f} "
+              f"{result['p99_ms']:>10.2f} {result['errors']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# benchmarks/mail_listener_bench.py - SMTP listener throughput vs /api/predict
+"""Replay the data/ corpus through mail_listener.py and through serve.py.
+
+For each concurrency level, that many client sessions share the corpus
+messages. SMTP sessions stay open and pipeline MAIL / RCPT / DATA for
+every message; HTTP clients POST each message as JSON to /api/predict,
+one connection per request as serve.py answers HTTP/1.0. Both servers run
+one worker process with the prediction cache off, so every message is
+scored. The listener runs without --next-hop (messages are scored and
+discarded), so only the classification hop is measured.
+
+    python benchmarks/mail_listener_bench.py
+    python benchmarks/mail_listener_bench.py --concurrency 1 16 64 --limit 2000 --skip-http
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from load_test import REPO_DIR, percentile, wait_until_ready
+
+def load_corpus_messages(data_dir, limit=None):
+    """Every corpus file as raw bytes, in folder / file name order"""
+    messages = []
+    for folder in sorted(os.listdir(data_dir)):
+        folder_path = os.path.join(data_dir, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for name in sorted(os.listdir(folder_path)):
+            with open(os.path.join(folder_path, name), 'rb') as f:
+                messages.append(f.read())
+            if limit and len(messages) >= limit:
+                return messages
+    return messages
+
+def smtp_payload(message):
+    """DATA content on the wire: CRLF line endings, dot-stuffed, terminated"""
+    lines = message.replace(b'\r\n', b'\n').split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    stuffed = [b'.' + line if line.startswith(b'.') else line for line in lines]
+    return b'\r\n'.join(stuffed) + b'\r\n.\r\n'
+
+def http_request(message):
+    body = json.dumps({'email': message.decode('latin-1')}).encode('utf-8')
+    return (b'POST /api/predict HTTP/1.0\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+            b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\n\r\n' + body)
+
+async def read_reply(reader):
+    """Status code of one (possibly multi-line) SMTP reply"""
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('connection closed')
+        if line[3:4] != b'-':
+            return int(line[:3])
+
+async def smtp_client(host, port, queue, latencies, failures):
+    reader, writer = await asyncio.open_connection(host, port)
+    await read_reply(reader)
+    writer.write(b'EHLO bench.localhost\r\n')
+    await read_reply(reader)
+    while queue:
+        payload = queue.pop()
+        start = time.perf_counter()
+        # PIPELINING: the envelope and DATA go out in one write
+        writer.write(b'MAIL FROM:<bench@localhost>\r\nRCPT TO:<user@localhost>\r\nDATA\r\n')
+        codes = [await read_reply(reader) for _ in range(3)]
+        if codes[2] != 354:
+            failures.append(codes)
+            continue
+        writer.write(payload)
+        code = await read_reply(reader)
+        if code == 250:
+            latencies.append(time.perf_counter() - start)
+        else:
+            failures.append(code)
+    writer.write(b'QUIT\r\n')
+    await read_reply(reader)
+    writer.close()
+
+async def http_client(host, port, queue, latencies, failures):
+    while queue:
+        request = queue.pop()
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(request)
+        response = await reader.read()
+        writer.close()
+        if response[9:12] == b'200':
+            latencies.append(time.perf_counter() - start)
+        else:
+            failures.append(response[9:12])
+
+async def drive(client, host, port, payloads, concurrency):
+    queue = list(reversed(payloads))
+    latencies = []
+    failures = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, queue, latencies, failures) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'messages_per_s': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'failures': len(failures),
+    }
+
+def wait_for_port(host, port, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=2).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def run_server(command, ready):
+    env = dict(os.environ, SPAM_CACHE_MAX_ENTRIES='0', SPAM_LOG_FILE=os.devnull)
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not ready():
+        server.kill()
+        raise RuntimeError(f"{os.path.basename(command[1])} did not become ready")
+    return server
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    server.wait(timeout=60)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--smtp-port', type=int, default=10035)
+    parser.add_argument('--http-port', type=int, default=8768)
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--limit', type=int, default=3000, help='corpus messages replayed (0 = all)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--threads', type=int, default=2, help='listener scoring threads')
+    parser.add_argument('--skip-http', action='store_true')
+    args = parser.parse_args()
+
+    messages = load_corpus_messages(args.data_dir, args.limit or None)
+    smtp_payloads = [smtp_payload(message) for message in messages]
+    http_payloads = [http_request(message) for message in messages]
+    print(f"📧 Replaying {len(messages)} corpus messages "
+          f"({sum(map(len, messages)) / 2 ** 20:.1f} MB) per run")
+    print(f"{'protocol':>9} {'sessions':>9} {'msgs/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'failures':>9}")
+
+    for concurrency in args.concurrency:
+        server = run_server(
+            [sys.executable, os.path.join(REPO_DIR, 'mail_listener.py'), '--host', args.host,
+             '--port', str(args.smtp_port), '--threads', str(args.threads),
+             '--max-sessions', str(concurrency + 8)],
+            lambda: wait_for_port(args.host, args.smtp_port))
+        try:
+            result = asyncio.run(drive(smtp_client, args.host, args.smtp_port, smtp_payloads, concurrency))
+        finally:
+            stop_server(server)
+        print(f"{'smtp':>9} {concurrency:>9} {result['messages_per_s']:>8.1f} {result['p50_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f} {result['failures']:>9}")
+
+        if args.skip_http:
+            continue
+        server = run_server(
+            [sys.executable, os.path.join(REPO_DIR, 'serve.py'), '--host', args.host,
+             '--port', str(args.http_port), '--workers', '1', '--threads', str(concurrency + 8)],
+            lambda: wait_until_ready(args.host, args.http_port))
+        try:
+            result = asyncio.run(drive(http_client, args.host, args.http_port, http_payloads, concurrency))
+        finally:
+            stop_server(server)
+        print(f"{'http':>9} {concurrency:>9} {result['messages_per_s']:>8.1f} {result['p50_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f} {result['failures']:>9}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
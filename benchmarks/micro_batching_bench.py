@@ -0,0 +1,105 @@
+# benchmarks/micro_batching_bench.py - direct vs micro-batched single-email scoring
+"""Compare per-request scoring with the MicroBatcher under concurrent callers.
+
+Each of --threads caller threads scores one random corpus email at a time
+for --duration seconds, first calling the pipeline directly and then through
+the batcher. The cache and campaign index are off, so every email is scored.
+
+    python benchmarks/micro_batching_bench.py
+    python benchmarks/micro_batching_bench.py --threads 1 4 16 --sklearn
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference import InferencePipeline
+from micro_batcher import MicroBatcher
+from model_loader import load_model_pair
+
+def load_emails(data_dir, count, seed=0):
+    paths = []
+    for folder in sorted(os.listdir(data_dir)):
+        folder_path = os.path.join(data_dir, folder)
+        if os.path.isdir(folder_path):
+            paths.extend(os.path.join(folder_path, name) for name in sorted(os.listdir(folder_path)))
+    random.Random(seed).shuffle(paths)
+    emails = []
+    for path in paths[:count]:
+        with open(path, 'r', encoding='latin-1') as f:
+            emails.append(f.read())
+    return emails
+
+def run_load(classify, emails, threads, duration):
+    """Closed-loop load; returns (requests/s, sorted latencies)"""
+    deadline = time.monotonic() + duration
+    latencies = []
+    lock = threading.Lock()
+
+    def caller(seed):
+        rng = random.Random(seed)
+        local = []
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            classify(rng.choice(emails))
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=caller, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    latencies.sort()
+    return len(latencies) / duration, latencies
+
+def percentile_ms(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--emails', type=int, default=500)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=0.0)
+    parser.add_argument('--sklearn', action='store_true',
+                        help='score with sklearn transform/predict_proba instead of the fused scorer')
+    args = parser.parse_args()
+
+    pair = load_model_pair(args.models_dir)
+    if pair is None:
+        print("❌ Could not load a model; run create_model.py first")
+        return 1
+    pipeline = InferencePipeline(*pair)
+    if args.sklearn:
+        pipeline.scorer = None
+    emails = load_emails(args.data_dir, args.emails)
+    print(f"📧 {len(emails)} emails, {'sklearn' if args.sklearn else 'fused'} scorer, "
+          f"{args.duration:.0f}s per run")
+    print(f"{'threads':>8} {'mode':>8} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'batch':>7} {'queue ms':>9}")
+
+    for threads in args.threads:
+        rps, latencies = run_load(pipeline.classify, emails, threads, args.duration)
+        print(f"{threads:>8} {'direct':>8} {rps:>10.1f} {percentile_ms(latencies, 0.5):>9.2f} "
+              f"{percentile_ms(latencies, 0.99):>9.2f} {'-':>7} {'-':>9}")
+
+        batcher = MicroBatcher(max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1000)
+        rps, latencies = run_load(lambda text: batcher.classify(pipeline, text),
+                                  emails, threads, args.duration)
+        stats = batcher.stats()
+        print(f"{threads:>8} {'batched':>8} {rps:>10.1f} {percentile_ms(latencies, 0.5):>9.2f} "
+              f"{percentile_ms(latencies, 0.99):>9.2f} {stats['mean_batch_size']:>7.2f} "
+              f"{stats['mean_queue_delay_ms']:>9.3f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# benchmarks/online_update_bench.py - online mini-batch updates vs full retraining
+"""Compare the cost of applying feedback online with a full batch retrain.
+
+Uses the same 80/20 stratified split as create_model.py. Reports the time
+and held-out accuracy of a full TF-IDF + LogisticRegression retrain, of
+bootstrapping the online model, and the per-mini-batch cost of
+OnlineLearner.apply() including building the pipeline that gets swapped in.
+
+    python benchmarks/online_update_bench.py
+    python benchmarks/online_update_bench.py --batch-size 64 --updates 100
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from corpus import HAM_FOLDERS, SPAM_FOLDERS, fit_on_cleaned, load_corpus, transform_cleaned
+from inference import InferencePipeline, _identity, clean_email
+from online_model import (OnlineLearner, build_online_classifier, build_online_vectorizer,
+                          partial_fit_cleaned)
+
+def online_accuracy(vectorizer, model, texts, labels):
+    fit_vectorizer = build_online_vectorizer(vectorizer.n_features)
+    fit_vectorizer.preprocessor = _identity
+    return accuracy_score(labels, model.predict(fit_vectorizer.transform(texts)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--updates', type=int, default=50)
+    parser.add_argument('--epochs', type=int, default=3)
+    args = parser.parse_args()
+
+    texts, labels = load_corpus(HAM_FOLDERS, SPAM_FOLDERS)
+    x_train, x_test, y_train, y_test = train_test_split(
+        texts, labels, random_state=42, test_size=0.2, stratify=labels
+    )
+
+    # Full batch retrain, as create_model.py does it
+    start = time.perf_counter()
+    tfidf = TfidfVectorizer(preprocessor=clean_email, stop_words='english', max_features=8000,
+                            ngram_range=(1, 3), token_pattern=r'\b[a-zA-Z]{2,}\b')
+    lr_model = LogisticRegression(max_iter=1000, random_state=42)
+    lr_model.fit(fit_on_cleaned(tfidf, x_train), y_train)
+    full_seconds = time.perf_counter() - start
+    full_accuracy = accuracy_score(y_test, lr_model.predict(transform_cleaned(tfidf, x_test)))
+
+    # Online model bootstrapped on the same training split
+    start = time.perf_counter()
+    vectorizer = build_online_vectorizer()
+    model = build_online_classifier()
+    order = list(range(len(x_train)))
+    rng = random.Random(42)
+    for _ in range(args.epochs):
+        rng.shuffle(order)
+        for offset in range(0, len(order), 1000):
+            indices = order[offset:offset + 1000]
+            partial_fit_cleaned(vectorizer, model, [x_train[i] for i in indices],
+                                [y_train[i] for i in indices])
+    bootstrap_seconds = time.perf_counter() - start
+    bootstrap_accuracy = online_accuracy(vectorizer, model, x_test, y_test)
+
+    # Mini-batch feedback updates, published the way app.py publishes them
+    published = []
+    learner = OnlineLearner(vectorizer, model,
+                            lambda v, m: published.append(InferencePipeline(v, m).version))
+    feedback = list(zip(x_test, y_test))
+    rng.shuffle(feedback)
+    update_seconds = []
+    for update in range(args.updates):
+        offset = (update * args.batch_size) % max(1, len(feedback) - args.batch_size)
+        batch = feedback[offset:offset + args.batch_size]
+        start = time.perf_counter()
+        learner.apply(batch)
+        update_seconds.append(time.perf_counter() - start)
+    update_seconds.sort()
+    mean_update = sum(update_seconds) / len(update_seconds)
+
+    print(f"📧 {len(x_train)} training / {len(x_test)} test emails")
+    print(f"🏋️ Full TF-IDF + LR retrain:    {full_seconds:8.2f}s   accuracy {full_accuracy:.4f}")
+    print(f"🔁 Online bootstrap ({args.epochs} epochs): {bootstrap_seconds:8.2f}s   accuracy {bootstrap_accuracy:.4f}")
+    print(f"⚡ Online update ({args.batch_size} emails):  {mean_update * 1000:8.1f} ms mean, "
+          f"{update_seconds[len(update_seconds) // 2] * 1000:.1f} ms p50, "
+          f"{update_seconds[-1] * 1000:.1f} ms max over {len(update_seconds)} updates")
+    print(f"📉 One update costs {mean_update / full_seconds:.2%} of a full retrain")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# benchmarks/overload_test.py - latency under overload with and without admission control
+"""Overload serve.py and compare tail latency with admission control off and on.
+
+For each concurrency level the server (one worker, many threads, cache
+off) is driven by closed-loop clients well past what it can score. Every
+request carries X-Request-Deadline = now + --deadline. Without admission
+control all requests are accepted and latency grows with the number of
+clients; with SPAM_MAX_IN_FLIGHT / SPAM_MAX_QUEUE the excess is shed
+with 503 + Retry-After and the p99 of the requests that are served stays
+bounded.
+
+    python benchmarks/overload_test.py
+    python benchmarks/overload_test.py --concurrency 16 64 --max-in-flight 2 --max-queue 4
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+from load_test import REPO_DIR, load_sample_emails, percentile, wait_until_ready
+
+def client_process(args):
+    """Closed-loop clients; returns ([latency of 200s], Counter of statuses)"""
+    host, port, threads, duration, deadline_seconds, emails = args
+    bodies = [json.dumps({'email': email}).encode('utf-8') for email in emails]
+    stop_at = time.monotonic() + duration
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def run(seed):
+        rng = random.Random(seed)
+        local_latencies = []
+        local_statuses = Counter()
+        while time.monotonic() < stop_at:
+            headers = {'Content-Type': 'application/json',
+                       'X-Request-Deadline': f'{time.time() + deadline_seconds:.3f}'}
+            start = time.perf_counter()
+            try:
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+                connection.request('POST', '/api/predict', body=rng.choice(bodies), headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                retry_after = response.getheader('Retry-After')
+                connection.close()
+            except OSError:
+                status, retry_after = 'error', None
+            local_statuses[status] += 1
+            if status == 200:
+                local_latencies.append(time.perf_counter() - start)
+            elif retry_after is not None:
+                # A well-behaved client waits as long as it is told to
+                time.sleep(max(0.0, min(float(retry_after), stop_at - time.monotonic())))
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+
+    workers = [threading.Thread(target=run, args=(os.getpid() * 1000 + i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, statuses
+
+def run_level(concurrency, admission, args, emails):
+    env = dict(os.environ, SPAM_CACHE_MAX_ENTRIES='0', SPAM_LOG_FILE=os.devnull)
+    if admission:
+        env.update(SPAM_MAX_IN_FLIGHT=str(args.max_in_flight), SPAM_MAX_QUEUE=str(args.max_queue),
+                   SPAM_QUEUE_TIMEOUT_MS=str(args.queue_timeout_ms))
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, 'serve.py'),
+         '--host', args.host, '--port', str(args.port),
+         '--workers', '1', '--threads', str(concurrency + 8)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_until_ready(args.host, args.port):
+            raise RuntimeError("server did not become ready")
+        threads_per_client = max(1, concurrency // args.clients)
+        jobs = [(args.host, args.port, threads_per_client, args.duration, args.deadline, emails)] * args.clients
+        with Pool(args.clients) as pool:
+            results = pool.map(client_process, jobs)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    statuses = Counter()
+    for _, result_statuses in results:
+        statuses.update(result_statuses)
+    return {
+        'concurrency': threads_per_client * args.clients,
+        'admission': admission,
+        'served_rps': len(latencies) / args.duration,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else float('nan'),
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else float('nan'),
+        'statuses': dict(statuses),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8767)
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 96])
+    parser.add_argument('--clients', type=int, default=2, help='client processes')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--deadline', type=float, default=2.0, help='seconds added to X-Request-Deadline')
+    parser.add_argument('--max-in-flight', type=int, default=2)
+    parser.add_argument('--max-queue', type=int, default=4)
+    parser.add_argument('--queue-timeout-ms', type=float, default=250)
+    args = parser.parse_args()
+
+    emails = load_sample_emails(args.data_dir)
+    print(f"📧 {len(emails)} sample emails; admission: SPAM_MAX_IN_FLIGHT={args.max_in_flight} "
+          f"SPAM_MAX_QUEUE={args.max_queue} SPAM_QUEUE_TIMEOUT_MS={args.queue_timeout_ms:g}")
+    print(f"{'clients':>8} {'admission':>10} {'served/s':>9} {'p50 ms':>8} {'p99 ms':>8}  statuses")
+    for concurrency in args.concurrency:
+        for admission in (False, True):
+            result = run_level(concurrency, admission, args, emails)
+            print(f"{result['concurrency']:>8} {'on' if admission else 'off':>10} "
+                  f"{result['served_rps']:>9.1f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}  "
+                  f"{result['statuses']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+# benchmarks/stream_bench.py - throughput and memory of /api/predict/stream
+"""Push growing NDJSON payloads through one /api/predict/stream connection.
+
+serve.py is started with a single worker (from the current directory, so
+it loads ./models). For each payload size the body is sent with chunked
+transfer encoding from a sender thread while the response is read, and
+the script reports throughput and the worker's peak RSS. Peak RSS should
+stay flat as the payload grows.
+
+--slow-reader adds a run where the client reads results slowly; it
+reports how far the sender got ahead of the results, which stays bounded
+by one chunk plus the socket buffers instead of growing with the payload.
+
+    python benchmarks/stream_bench.py
+    python benchmarks/stream_bench.py --sizes 1000 10000 50000 --slow-reader
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from load_test import REPO_DIR, load_sample_emails, wait_until_ready
+
+def worker_pid(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+        return int(f.read().split()[0])
+
+def peak_rss_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+def ndjson_lines(emails, count):
+    for index in range(count):
+        yield (json.dumps({'id': index, 'email': emails[index % len(emails)]}) + '\n').encode('utf-8')
+
+def stream_once(host, port, emails, count, read_delay=0.0):
+    """Send count emails on one connection; return (seconds, most lines sent ahead of results)"""
+    connection = http.client.HTTPConnection(host, port, timeout=300)
+    connection.putrequest('POST', '/api/predict/stream')
+    connection.putheader('Content-Type', 'application/x-ndjson')
+    connection.putheader('Transfer-Encoding', 'chunked')
+    connection.endheaders()
+    # getresponse() detaches the socket from the connection once an HTTP/1.0
+    # response starts, so the sender keeps its own reference
+    sock = connection.sock
+    sent = [0]
+
+    def send():
+        for line in ndjson_lines(emails, count):
+            sock.sendall(b'%x\r\n%s\r\n' % (len(line), line))
+            sent[0] += 1
+        sock.sendall(b'0\r\n\r\n')
+
+    start = time.perf_counter()
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    response = connection.getresponse()
+    results = 0
+    ahead = 0
+    summary = None
+    for line in response:
+        record = json.loads(line)
+        if record.get('done'):
+            summary = record
+            break
+        results += 1
+        ahead = max(ahead, sent[0] - results)
+        if read_delay:
+            time.sleep(read_delay)
+    elapsed = time.perf_counter() - start
+    sender.join(timeout=5)
+    connection.close()
+    if summary is None or summary['count'] != count:
+        raise RuntimeError(f"stream ended early after {results} results")
+    return elapsed, ahead
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--slow-reader', action='store_true',
+                        help='also stream the largest size to a client reading 1 result / ms')
+    args = parser.parse_args()
+
+    emails = load_sample_emails(args.data_dir)
+    env = dict(os.environ, SPAM_CACHE_MAX_ENTRIES='0', SPAM_LOG_FILE=os.devnull)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, 'serve.py'),
+         '--host', args.host, '--port', str(args.port), '--workers', '1', '--threads', '2'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_until_ready(args.host, args.port):
+            raise RuntimeError("server did not become ready")
+        worker = worker_pid(server.pid)
+        stream_once(args.host, args.port, emails, 200)
+        print(f"📧 {len(emails)} distinct emails, worker RSS after warm-up {peak_rss_mb(worker):.1f} MB")
+
+        print(f"{'emails':>8} {'seconds':>8} {'emails/s':>9} {'peak RSS MB':>12}")
+        for count in sorted(args.sizes):
+            elapsed, _ = stream_once(args.host, args.port, emails, count)
+            print(f"{count:>8} {elapsed:>8.2f} {count / elapsed:>9.0f} {peak_rss_mb(worker):>12.1f}")
+
+        if args.slow_reader:
+            count = max(args.sizes)
+            elapsed, ahead = stream_once(args.host, args.port, emails, count, read_delay=0.001)
+            print(f"🐢 slow reader: {count} emails in {elapsed:.1f}s, sender at most {ahead} lines "
+                  f"ahead of the results, peak RSS {peak_rss_mb(worker):.1f} MB")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+# benchmarks/suite.py - inference and training benchmark suite with regression gates
+"""Benchmark the hot paths of the spam detector and gate on regressions.
+
+Run from the repository root (it loads ./models and reads ./data):
+
+    python benchmarks/suite.py run --output bench.json
+    python benchmarks/suite.py run --quick --skip-training --compare baseline.json
+    python benchmarks/suite.py compare baseline.json bench.json --threshold 0.15
+
+Metrics (each with a unit and whether lower or higher is better):
+clean_email throughput, vectorizer transform time, predict_proba and fused
+scorer latency, end-to-end /api/predict latency through the Flask test
+client (p50/p95/p99, prediction cache off), /api/predict/batch throughput
+at several batch sizes, artifact and pickle load time and RSS, peak RSS and
+create_model.py wall time.
+
+compare exits with status 1 when any metric present in both files is worse
+than the baseline by more than --threshold (relative).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+SUITE_VERSION = 1
+
+def load_emails(data_dir, count, seed=0):
+    """A fixed random sample of corpus emails plus sample_mail.txt"""
+    paths = []
+    for folder in sorted(os.listdir(data_dir)):
+        folder_path = os.path.join(data_dir, folder)
+        if os.path.isdir(folder_path):
+            paths.extend(os.path.join(folder_path, name) for name in sorted(os.listdir(folder_path)))
+    random.Random(seed).shuffle(paths)
+    paths = paths[:count] + [os.path.join(REPO_DIR, 'sample_mail.txt')]
+
+    emails = []
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='latin-1') as f:
+                emails.append(f.read())
+    return emails
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def timed_latencies(function, inputs):
+    """Call function on every input; return sorted per-call seconds"""
+    latencies = []
+    for value in inputs:
+        start = time.perf_counter()
+        function(value)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+class Results:
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, name, value, unit, better):
+        self.metrics[name] = {'value': round(float(value), 6), 'unit': unit, 'better': better}
+        print(f"   {name:<36} {value:>12.4f} {unit}")
+
+def bench_inference(results, emails, models_dir):
+    from inference import InferencePipeline, cleaned_text_vectorizer
+    from model_loader import load_model_pair
+
+    pair = load_model_pair(models_dir)
+    if pair is None:
+        raise SystemExit(f"❌ Could not load a model from {models_dir}; run create_model.py first")
+    pipeline = InferencePipeline(*pair)
+    total_mb = sum(len(email) for email in emails) / 1e6
+
+    print("🧹 clean_email")
+    start = time.perf_counter()
+    cleaned = [pipeline.clean(email) for email in emails]
+    elapsed = time.perf_counter() - start
+    results.add('clean_email.emails_per_s', len(emails) / elapsed, 'emails/s', 'higher')
+    results.add('clean_email.mb_per_s', total_mb / elapsed, 'MB/s', 'higher')
+
+    # sklearn's own transform, so the metric keeps its meaning across changes to the pipeline
+    print("🔤 vectorizer transform")
+    vectorizer = cleaned_text_vectorizer(pipeline.vectorizer)
+    start = time.perf_counter()
+    features = vectorizer.transform(cleaned)
+    elapsed = time.perf_counter() - start
+    results.add('transform.batch_ms_per_email', elapsed * 1000 / len(cleaned), 'ms', 'lower')
+    latencies = timed_latencies(lambda text: vectorizer.transform([text]), cleaned)
+    results.add('transform.single_p50_ms', percentile(latencies, 0.5) * 1000, 'ms', 'lower')
+
+    print("🤖 predict")
+    rows = [features[i] for i in range(features.shape[0])]
+    latencies = timed_latencies(pipeline.model.predict, rows)
+    results.add('predict.single_p50_ms', percentile(latencies, 0.5) * 1000, 'ms', 'lower')
+    latencies = timed_latencies(pipeline.predict_proba, rows)
+    results.add('predict_proba.single_p50_ms', percentile(latencies, 0.5) * 1000, 'ms', 'lower')
+    start = time.perf_counter()
+    pipeline.predict_proba(features)
+    results.add('predict_proba.batch_ms_per_email',
+                (time.perf_counter() - start) * 1000 / len(rows), 'ms', 'lower')
+
+    if pipeline.scorer is not None:
+        latencies = timed_latencies(pipeline.scorer.score, cleaned)
+        results.add('fused_scorer.single_p50_ms', percentile(latencies, 0.5) * 1000, 'ms', 'lower')
+
+def bench_api(results, emails, batch_sizes, repeats):
+    # Every request must be scored, not served from the prediction cache;
+    # request logs still cost what they cost in production, but go nowhere
+    os.environ['SPAM_CACHE_MAX_ENTRIES'] = '0'
+    os.environ.setdefault('SPAM_LOG_FILE', os.devnull)
+    import contextlib
+    import io
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+    client = app_module.app.test_client()
+
+    print("🌐 /api/predict (Flask test client)")
+    for email in emails[:20]:
+        client.post('/api/predict', json={'email': email})
+    latencies = timed_latencies(lambda email: client.post('/api/predict', json={'email': email}),
+                                emails * repeats)
+    for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        results.add(f'api_predict.{name}_ms', percentile(latencies, fraction) * 1000, 'ms', 'lower')
+
+    print("📦 /api/predict/batch")
+    for batch_size in batch_sizes:
+        batches = [emails[i:i + batch_size] for i in range(0, len(emails) - batch_size + 1, batch_size)]
+        batches = batches or [emails[:batch_size]]
+        count = 0
+        start = time.perf_counter()
+        for batch in batches:
+            response = client.post('/api/predict/batch',
+                                   json={'emails': [{'id': i, 'email': e} for i, e in enumerate(batch)]})
+            count += response.get_json()['count']
+        elapsed = time.perf_counter() - start
+        results.add(f'api_batch.size_{batch_size}.emails_per_s', count / elapsed, 'emails/s', 'higher')
+
+def bench_load(results, models_dir):
+    from model_artifact import ARTIFACT_FILENAME
+
+    print("💾 model load (fresh interpreter)")
+    candidates = (
+        ('artifact', [os.path.join(models_dir, ARTIFACT_FILENAME)]),
+        ('pickle', [os.path.join(models_dir, 'spam_model.joblib'),
+                    os.path.join(models_dir, 'tfidf_vectorizer.joblib')]),
+    )
+    for kind, paths in candidates:
+        if not all(os.path.exists(path) for path in paths):
+            continue
+        output = subprocess.run(
+            [sys.executable, os.path.join(REPO_DIR, 'model_artifact.py'), '_probe', kind, *paths],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        probe = json.loads(output.strip().splitlines()[-1])
+        results.add(f'load.{kind}.seconds', probe['load_seconds'], 's', 'lower')
+        results.add(f'load.{kind}.rss_mb', probe['rss_delta_mb'], 'MB', 'lower')
+
+def bench_training(results):
+    """Wall time of create_model.py, run in a scratch directory"""
+    print("🏋️ training (create_model.py)")
+    scratch = tempfile.mkdtemp(prefix='spam-bench-')
+    try:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(REPO_DIR, 'create_model.py')],
+                       cwd=scratch, check=True, capture_output=True)
+        results.add('training.create_model_seconds', time.perf_counter() - start, 's', 'lower')
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def run(args):
+    results = Results()
+    emails = load_emails(args.data_dir, 200 if args.quick else 1000)
+    print(f"📧 {len(emails)} emails from {args.data_dir} + sample_mail.txt")
+
+    bench_inference(results, emails, args.models_dir)
+    bench_api(results, emails[:200] if args.quick else emails,
+              [1, 10, 100] if args.quick else [1, 10, 100, 1000], 1 if args.quick else 2)
+    bench_load(results, args.models_dir)
+    if not args.skip_training:
+        bench_training(results)
+
+    # ru_maxrss is in KB on Linux
+    results.add('process.peak_rss_mb',
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 'MB', 'lower')
+
+    report = {
+        'suite_version': SUITE_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'machine': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'quick': args.quick,
+        'metrics': results.metrics,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            return compare(json.load(f), report, args.threshold)
+    return 0
+
+def compare(baseline, current, threshold):
+    """Print the metric changes; return 1 if any regressed past threshold"""
+    regressions = []
+    print(f"\n{'metric':<38} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, metric in sorted(current['metrics'].items()):
+        if name not in baseline['metrics']:
+            continue
+        before = baseline['metrics'][name]['value']
+        after = metric['value']
+        change = (after - before) / before if before else 0.0
+        worse = change > threshold if metric['better'] == 'lower' else change < -threshold
+        flag = ' ❌' if worse else ''
+        print(f"{name:<38} {before:>12.4f} {after:>12.4f} {change:>+8.1%}{flag}")
+        if worse:
+            regressions.append(name)
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} metric(s) regressed by more than {threshold:.0%}: "
+              f"{', '.join(regressions)}")
+        return 1
+    print(f"\n✅ No metric regressed by more than {threshold:.0%}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run the suite')
+    run_parser.add_argument('--output', help='write results as JSON')
+    run_parser.add_argument('--models-dir', default='models')
+    run_parser.add_argument('--data-dir', default='data')
+    run_parser.add_argument('--quick', action='store_true', help='fewer emails and batch sizes')
+    run_parser.add_argument('--skip-training', action='store_true')
+    run_parser.add_argument('--compare', metavar='BASELINE', help='gate against a stored baseline')
+    run_parser.add_argument('--threshold', type=float, default=0.10)
+
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        return run(args)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    return compare(baseline, current, args.threshold)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+# body_extractor.py - bounded-cost MIME-aware message body extraction
+"""Extract the human-readable text of a raw email before clean_email's
+regex passes.
+
+The header block is skipped and the MIME structure is walked: text/plain
+parts are decoded (quoted-printable / base64, then their charset),
+text/html parts are reduced to text, and multipart/alternative keeps only
+the plain version when there is one. Images, archives and other binary
+attachments are skipped without being decoded.
+
+The cost is bounded. At most max_input_chars of the raw message are looked
+at, at most max_chars of text are produced, and the result is cut after
+max_tokens whitespace-separated tokens. Encoded parts are only decoded up
+to the remaining budget. ExtractedBody.truncated reports when any limit
+cut something.
+
+A message without MIME headers comes out exactly as the old
+"split on the first blank line" rule produced it. Text without a header
+block (for example a body pasted into the web form) is kept whole.
+
+Settings come from SPAM_BODY_MAX_INPUT_CHARS, SPAM_BODY_MAX_CHARS,
+SPAM_BODY_MAX_TOKENS and SPAM_BODY_HTML ('text', the default, or 'markup'
+to keep decoded HTML as it is - markup words are spam signal the model
+can use). Training and serving must use the same settings.
+
+    python body_extractor.py some_message.eml    # print the extracted body
+"""
+import binascii
+import html
+import os
+import quopri
+import re
+import sys
+import threading
+from collections import namedtuple
+
+ExtractedBody = namedtuple('ExtractedBody', ['text', 'truncated', 'skipped_parts'])
+
+# Nested multiparts deeper than this are not walked
+MAX_DEPTH = 8
+
+HEADER_LINE = re.compile(r'[!-9;-~]+:|[ \t]|From ')
+CONTENT_TYPE = re.compile(r'^content-type:[ \t]*([^\n]*(?:\n[ \t][^\n]*)*)', re.I | re.M)
+TRANSFER_ENCODING = re.compile(r'^content-transfer-encoding:[ \t]*([^\s;]*)', re.I | re.M)
+DISPOSITION = re.compile(r'^content-disposition:[ \t]*([^\s;]*)', re.I | re.M)
+PARAMETER = re.compile(r';\s*([\w-]+)\s*=\s*(?:"([^"]*)"|([^\s;]+))')
+
+# Openers of content that is never shown; each closer is searched for once,
+# so an unterminated opener costs one scan instead of one per opener
+HTML_HIDDEN = re.compile(r'<(script|style)\b|<!--', re.I)
+HTML_CLOSERS = {name: re.compile(r'</' + name + r'\s*>', re.I) for name in ('script', 'style')}
+HTML_TAG = re.compile(r'<[^>]*>')
+LINK_ATTRIBUTE = re.compile(r'(?:href|src)\s*=\s*["\']?(https?://[^"\'\s>]+)', re.I)
+BASE64_RUN = re.compile(r'[A-Za-z0-9+/=\s]*')
+
+ExtractionSettings = namedtuple('ExtractionSettings',
+                                ['max_input_chars', 'max_chars', 'max_tokens', 'html'])
+
+def settings_from_env():
+    html_mode = os.environ.get('SPAM_BODY_HTML', 'text').lower()
+    if html_mode not in ('text', 'markup'):
+        raise ValueError(f"SPAM_BODY_HTML must be 'text' or 'markup', not {html_mode!r}")
+    return ExtractionSettings(
+        max_input_chars=int(os.environ.get('SPAM_BODY_MAX_INPUT_CHARS', 2000000)),
+        max_chars=int(os.environ.get('SPAM_BODY_MAX_CHARS', 200000)),
+        max_tokens=int(os.environ.get('SPAM_BODY_MAX_TOKENS', 30000)),
+        html=html_mode,
+    )
+
+DEFAULT_SETTINGS = settings_from_env()
+
+# Process-wide counters, reported on /health and /metrics
+_stats_lock = threading.Lock()
+_stats = {'truncated': 0, 'skipped_parts': 0}
+
+def extraction_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+def split_headers(message):
+    """(header block or None, body); None when the text has no header block"""
+    header_block, separator, body = message.partition('\n\n')
+    if not separator:
+        return None, message
+    for line in header_block.split('\n'):
+        if not HEADER_LINE.match(line):
+            return None, message
+    return header_block, body
+
+def _header_fields(header_block):
+    """(content type, parameters, transfer encoding, disposition) of one header block"""
+    match = CONTENT_TYPE.search(header_block)
+    content_type, parameters = 'text/plain', {}
+    if match:
+        value = match.group(1).replace('\n', ' ')
+        content_type = value.split(';', 1)[0].strip().lower() or 'text/plain'
+        parameters = {name.lower(): quoted if quoted is not None and quoted != '' else bare
+                      for name, quoted, bare in PARAMETER.findall(value)}
+    match = TRANSFER_ENCODING.search(header_block)
+    encoding = match.group(1).lower() if match else ''
+    match = DISPOSITION.search(header_block)
+    disposition = match.group(1).lower() if match else ''
+    return content_type, parameters, encoding, disposition
+
+def _decode(payload, encoding, charset, budget):
+    """Decode at most about budget characters of a transfer-encoded payload"""
+    if encoding == 'base64':
+        # Only the leading run of base64 lines; list footers often follow it
+        payload = BASE64_RUN.match(payload, 0, budget * 4 // 3 + 4 + budget // 38).group()
+        payload = ''.join(payload.split())
+        payload = payload[:len(payload) // 4 * 4]
+        try:
+            data = binascii.a2b_base64(payload.encode('latin-1', 'replace'))
+        except binascii.Error:
+            return ''
+    elif encoding == 'quoted-printable':
+        data = quopri.decodestring(payload[:budget * 3].encode('latin-1', 'replace'))
+    else:
+        # 7bit / 8bit text stays exactly as it was read
+        return payload[:budget]
+    try:
+        return data.decode(charset or 'latin-1', 'replace')[:budget]
+    except LookupError:
+        return data.decode('latin-1')[:budget]
+
+def _tag_links(match):
+    return ' ' + ' '.join(LINK_ATTRIBUTE.findall(match.group())) + ' '
+
+def _drop_hidden_html(markup):
+    """markup without scripts, styles and comments, in one linear pass
+
+    An opener whose closer is missing hides everything after it.
+    """
+    pieces = []
+    position = 0
+    while True:
+        match = HTML_HIDDEN.search(markup, position)
+        if match is None:
+            pieces.append(markup[position:])
+            break
+        pieces.append(markup[position:match.start()])
+        pieces.append(' ')
+        if match.group(1):
+            closer = HTML_CLOSERS[match.group(1).lower()].search(markup, match.end())
+            end = closer.end() if closer else -1
+        else:
+            end = markup.find('-->', match.end())
+            end = end + 3 if end >= 0 else -1
+        if end < 0:
+            break
+        position = end
+    return ''.join(pieces)
+
+def html_to_text(markup):
+    """Visible text of an HTML fragment plus its link and image URLs
+
+    Tags, scripts, styles and comments are removed. href / src URLs are kept
+    because clean_email turns them into URL tokens, which image-only spam
+    would otherwise lose entirely.
+    """
+    markup = _drop_hidden_html(markup)
+    # A '<' with no '>' after it never starts a tag; leaving that tail out
+    # keeps the tag pass linear on runs of unclosed '<'
+    last_close = markup.rfind('>') + 1
+    return html.unescape(HTML_TAG.sub(_tag_links, markup[:last_close]) + markup[last_close:])
+
+def _multipart_bodies(body, boundary):
+    """Raw subparts of a multipart body (preamble and epilogue dropped)"""
+    delimiter = re.compile(r'(?:^|\n)--' + re.escape(boundary) + r'(--)?[ \t]*(?=\n|$)')
+    parts = []
+    start = None
+    for match in delimiter.finditer(body):
+        if start is not None:
+            parts.append(body[start:match.start()])
+        if match.group(1):
+            return parts
+        start = match.end() + 1
+    if start is not None:
+        # Unterminated multipart: keep the last part
+        parts.append(body[start:])
+    return parts
+
+class _Extractor:
+    def __init__(self, max_chars, html_mode='text'):
+        self.pieces = []
+        self.remaining = max_chars
+        self.html_mode = html_mode
+        self.truncated = False
+        self.skipped_parts = 0
+
+    def add(self, text):
+        if len(text) > self.remaining:
+            text = text[:self.remaining]
+            self.truncated = True
+        self.pieces.append(text)
+        self.remaining -= len(text)
+
+    def walk(self, header_block, body, depth=0):
+        if self.remaining <= 0:
+            self.truncated = True
+            return
+        content_type, parameters, encoding, disposition = _header_fields(header_block)
+        main_type = content_type.split('/', 1)[0]
+
+        if main_type == 'multipart' and parameters.get('boundary') and depth < MAX_DEPTH:
+            parts = [split_part(part) for part in _multipart_bodies(body, parameters['boundary'])]
+            if not parts:
+                # Boundary never found: read the body as plain text
+                parts = [('', body)]
+            if content_type == 'multipart/alternative':
+                parts = _preferred_alternative(parts)
+            for part_headers, part_body in parts:
+                self.walk(part_headers, part_body, depth + 1)
+        elif content_type == 'message/rfc822' and depth < MAX_DEPTH:
+            part_headers, part_body = split_part(body)
+            self.walk(part_headers, part_body, depth + 1)
+        elif main_type == 'text' and disposition != 'attachment':
+            text = _decode(body, encoding, parameters.get('charset'), self.remaining)
+            if content_type == 'text/html' and self.html_mode == 'text':
+                text = html_to_text(text)
+            if self.pieces:
+                self.add('\n')
+            self.add(text)
+        else:
+            self.skipped_parts += 1
+
+def split_part(part):
+    """Split a MIME part into (headers, body); parts always start with a header block"""
+    if part.startswith('\n'):
+        return '', part[1:]
+    header_block, _, body = part.partition('\n\n')
+    return header_block, body
+
+def _preferred_alternative(parts):
+    """The text/plain alternative when there is a non-blank one, otherwise all of them"""
+    for part_headers, part_body in parts:
+        if _header_fields(part_headers)[0] == 'text/plain' and part_body.strip():
+            return [(part_headers, part_body)]
+    return parts
+
+def extract_body(message, settings=None):
+    """Return ExtractedBody(text, truncated, skipped_parts) for one raw email"""
+    settings = settings or DEFAULT_SETTINGS
+    truncated = False
+    if len(message) > settings.max_input_chars:
+        message = message[:settings.max_input_chars]
+        truncated = True
+    if '\r\n' in message:
+        message = message.replace('\r\n', '\n')
+
+    header_block, body = split_headers(message)
+    if header_block is None or not CONTENT_TYPE.search(header_block):
+        # No MIME structure: the body as it is, only cut to the budget
+        extractor = _Extractor(settings.max_chars)
+        extractor.add(body)
+        text = body if not extractor.truncated else extractor.pieces[0]
+    else:
+        extractor = _Extractor(settings.max_chars, settings.html)
+        extractor.walk(header_block, body)
+        text = ''.join(extractor.pieces)
+    truncated = truncated or extractor.truncated
+
+    # Token budget: cut after the max_tokens-th token (only possible past 2 * max_tokens chars)
+    if len(text) >= 2 * settings.max_tokens:
+        parts = text.split(None, settings.max_tokens)
+        if len(parts) > settings.max_tokens:
+            # parts[-1] is everything after the max_tokens-th token
+            text = text[:len(text) - len(parts[-1])].rstrip()
+            truncated = True
+
+    if truncated or extractor.skipped_parts:
+        with _stats_lock:
+            _stats['truncated'] += truncated
+            _stats['skipped_parts'] += extractor.skipped_parts
+    return ExtractedBody(text, truncated, extractor.skipped_parts)
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python body_extractor.py MESSAGE_FILE")
+        return 1
+    with open(sys.argv[1], 'r', encoding='latin-1') as f:
+        extracted = extract_body(f.read())
+    print(extracted.text)
+    print(f"\n📏 {len(extracted.text)} chars, truncated={extracted.truncated}, "
+          f"skipped parts={extracted.skipped_parts}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,294 @@
+# bulk_classify.py - stream a mail archive through the model on a process pool
+"""Rescore a whole mail archive offline.
+
+Messages are streamed from a directory tree, a Maildir or an mbox file and
+sent in chunks to a pool of worker processes, each of which loads the model
+once. Verdicts are written as JSON lines in archive order as soon as each
+chunk completes. Only a bounded number of chunks is in flight at a time, so
+memory use does not depend on the size of the archive. Models scored
+through a sparse matrix (not the fused linear scorer) are featurized a
+chunk at a time with batch_featurizer.BatchFeaturizer.
+
+    python bulk_classify.py ~/Maildir -o verdicts.jsonl --workers 8
+    python bulk_classify.py archive.mbox -o verdicts.jsonl --resume
+
+A checkpoint (verdicts.jsonl.checkpoint by default) records how many
+messages have been written. --resume truncates the output back to the last
+checkpoint and continues from there.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import batch_featurizer
+from inference import InferencePipeline, cleaned_text_vectorizer
+from model_loader import load_model_pair
+
+CHECKPOINT_VERSION = 1
+
+def detect_format(source):
+    if os.path.isfile(source):
+        return 'mbox'
+    if all(os.path.isdir(os.path.join(source, sub)) for sub in ('cur', 'new')):
+        return 'maildir'
+    return 'dir'
+
+def iter_directory(root, skip=0):
+    """Yield (relative path, absolute path) for every file under root, in sorted order"""
+    index = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if index >= skip:
+                path = os.path.join(dirpath, filename)
+                yield os.path.relpath(path, root), path
+            index += 1
+
+def iter_maildir(root, skip=0):
+    """Yield (relative path, absolute path) for the messages in cur/ and new/"""
+    index = 0
+    for sub in ('cur', 'new'):
+        folder = os.path.join(root, sub)
+        for filename in sorted(os.listdir(folder)):
+            if filename.startswith('.'):
+                continue
+            if index >= skip:
+                yield f'{sub}/{filename}', os.path.join(folder, filename)
+            index += 1
+
+def iter_mbox(path, start_offset=0):
+    """Yield (start offset, raw message bytes, end offset) for each message of an mbox
+
+    Reads line by line, so only one message is held in memory at a time.
+    Lines starting with "From " separate messages; a message ends where the
+    next "From " line begins.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start_offset)
+        offset = start_offset
+        message_offset = None
+        lines = []
+        for line in f:
+            if line.startswith(b'From '):
+                if message_offset is not None:
+                    yield message_offset, b''.join(lines), offset
+                message_offset = offset
+                lines = []
+            elif message_offset is not None:
+                lines.append(line)
+            offset += len(line)
+        if message_offset is not None:
+            yield message_offset, b''.join(lines), offset
+
+def iter_chunks(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Per-process pipeline, built once by the pool initializer
+_worker_pipeline = None
+# BatchFeaturizer for models scored through a sparse matrix (None: pipeline.score)
+_worker_featurizer = None
+
+def _init_worker(models_dir):
+    global _worker_pipeline, _worker_featurizer
+    with contextlib.redirect_stdout(io.StringIO()):
+        pair = load_model_pair(models_dir)
+    if pair is None:
+        raise RuntimeError(f"could not load a model from {models_dir}")
+    _worker_pipeline = InferencePipeline(*pair)
+    _worker_featurizer = None
+    # Linear tf-idf models score through the fused LinearScorer instead
+    if _worker_pipeline.scorer is None and batch_featurizer.use_for(_worker_pipeline.vectorizer):
+        _worker_featurizer = batch_featurizer.BatchFeaturizer(
+            cleaned_text_vectorizer(_worker_pipeline.vectorizer), workers=1)
+
+def _verdicts(texts):
+    """(prediction, [ham_prob, spam_prob]) per raw email, like InferencePipeline.score"""
+    if _worker_featurizer is None:
+        return _worker_pipeline.score(texts)
+    cleaned_texts = [_worker_pipeline.clean(text) for text in texts]
+    predictions, probabilities = _worker_pipeline.predict_proba(_worker_featurizer.transform(cleaned_texts))
+    return [(int(prediction), [float(p) for p in proba])
+            for prediction, proba in zip(predictions, probabilities)]
+
+def _score_chunk(chunk):
+    """Score [(id, path or raw bytes), ...]; returns (JSON lines, error count)"""
+    records = []
+    texts = []
+    for message_id, payload in chunk:
+        record = {'id': message_id}
+        try:
+            if isinstance(payload, bytes):
+                texts.append(payload.decode('latin-1'))
+            else:
+                with open(payload, 'r', encoding='latin-1') as f:
+                    texts.append(f.read())
+        except OSError as e:
+            record['error'] = str(e)
+        records.append(record)
+
+    verdicts = iter(_verdicts(texts)) if texts else iter(())
+    errors = 0
+    lines = []
+    for record in records:
+        if 'error' in record:
+            errors += 1
+        else:
+            prediction, proba = next(verdicts)
+            record.update({
+                'prediction': 'spam' if prediction == 1 else 'ham',
+                'spam_probability': float(proba[1]),
+                'confidence': float(max(proba)),
+            })
+        lines.append(json.dumps(record))
+    return lines, errors
+
+def read_checkpoint(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_checkpoint(path, checkpoint):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify every message of a mail archive")
+    parser.add_argument('source', help='directory tree, Maildir or mbox file')
+    parser.add_argument('-o', '--output', required=True, help='JSONL verdicts file')
+    parser.add_argument('--format', choices=['auto', 'dir', 'maildir', 'mbox'], default='auto')
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--checkpoint', help='checkpoint file (default: OUTPUT.checkpoint)')
+    parser.add_argument('--checkpoint-every', type=int, default=20, help='chunks between checkpoints')
+    parser.add_argument('--resume', action='store_true', help='continue from the last checkpoint')
+    parser.add_argument('--progress-interval', type=float, default=5.0, help='seconds between progress lines')
+    args = parser.parse_args()
+
+    source_format = detect_format(args.source) if args.format == 'auto' else args.format
+    checkpoint_path = args.checkpoint or f'{args.output}.checkpoint'
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        pair = load_model_pair(args.models_dir)
+    if pair is None:
+        print(f"❌ Could not load a model from {args.models_dir}; run create_model.py first")
+        return 1
+    model_version = InferencePipeline(*pair).version
+    del pair
+
+    checkpoint = {
+        'version': CHECKPOINT_VERSION,
+        'source': os.path.abspath(args.source),
+        'format': source_format,
+        'model_version': model_version,
+        'done': 0,
+        'errors': 0,
+        'output_bytes': 0,
+        'mbox_offset': 0,
+    }
+    if args.resume:
+        saved = read_checkpoint(checkpoint_path)
+        if saved is None:
+            print(f"⚠️ No checkpoint at {checkpoint_path}; starting from the beginning")
+        elif (saved.get('source'), saved.get('format'), saved.get('model_version')) != \
+                (checkpoint['source'], source_format, model_version):
+            print("❌ Checkpoint was written for a different source, format or model; refusing to resume")
+            return 1
+        else:
+            checkpoint = saved
+            print(f"⏩ Resuming after {checkpoint['done']} messages")
+
+    # Drop anything written after the last checkpoint
+    output = open(args.output, 'ab' if args.resume else 'wb')
+    output.truncate(checkpoint['output_bytes'])
+    output.seek(checkpoint['output_bytes'])
+
+    if source_format == 'mbox':
+        items = iter_mbox(args.source, checkpoint['mbox_offset'])
+    elif source_format == 'maildir':
+        items = iter_maildir(args.source, checkpoint['done'])
+    else:
+        items = iter_directory(args.source, checkpoint['done'])
+
+    print(f"📬 Classifying {source_format} {args.source} with model {model_version} "
+          f"on {args.workers} worker(s)")
+    start_time = time.perf_counter()
+    last_progress = start_time
+    processed = 0
+    chunks_since_checkpoint = 0
+    max_in_flight = args.workers * 2
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.models_dir,)) as pool:
+        in_flight = deque()  # (future, message count, mbox offset after the chunk)
+        chunks = iter_chunks(items, args.chunk_size)
+        exhausted = False
+        while in_flight or not exhausted:
+            # Keep the pool busy without reading ahead more than max_in_flight chunks
+            while not exhausted and len(in_flight) < max_in_flight:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                next_offset = None
+                if source_format == 'mbox':
+                    next_offset = chunk[-1][2]
+                    chunk = [(str(offset), raw) for offset, raw, _ in chunk]
+                in_flight.append((pool.submit(_score_chunk, chunk), len(chunk), next_offset))
+            if not in_flight:
+                break
+
+            # Write results in archive order
+            future, count, next_offset = in_flight.popleft()
+            lines, errors = future.result()
+            output.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            processed += count
+            checkpoint['done'] += count
+            checkpoint['errors'] += errors
+            if next_offset is not None:
+                checkpoint['mbox_offset'] = next_offset
+            chunks_since_checkpoint += 1
+
+            if chunks_since_checkpoint >= args.checkpoint_every:
+                output.flush()
+                checkpoint['output_bytes'] = output.tell()
+                write_checkpoint(checkpoint_path, checkpoint)
+                chunks_since_checkpoint = 0
+
+            now = time.perf_counter()
+            if now - last_progress >= args.progress_interval:
+                rate = processed / (now - start_time)
+                print(f"⏱️ {checkpoint['done']} messages, {rate:.0f} msg/s")
+                last_progress = now
+
+    output.flush()
+    checkpoint['output_bytes'] = output.tell()
+    output.close()
+    write_checkpoint(checkpoint_path, checkpoint)
+
+    elapsed = time.perf_counter() - start_time
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"✅ {processed} messages in {elapsed:.1f}s ({rate:.0f} msg/s), "
+          f"{checkpoint['done']} total, {checkpoint['errors']} unreadable")
+    print(f"📄 Verdicts: {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
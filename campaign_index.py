@@ -0,0 +1,214 @@
+# campaign_index.py - near-duplicate index of recently scored emails
+"""MinHash / LSH index over the cleaned shingles of recently scored emails.
+
+Spam campaigns send many copies of one message with random tokens and
+numbers mixed in. clean_email already maps every number to NUMBER and every
+link to URL, so the cleaned copies are almost identical, and their word
+shingle sets have a high Jaccard similarity. Each high-confidence verdict is
+stored under a MinHash signature; a new email whose estimated similarity
+to a stored one is at least `threshold` reuses that verdict and skips the
+vectorizer and model entirely.
+
+Memory is bounded by max_entries (oldest evicted first) and entries expire
+after ttl seconds.
+"""
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Constants for combining token hashes into well-mixed 64-bit shingle hashes
+_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_FINALIZER = np.uint64(0xBF58476D1CE4E5B9)
+_EMPTY = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+class CampaignIndex:
+    """Thread-safe LSH index mapping cleaned emails to recent verdicts"""
+
+    def __init__(self, num_perm=64, bands=16, shingle_size=3, threshold=0.8,
+                 min_confidence=0.95, min_shingles=8, max_tokens=256,
+                 max_entries=50000, ttl=3600, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        if num_perm & (num_perm - 1):
+            raise ValueError("num_perm must be a power of two")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.min_confidence = min_confidence
+        self.min_shingles = min_shingles
+        self.max_tokens = max_tokens
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        # Hash seed and the bin layout of the 64-bit hash space
+        self._seed = np.uint64(seed)
+        self._bin_shift = np.uint64(64 - (num_perm.bit_length() - 1))
+        self._bin_ids = np.arange(num_perm, dtype=np.uint64)
+        self._bin_starts = self._bin_ids << self._bin_shift
+
+        self._entries = OrderedDict()  # entry id -> (signature, verdict, band keys, added_at)
+        self._buckets = {}             # band key -> set of entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def signature(self, cleaned_text):
+        """MinHash signature of the word shingles, or None if the text is too short
+
+        Uses one-permutation MinHash: every shingle is hashed once, the hash
+        space is split into num_perm bins and the signature is the minimum
+        hash in each bin (empty bins borrow from the next non-empty bin).
+        This costs one sort of the shingle hashes instead of num_perm hash
+        functions per shingle. Only the first max_tokens tokens are used, which
+        bounds the cost for very long emails.
+        """
+        tokens = cleaned_text.split(maxsplit=self.max_tokens)[:self.max_tokens]
+        k = self.shingle_size
+        n_shingles = len(tokens) - k + 1
+        if n_shingles < self.min_shingles:
+            return None
+
+        # Stable 32-bit token hashes, combined into shingle hashes with
+        # wrapping uint64 arithmetic instead of joining shingle strings
+        token_hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens),
+                                   dtype=np.uint64, count=len(tokens))
+        shingles = np.full(n_shingles, self._seed, dtype=np.uint64)
+        for offset in range(k):
+            shingles = shingles * _MULTIPLIER + token_hashes[offset:offset + n_shingles]
+        # splitmix64 finalizer so the top bits (the bin) are well mixed
+        shingles ^= shingles >> np.uint64(31)
+        shingles *= _FINALIZER
+        shingles ^= shingles >> np.uint64(29)
+        shingles = np.unique(shingles)
+        if len(shingles) < self.min_shingles:
+            return None
+
+        # Sorted hashes: the first hash at or after each bin boundary is the
+        # bin minimum if it still falls inside that bin
+        positions = np.searchsorted(shingles, self._bin_starts)
+        found = positions < len(shingles)
+        signature = np.full(self.num_perm, _EMPTY, dtype=np.uint64)
+        candidates = shingles[positions[found]]
+        in_bin = (candidates >> self._bin_shift) == self._bin_ids[found]
+        signature[np.flatnonzero(found)[in_bin]] = candidates[in_bin]
+
+        # Densify: empty bins take the value of the next non-empty bin
+        filled = np.flatnonzero(signature != _EMPTY)
+        if len(filled) < self.num_perm:
+            nearest = np.searchsorted(filled, np.arange(self.num_perm)) % len(filled)
+            signature = signature[filled[nearest]]
+        return signature
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes())
+                for band in range(self.bands)]
+
+    def _expire(self, now):
+        if self.ttl is None:
+            return
+        while self._entries:
+            entry_id, (_, _, _, added_at) = next(iter(self._entries.items()))
+            if now - added_at <= self.ttl:
+                break
+            self._remove(entry_id)
+
+    def _remove(self, entry_id):
+        _, _, band_keys, _ = self._entries.pop(entry_id)
+        for band_key in band_keys:
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def lookup(self, cleaned_text, signature=None):
+        """Return the verdict of the most similar recent email, or None"""
+        if signature is None:
+            signature = self.signature(cleaned_text)
+        if signature is None:
+            with self._lock:
+                self.skipped += 1
+            return None
+
+        with self._lock:
+            self._expire(time.monotonic())
+            candidates = set()
+            for band_key in self._band_keys(signature):
+                candidates.update(self._buckets.get(band_key, ()))
+
+            best_verdict = None
+            best_similarity = self.threshold
+            for entry_id in candidates:
+                stored_signature, verdict, _, _ = self._entries[entry_id]
+                similarity = float(np.mean(stored_signature == signature))
+                if similarity >= best_similarity:
+                    best_similarity = similarity
+                    best_verdict = verdict
+
+            if best_verdict is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return best_verdict
+
+    def add(self, cleaned_text, verdict, signature=None):
+        """Remember a (prediction, [ham_prob, spam_prob]) verdict if it is confident"""
+        if max(verdict[1]) < self.min_confidence:
+            return False
+        if signature is None:
+            signature = self.signature(cleaned_text)
+        if signature is None:
+            return False
+
+        band_keys = self._band_keys(signature)
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (signature, verdict, band_keys, now)
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def flush(self):
+        """Forget every stored verdict (called when a new model is loaded)"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'misses': self.misses,
+                'skipped_short': self.skipped,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+def campaign_index_from_env():
+    """Build the app's campaign index from SPAM_CAMPAIGN_* variables (None if disabled)"""
+    if os.environ.get('SPAM_CAMPAIGN_INDEX', '0').lower() not in ('1', 'true', 'yes'):
+        return None
+    ttl = os.environ.get('SPAM_CAMPAIGN_TTL', '3600')
+    return CampaignIndex(
+        threshold=float(os.environ.get('SPAM_CAMPAIGN_THRESHOLD', 0.8)),
+        min_confidence=float(os.environ.get('SPAM_CAMPAIGN_MIN_CONFIDENCE', 0.95)),
+        max_entries=int(os.environ.get('SPAM_CAMPAIGN_MAX_ENTRIES', 50000)),
+        ttl=float(ttl) if ttl else None,
+    )
@@ -0,0 +1,232 @@
+# cascade.py - cheap first-stage scorer in front of the full trigram model
+"""Confidence-gated two-stage classification.
+
+The first stage is a unigram TF-IDF + LogisticRegression over the first
+prefix_chars characters of the cleaned body, scored with the fused
+LinearScorer. When its spam probability is at or below low, or at or
+above high, its verdict is final; only the emails in between escalate to
+the full (1-3 gram) model. Most traffic is obvious, so most emails never
+pay for trigram generation.
+
+create_model.py trains the first stage next to the full model, evaluates
+the cascade on the hold-out split and saves it as cascade_stage1.joblib.
+The app uses it when SPAM_CASCADE=1 and the file is in models/.
+SPAM_CASCADE_LOW / SPAM_CASCADE_HIGH override the trained bands and
+SPAM_CASCADE_PREFIX_CHARS sets the prefix at training time.
+
+    python cascade.py --models-dir models    # re-run the hold-out evaluation
+"""
+import argparse
+import hashlib
+import os
+import sys
+import threading
+import time
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+from inference import _identity, model_fingerprint
+from linear_scorer import compile_linear_scorer
+
+CASCADE_FILENAME = 'cascade_stage1.joblib'
+DEFAULT_PREFIX_CHARS = 2000
+DEFAULT_LOW = 0.1
+DEFAULT_HIGH = 0.9
+
+def build_first_stage_vectorizer(max_features=5000):
+    # Fitted on already-cleaned text, so no preprocessor runs
+    return TfidfVectorizer(
+        preprocessor=_identity,
+        stop_words='english',
+        max_features=max_features,
+        ngram_range=(1, 1),
+        token_pattern=r'\b[a-zA-Z]{2,}\b'
+    )
+
+def build_first_stage_classifier():
+    # Weaker regularisation than the full model: with unigrams only, the
+    # first stage needs sharp probabilities to decide anything alone
+    return LogisticRegression(C=10.0, max_iter=1000, random_state=42)
+
+class FirstStage:
+    """Unigram prefix scorer that decides alone outside the (low, high) band"""
+
+    def __init__(self, vectorizer, model, prefix_chars=DEFAULT_PREFIX_CHARS,
+                 low=DEFAULT_LOW, high=DEFAULT_HIGH):
+        if not 0.0 <= low < high <= 1.0:
+            raise ValueError(f"Cascade bands must satisfy 0 <= low < high <= 1, got {low}, {high}")
+        self.vectorizer = vectorizer
+        self.model = model
+        self.prefix_chars = prefix_chars
+        self.low = low
+        self.high = high
+        self.scorer = compile_linear_scorer(vectorizer, model)
+        digest = hashlib.sha256(
+            f"{model_fingerprint(vectorizer, model)}/{prefix_chars}/{low!r}/{high!r}".encode('utf-8'))
+        self.version = digest.hexdigest()[:16]
+
+        self._counts_lock = threading.Lock()
+        self.decided = 0
+        self.escalated = 0
+
+    def score(self, cleaned_texts):
+        """First-stage (prediction, [ham_prob, spam_prob]) for cleaned texts"""
+        prefixes = [text[:self.prefix_chars] for text in cleaned_texts]
+        if self.scorer is not None:
+            return [self.scorer.score(text) for text in prefixes]
+        probabilities = self.model.predict_proba(self.vectorizer.transform(prefixes))
+        return [(int(self.model.classes_[proba.argmax()]), [float(p) for p in proba])
+                for proba in probabilities]
+
+    def decide(self, cleaned_texts):
+        """Verdict for each text the first stage is sure about, None for the rest"""
+        verdicts = []
+        for verdict in self.score(cleaned_texts):
+            spam_prob = verdict[1][1]
+            verdicts.append(verdict if spam_prob <= self.low or spam_prob >= self.high else None)
+        escalated = verdicts.count(None)
+        with self._counts_lock:
+            self.decided += len(verdicts) - escalated
+            self.escalated += escalated
+        return verdicts
+
+    def with_bands(self, low, high):
+        """A copy with different confidence bands"""
+        return FirstStage(self.vectorizer, self.model, self.prefix_chars, low, high)
+
+    def save(self, path):
+        joblib.dump({
+            'vectorizer': self.vectorizer,
+            'model': self.model,
+            'prefix_chars': self.prefix_chars,
+            'low': self.low,
+            'high': self.high,
+        }, path)
+
+    def stats(self):
+        total = self.decided + self.escalated
+        return {
+            'enabled': True,
+            'version': self.version,
+            'prefix_chars': self.prefix_chars,
+            'low': self.low,
+            'high': self.high,
+            'decided': self.decided,
+            'escalated': self.escalated,
+            'escalation_rate': round(self.escalated / total, 6) if total else None,
+        }
+
+def fit_first_stage(cleaned_texts, labels, prefix_chars=DEFAULT_PREFIX_CHARS,
+                    low=DEFAULT_LOW, high=DEFAULT_HIGH):
+    """Train the first stage on already-cleaned texts"""
+    vectorizer = build_first_stage_vectorizer()
+    features = vectorizer.fit_transform([text[:prefix_chars] for text in cleaned_texts])
+    model = build_first_stage_classifier()
+    model.fit(features, labels)
+    # Only kept for introspection; most of the pickle otherwise
+    del vectorizer.stop_words_
+    return FirstStage(vectorizer, model, prefix_chars, low, high)
+
+def load_first_stage(models_dir='models'):
+    """Load the first stage from models_dir (None if there is none)
+
+    SPAM_CASCADE_LOW / SPAM_CASCADE_HIGH override the saved bands.
+    """
+    path = os.path.join(models_dir, CASCADE_FILENAME)
+    if not os.path.exists(path):
+        return None
+    saved = joblib.load(path)
+    return FirstStage(
+        saved['vectorizer'], saved['model'], saved['prefix_chars'],
+        low=float(os.environ.get('SPAM_CASCADE_LOW', saved['low'])),
+        high=float(os.environ.get('SPAM_CASCADE_HIGH', saved['high'])),
+    )
+
+def cascade_enabled():
+    return os.environ.get('SPAM_CASCADE', '0').lower() in ('1', 'true', 'yes')
+
+def _latencies(score_cleaned, cleaned_texts):
+    latencies = []
+    for text in cleaned_texts:
+        start = time.perf_counter()
+        score_cleaned([text])
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+def evaluate_cascade(first_stage, vectorizer, model, cleaned_texts, labels):
+    """Compare the cascade with the full model alone on held-out cleaned texts
+
+    Returns the escalation rate, both accuracies and per-email scoring
+    latency (mean and p99, cleaning excluded) as a dict.
+    """
+    from inference import InferencePipeline
+
+    single = InferencePipeline(vectorizer, model)
+    cascade = InferencePipeline(vectorizer, model, first_stage=first_stage)
+    labels = np.asarray(labels)
+    escalated = first_stage.decide(cleaned_texts).count(None)
+
+    single_predictions = np.array([verdict[0] for verdict in single.score_cleaned(cleaned_texts)])
+    cascade_predictions = np.array([verdict[0] for verdict in cascade.score_cleaned(cleaned_texts)])
+    single_latencies = _latencies(single.score_cleaned, cleaned_texts)
+    cascade_latencies = _latencies(cascade.score_cleaned, cleaned_texts)
+
+    single_accuracy = float((single_predictions == labels).mean())
+    cascade_accuracy = float((cascade_predictions == labels).mean())
+    return {
+        'prefix_chars': first_stage.prefix_chars,
+        'low': first_stage.low,
+        'high': first_stage.high,
+        'test_samples': len(cleaned_texts),
+        'escalation_rate': round(escalated / len(cleaned_texts), 6),
+        'single_accuracy': round(single_accuracy, 6),
+        'cascade_accuracy': round(cascade_accuracy, 6),
+        'accuracy_change': round(cascade_accuracy - single_accuracy, 6),
+        'verdict_changes': int((single_predictions != cascade_predictions).sum()),
+        'single_mean_ms': round(single_latencies.mean() * 1000, 4),
+        'single_p99_ms': round(np.percentile(single_latencies, 99) * 1000, 4),
+        'cascade_mean_ms': round(cascade_latencies.mean() * 1000, 4),
+        'cascade_p99_ms': round(np.percentile(cascade_latencies, 99) * 1000, 4),
+    }
+
+def print_report(report):
+    print(f"🪜 Cascade (prefix {report['prefix_chars']} chars, bands "
+          f"{report['low']} / {report['high']}) on {report['test_samples']} hold-out emails")
+    print(f"   Escalated to the full model: {report['escalation_rate']:.1%}")
+    print(f"   Accuracy: single {report['single_accuracy']:.4f}, cascade "
+          f"{report['cascade_accuracy']:.4f} ({report['accuracy_change']:+.4f}, "
+          f"{report['verdict_changes']} verdicts changed)")
+    print(f"   Scoring latency per email (cleaning excluded): single mean "
+          f"{report['single_mean_ms']:.3f} ms / p99 {report['single_p99_ms']:.3f} ms, cascade mean "
+          f"{report['cascade_mean_ms']:.3f} ms / p99 {report['cascade_p99_ms']:.3f} ms")
+
+def main():
+    from corpus import HAM_FOLDERS, SPAM_FOLDERS, load_corpus
+    from corpus_dedup import split_corpus
+    from model_loader import load_model_pair
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--low', type=float, help='override the saved lower band')
+    parser.add_argument('--high', type=float, help='override the saved upper band')
+    args = parser.parse_args()
+
+    pair = load_model_pair(args.models_dir)
+    first_stage = load_first_stage(args.models_dir)
+    if pair is None or first_stage is None:
+        print(f"❌ Need a model and {CASCADE_FILENAME} in {args.models_dir}; run create_model.py first")
+        return 1
+    first_stage = first_stage.with_bands(args.low if args.low is not None else first_stage.low,
+                                         args.high if args.high is not None else first_stage.high)
+
+    # The same hold-out split as create_model.py
+    x, y = load_corpus(HAM_FOLDERS, SPAM_FOLDERS)
+    _, x_test, _, y_test, _ = split_corpus(x, y)
+    print_report(evaluate_cascade(first_stage, *pair, x_test, y_test))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+# compress_model.py - shrink a trained TF-IDF + LogisticRegression model
+"""Post-training compression of the spam model.
+
+Three steps, each checked against the held-out split create_model.py uses:
+
+1. stop_words_ is dropped. With 1-3-grams and max_features it holds every
+   n-gram that was cut, i.e. most of the pickled vectorizer, and sklearn
+   only keeps it for introspection.
+2. Features with the smallest |coef| are pruned from the vocabulary. The
+   largest prune that keeps held-out accuracy within --budget of the
+   original is chosen. Pruned terms also leave the L2 norm, so this is an
+   approximation and the budget is what bounds it.
+3. idf and coef are stored as float32 or float16 in the model artifact.
+   The vocabulary there is already a single sorted blob of terms, not a
+   pickled dict.
+
+The compressed pair is written as joblib pickles plus spam_model.artifact
+to --output-dir, and a before/after report of size, load time, RSS and
+accuracy is printed.
+
+    python compress_model.py
+    python compress_model.py --budget 0.002 --dtype float16 --output-dir models/compressed
+"""
+import argparse
+import copy
+import json
+import os
+import subprocess
+import sys
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+from corpus import HAM_FOLDERS, SPAM_FOLDERS, load_corpus
+from corpus_dedup import split_corpus
+from inference import _identity
+from model_artifact import ARTIFACT_FILENAME, write_artifact
+from model_loader import load_pickled_model
+
+DTYPES = {'float64': '<f8', 'float32': '<f4', 'float16': '<f2'}
+
+# Fractions of the features to try keeping, largest first
+KEEP_FRACTIONS = (1.0, 0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.25, 0.2, 0.15, 0.1, 0.05)
+
+def drop_stop_words(vectorizer):
+    """Copy of the vectorizer without the (large, introspection-only) stop_words_"""
+    vectorizer = copy.copy(vectorizer)
+    if hasattr(vectorizer, 'stop_words_'):
+        del vectorizer.stop_words_
+    return vectorizer
+
+def prune_pair(vectorizer, model, keep):
+    """Copies of the pair restricted to the feature indices in keep"""
+    keep = np.sort(np.asarray(keep))
+    terms = vectorizer.get_feature_names_out()[keep]
+
+    pruned_vectorizer = drop_stop_words(vectorizer)
+    # Terms stay in alphabetical order, so the feature order is what sklearn would build
+    pruned_vectorizer.vocabulary_ = {term: index for index, term in enumerate(terms)}
+    pruned_vectorizer.max_features = len(terms)
+    if vectorizer.use_idf:
+        pruned_vectorizer.idf_ = vectorizer.idf_[keep]
+
+    pruned_model = copy.copy(model)
+    pruned_model.coef_ = model.coef_[:, keep]
+    pruned_model.n_features_in_ = len(terms)
+    return pruned_vectorizer, pruned_model
+
+class HeldOutScorer:
+    """Scores pruned / quantized weight sets on pre-tokenized held-out emails"""
+
+    def __init__(self, vectorizer, model, cleaned_texts, labels):
+        counter = CountVectorizer(
+            preprocessor=_identity,
+            lowercase=vectorizer.lowercase,
+            stop_words=vectorizer.stop_words,
+            token_pattern=vectorizer.token_pattern,
+            ngram_range=vectorizer.ngram_range,
+            vocabulary=vectorizer.vocabulary_,
+            binary=vectorizer.binary,
+            dtype=np.float64,
+        )
+        self.counts = counter.transform(cleaned_texts).tocsc()
+        if vectorizer.sublinear_tf:
+            self.counts.data = np.log(self.counts.data) + 1
+        self.norm = vectorizer.norm
+        self.idf = vectorizer.idf_ if vectorizer.use_idf else np.ones(self.counts.shape[1])
+        self.coef = model.coef_[0]
+        self.intercept = float(model.intercept_[0])
+        self.labels = np.asarray(labels)
+
+    def accuracy(self, keep, dtype='<f8'):
+        idf = self.idf[keep].astype(dtype).astype(np.float64)
+        coef = self.coef[keep].astype(dtype).astype(np.float64)
+        features = self.counts[:, keep].multiply(idf).tocsr()
+        if self.norm:
+            features = normalize(features, norm=self.norm)
+        predictions = (features @ coef + self.intercept > 0).astype(int)
+        return float(np.mean(predictions == self.labels))
+
+def choose_features(scorer, budget, dtype):
+    """Smallest set of largest-|coef| features within the accuracy budget"""
+    order = np.argsort(-np.abs(scorer.coef), kind='stable')
+    baseline = scorer.accuracy(np.arange(len(order)))
+    best_keep = order
+    trials = []
+    for fraction in KEEP_FRACTIONS:
+        keep = np.sort(order[:max(1, int(round(len(order) * fraction)))])
+        accuracy = scorer.accuracy(keep, dtype)
+        trials.append({'fraction': fraction, 'features': len(keep), 'accuracy': accuracy})
+        if accuracy >= baseline - budget:
+            best_keep = keep
+        else:
+            break
+    return baseline, np.sort(best_keep), trials
+
+def _probe(kind, paths):
+    """Load time / RSS of one model format in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_artifact.py'),
+         '_probe', kind, *paths],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress a trained spam model")
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--output-dir', default=os.path.join('models', 'compressed'))
+    parser.add_argument('--budget', type=float, default=0.001,
+                        help='largest allowed drop in held-out accuracy')
+    parser.add_argument('--dtype', choices=sorted(DTYPES), default='float32')
+    args = parser.parse_args()
+    dtype = DTYPES[args.dtype]
+
+    pair = load_pickled_model(args.models_dir)
+    if pair is None:
+        print(f"❌ Could not load a pickled model from {args.models_dir}")
+        return 1
+    vectorizer, model = pair
+
+    texts, labels = load_corpus(HAM_FOLDERS, SPAM_FOLDERS)
+    # Same hold-out split as create_model.py
+    _, x_test, _, y_test, _ = split_corpus(texts, labels)
+    scorer = HeldOutScorer(vectorizer, model, x_test, y_test)
+    baseline, keep, trials = choose_features(scorer, args.budget, dtype)
+    for trial in trials:
+        print(f"✂️ keep {trial['fraction']:>5.0%} ({trial['features']:>5} features): "
+              f"accuracy {trial['accuracy']:.4f}")
+
+    compressed_vectorizer, compressed_model = prune_pair(vectorizer, model, keep)
+    compressed_model.coef_ = compressed_model.coef_.astype(dtype).astype(np.float64)
+    if compressed_vectorizer.use_idf:
+        compressed_vectorizer.idf_ = compressed_vectorizer.idf_.astype(dtype).astype(np.float64)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output = {
+        'model': os.path.join(args.output_dir, 'spam_model.joblib'),
+        'vectorizer': os.path.join(args.output_dir, 'tfidf_vectorizer.joblib'),
+        'artifact': os.path.join(args.output_dir, ARTIFACT_FILENAME),
+    }
+    joblib.dump(compressed_model, output['model'])
+    joblib.dump(compressed_vectorizer, output['vectorizer'])
+    write_artifact(output['artifact'], compressed_vectorizer, compressed_model, dtype=dtype)
+
+    # Before/after report, each load measured in a fresh interpreter
+    original = {
+        'model': os.path.join(args.models_dir, 'spam_model.joblib'),
+        'vectorizer': os.path.join(args.models_dir, 'tfidf_vectorizer.joblib'),
+        'artifact': os.path.join(args.models_dir, ARTIFACT_FILENAME),
+    }
+    compressed_accuracy = scorer.accuracy(keep, dtype)
+    rows = []
+    for label, paths, features, accuracy in (('before', original, len(scorer.coef), baseline),
+                                             ('after', output, len(keep), compressed_accuracy)):
+        pickle_kb = (os.path.getsize(paths['model']) + os.path.getsize(paths['vectorizer'])) / 1024
+        pickle_probe = _probe('pickle', [paths['model'], paths['vectorizer']])
+        row = {'variant': label, 'features': features, 'accuracy': accuracy,
+               'pickle_kb': pickle_kb, 'pickle_load_s': pickle_probe['load_seconds'],
+               'pickle_rss_mb': pickle_probe['rss_delta_mb'],
+               'artifact_kb': None, 'artifact_load_s': None, 'artifact_rss_mb': None}
+        if os.path.exists(paths['artifact']):
+            artifact_probe = _probe('artifact', [paths['artifact']])
+            row.update({'artifact_kb': os.path.getsize(paths['artifact']) / 1024,
+                        'artifact_load_s': artifact_probe['load_seconds'],
+                        'artifact_rss_mb': artifact_probe['rss_delta_mb']})
+        rows.append(row)
+
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else '-'
+
+    print(f"\n{'':<7} {'features':>8} {'accuracy':>9} {'pickle KB':>10} {'load s':>7} {'RSS +MB':>8} "
+          f"{'artifact KB':>12} {'load s':>7} {'RSS +MB':>8}")
+    for row in rows:
+        print(f"{row['variant']:<7} {row['features']:>8} {row['accuracy']:>9.4f} "
+              f"{row['pickle_kb']:>10.0f} {row['pickle_load_s']:>7.3f} {row['pickle_rss_mb']:>8.1f} "
+              f"{fmt(row['artifact_kb'], '12.0f'):>12} {fmt(row['artifact_load_s'], '7.3f'):>7} "
+              f"{fmt(row['artifact_rss_mb'], '8.1f'):>8}")
+
+    with open(os.path.join(args.output_dir, 'compression_report.json'), 'w') as f:
+        json.dump({'budget': args.budget, 'dtype': args.dtype, 'trials': trials, 'results': rows}, f, indent=2)
+    print(f"\n💾 Compressed model written to {args.output_dir}/ (copy its files into models/ to serve it)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
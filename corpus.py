@@ -0,0 +1,205 @@
+# corpus.py - parallel corpus loader with an incremental cleaned-text cache
+"""Load the training corpus as cleaned texts and labels.
+
+Files are read and cleaned with clean_email on a process pool, and the
+results are stored in a small SQLite database keyed by file path. Each
+row remembers the file's size and mtime, so on the next run only new or
+changed files are read again; rows for deleted files are dropped. The
+cleaned text is stored zlib-compressed.
+
+A retrain on an unchanged corpus therefore only lists the folders and
+stats each file. The training scripts fit their vectorizer on the cleaned
+texts with the preprocessor bypassed (see fit_on_cleaned), so nothing is
+cleaned twice.
+
+The cache is invalidated as a whole when the source of clean_email's
+module (inference.py, which holds its regexes), the body extractor or its
+settings change.
+Its location defaults to .cache/corpus.sqlite next to this file and can
+be overridden with SPAM_CORPUS_CACHE.
+
+    python corpus.py            # build / refresh the cache and print timings
+"""
+import hashlib
+import inspect
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import batch_featurizer
+import body_extractor
+from inference import _identity, clean_email
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'corpus.sqlite')
+
+# Files cleaned per pool task
+CHUNK_SIZE = 200
+
+# Default corpus layout under data/ (the folders both training scripts use)
+HAM_FOLDERS = [os.path.join('data', name) for name in
+               ('easy_ham_1', 'easy_ham_2', 'easy_ham_3', 'hard_ham_1', 'hard_ham_2')]
+SPAM_FOLDERS = [os.path.join('data', name) for name in
+                ('spam_1', 'spam_2', 'spam_3', 'spam_4')]
+
+def cleaner_fingerprint(cleaner=clean_email):
+    """Identifies the cleaning rules the cached texts were produced with"""
+    digest = hashlib.sha256(inspect.getsource(cleaner).encode('utf-8'))
+    # The cleaner's module holds the regex constants it applies
+    digest.update(inspect.getsource(inspect.getmodule(cleaner)).encode('utf-8'))
+    # clean_email starts with the body extractor, whose code and settings matter too
+    digest.update(inspect.getsource(body_extractor).encode('utf-8'))
+    digest.update(repr(tuple(body_extractor.DEFAULT_SETTINGS)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def _read_and_clean(paths):
+    """Pool task: [(path, size, mtime_ns, label), ...] -> rows (None text if unreadable)"""
+    rows = []
+    for path, size, mtime_ns, label in paths:
+        try:
+            with open(path, 'r', encoding='latin-1') as f:
+                cleaned = clean_email(f.read())
+            rows.append((path, size, mtime_ns, label, zlib.compress(cleaned.encode('utf-8'), 1)))
+        except Exception as e:
+            print(f"⚠️ Could not read file {path}: {e}")
+            rows.append((path, size, mtime_ns, label, None))
+    return rows
+
+class CorpusCache:
+    """SQLite store of cleaned email texts keyed by path, size and mtime"""
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get('SPAM_CORPUS_CACHE') or DEFAULT_CACHE_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS emails ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, label INTEGER, cleaned BLOB)')
+
+        fingerprint = cleaner_fingerprint()
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'cleaner'").fetchone()
+        if row is None or row[0] != fingerprint:
+            self.connection.execute('DELETE FROM emails')
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('cleaner', ?)", (fingerprint,))
+        self.connection.commit()
+
+    def entries(self):
+        """path -> (size, mtime_ns, label, compressed text)"""
+        return {path: (size, mtime_ns, label, cleaned) for path, size, mtime_ns, label, cleaned
+                in self.connection.execute('SELECT path, size, mtime_ns, label, cleaned FROM emails')}
+
+    def update(self, rows, removed_paths):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO emails (path, size, mtime_ns, label, cleaned) VALUES (?, ?, ?, ?, ?)',
+                rows)
+            self.connection.executemany('DELETE FROM emails WHERE path = ?',
+                                        [(path,) for path in removed_paths])
+
+    def close(self):
+        self.connection.close()
+
+def scan_folders(folders, label):
+    """[(path, size, mtime_ns, label), ...] for every file, in os.listdir order"""
+    files = []
+    for folder in folders:
+        if not os.path.exists(folder):
+            print(f"⚠️ Warning: Folder not found: {folder}")
+            continue
+        for filename in os.listdir(folder):
+            path = os.path.join(folder, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                files.append((os.path.abspath(path), stat.st_size, stat.st_mtime_ns, label))
+    return files
+
+def load_corpus(ham_folders, spam_folders, cache_path=None, workers=None):
+    """Return (cleaned_texts, labels) for the ham (0) and spam (1) folders
+
+    Texts come back in the same order the training scripts always used:
+    every ham folder, then every spam folder, files in os.listdir order.
+    """
+    start_time = time.perf_counter()
+    files = scan_folders(ham_folders, 0) + scan_folders(spam_folders, 1)
+
+    cache = CorpusCache(cache_path)
+    try:
+        cached = cache.entries()
+        stale = [entry for entry in files
+                 if cached.get(entry[0], (None, None, None))[:3] != entry[1:]]
+
+        fresh_rows = []
+        if stale:
+            print(f"🧹 Reading and cleaning {len(stale)} new or changed file(s)...")
+            chunks = [stale[i:i + CHUNK_SIZE] for i in range(0, len(stale), CHUNK_SIZE)]
+            if workers == 1 or len(chunks) == 1:
+                results = map(_read_and_clean, chunks)
+                fresh_rows = [row for rows in results for row in rows]
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    fresh_rows = [row for rows in pool.map(_read_and_clean, chunks) for row in rows]
+            for path, size, mtime_ns, label, cleaned in fresh_rows:
+                cached[path] = (size, mtime_ns, label, cleaned)
+
+        # Forget files that disappeared from the folders being loaded
+        seen = {entry[0] for entry in files}
+        prefixes = tuple(os.path.join(os.path.abspath(folder), '') for folder in ham_folders + spam_folders)
+        removed = [path for path in cached if path not in seen and path.startswith(prefixes)]
+        cache.update(fresh_rows, removed)
+    finally:
+        cache.close()
+
+    texts = []
+    labels = []
+    for path, _, _, label in files:
+        compressed = cached[path][3]
+        if compressed is None:
+            continue
+        texts.append(zlib.decompress(compressed).decode('utf-8'))
+        labels.append(label)
+
+    print(f"📚 Loaded {len(texts)} cleaned emails ({len(files) - len(stale)} from cache) "
+          f"in {time.perf_counter() - start_time:.2f}s")
+    return texts, labels
+
+def fit_on_cleaned(vectorizer, cleaned_texts):
+    """fit_transform on already-cleaned texts, keeping the vectorizer's preprocessor
+
+    The preprocessor (clean_email) is bypassed during the fit and put back
+    afterwards, so the saved vectorizer still cleans raw emails itself.
+    Word n-gram vectorizers are fitted with BatchFeaturizer, which gives
+    the same matrix and vocabulary as sklearn (SPAM_FEATURIZER=sklearn to
+    use sklearn's own loop).
+    """
+    preprocessor = vectorizer.preprocessor
+    vectorizer.preprocessor = _identity
+    try:
+        if batch_featurizer.use_for(vectorizer):
+            return batch_featurizer.BatchFeaturizer(vectorizer).fit_transform(cleaned_texts)
+        return vectorizer.fit_transform(cleaned_texts)
+    finally:
+        vectorizer.preprocessor = preprocessor
+
+def transform_cleaned(vectorizer, cleaned_texts):
+    """transform already-cleaned texts with the preprocessor bypassed"""
+    preprocessor = vectorizer.preprocessor
+    vectorizer.preprocessor = _identity
+    try:
+        if batch_featurizer.use_for(vectorizer):
+            return batch_featurizer.BatchFeaturizer(vectorizer).transform(cleaned_texts)
+        return vectorizer.transform(cleaned_texts)
+    finally:
+        vectorizer.preprocessor = preprocessor
+
+if __name__ == '__main__':
+    texts, labels = load_corpus(HAM_FOLDERS, SPAM_FOLDERS)
+    print(f"✅ Ham: {labels.count(0)}, Spam: {labels.count(1)}")
+    sys.exit(0 if texts else 1)
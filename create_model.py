@@ -1,36 +1,15 @@
 import os
 import sys
-import re
 import pickle
+from corpus import fit_on_cleaned, load_corpus, transform_cleaned
+from corpus_dedup import print_report as print_dedup_report, split_corpus
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
 
 # Get the current directory
 current_dir = os.path.dirname(os.path.abspath(__file__))
 print(f"Current directory: {current_dir}")
 
-# Function to load emails
-def load_emails_from_folder(folder_list):
-    emails = []
-    for folder_path in folder_list:
-        full_path = os.path.join(current_dir, folder_path)
-        print(f"Looking for folder: {full_path}")
-        
-        if not os.path.exists(full_path):
-            print(f"⚠️ Warning: Folder not found: {full_path}")
-            continue
-            
-        for filename in os.listdir(full_path):
-            filepath = os.path.join(full_path, filename)
-            if os.path.isfile(filepath):
-                try:
-                    with open(filepath, 'r', encoding='latin-1') as file:
-                        emails.append(file.read())
-                except Exception as e:
-                    print(f"⚠️ Could not read file {filepath}: {e}")
-    return emails
-
 # Define folder paths (relative to current directory)
 ham_folders = [
     os.path.join('data', 'easy_ham_1'),
@@ -47,15 +26,17 @@ spam_folders = [
     os.path.join('data', 'spam_4')
 ]
 
+# Emails are read and cleaned in parallel and cached between runs (see corpus.py)
 print("Loading emails...")
-ham_emails = load_emails_from_folder(ham_folders)
-spam_emails = load_emails_from_folder(spam_folders)
-
-x = ham_emails + spam_emails
-y = [0] * len(ham_emails) + [1] * len(spam_emails)
+x, y = load_corpus(
+    [os.path.join(current_dir, folder) for folder in ham_folders],
+    [os.path.join(current_dir, folder) for folder in spam_folders]
+)
+ham_count = y.count(0)
+spam_count = y.count(1)
 
-print("✅ Total Ham:", len(ham_emails))
-print("✅ Total Spam:", len(spam_emails))
+print("✅ Total Ham:", ham_count)
+print("✅ Total Spam:", spam_count)
 print("✅ Total Emails:", len(x))
 
 # Check if we have data
@@ -67,33 +48,20 @@ if len(x) == 0:
     print("- spam_1, spam_2, spam_3, spam_4")
     sys.exit(1)
 
-# Train-Test Split
+# Train-Test Split: exact duplicates removed and near-duplicate groups kept
+# on one side, so the hold-out set does not repeat training emails
+# (see corpus_dedup.py; SPAM_DEDUP=0 for the plain random split)
 print("\nSplitting data...")
-x_train, x_test, y_train, y_test = train_test_split(
-    x, y, random_state=42, test_size=0.2, stratify=y
-)
+x_train, x_test, y_train, y_test, dedup_report = split_corpus(x, y)
+if dedup_report is not None:
+    print_dedup_report(dedup_report)
 
 print(f'Training samples: {len(x_train)}')
 print(f'Testing samples: {len(x_test)}')
 
-# Data Preparation Pipeline
-def clean_email(text):
-    """Clean email text"""
-    try:
-        # Split to remove headers (after first \n\n)
-        parts = text.split('\n\n', 1)
-        if len(parts) > 1:
-            text = parts[1]
-        else:
-            text = parts[0]
-            
-        text = text.lower()
-        text = re.sub(r'http\S+', 'URL', text)
-        text = re.sub(r'\d+', 'NUMBER', text)
-        text = re.sub(r'[^\w\s]', '', text)
-        return text
-    except:
-        return text.lower()  # Fallback
+# Data Preparation Pipeline: the same MIME-aware body extraction and cleaning
+# rules the app serves with (inference.clean_email, see body_extractor.py)
+from inference import clean_email
 
 # Create TF-IDF Vectorizer
 print("\nCreating TF-IDF features...")
@@ -106,8 +74,9 @@ tfidf = TfidfVectorizer(
     token_pattern=r'\b[a-zA-Z]{2,}\b'
 )
 
-x_train_tfvec = tfidf.fit_transform(x_train)
-x_test_tfvec = tfidf.transform(x_test)
+# x is already cleaned, so fit without re-running the preprocessor
+x_train_tfvec = fit_on_cleaned(tfidf, x_train)
+x_test_tfvec = transform_cleaned(tfidf, x_test)
 
 print(f"Feature vector shape: {x_train_tfvec.shape}")
 
@@ -131,6 +100,27 @@ print(classification_report(y_test, y_pred))
 print("\nConfusion Matrix:")
 print(confusion_matrix(y_test, y_pred))
 
+# Cheap first stage of the confidence-gated cascade (unigrams over a prefix
+# of the cleaned body, see cascade.py), evaluated on the same hold-out split
+from cascade import (CASCADE_FILENAME, DEFAULT_HIGH, DEFAULT_LOW, DEFAULT_PREFIX_CHARS,
+                     evaluate_cascade, fit_first_stage, print_report)
+
+print("\nTraining cascade first stage...")
+first_stage = fit_first_stage(
+    x_train, y_train,
+    prefix_chars=int(os.environ.get('SPAM_CASCADE_PREFIX_CHARS', DEFAULT_PREFIX_CHARS)),
+    low=float(os.environ.get('SPAM_CASCADE_LOW', DEFAULT_LOW)),
+    high=float(os.environ.get('SPAM_CASCADE_HIGH', DEFAULT_HIGH))
+)
+cascade_report = evaluate_cascade(first_stage, tfidf, lr_model, x_test, y_test)
+print_report(cascade_report)
+
+# stop_words_ only exists for introspection and holds every n-gram cut by
+# max_features - most of the pickled vectorizer. Further pruning and
+# reduced-precision weights: python compress_model.py
+if hasattr(tfidf, 'stop_words_'):
+    del tfidf.stop_words_
+
 # Save the model and vectorizer
 print("\nSaving model and vectorizer...")
 try:
@@ -153,15 +143,26 @@ try:
     except:
         print("⚠️ joblib not available, using pickle only")
     
+    # Compact, memory-mappable artifact loaded by app.py in preference to the pickles
+    from model_artifact import ARTIFACT_FILENAME, write_artifact
+    write_artifact(ARTIFACT_FILENAME, tfidf, lr_model)
+    print(f"✅ Model artifact saved as '{ARTIFACT_FILENAME}'")
+    
+    # Served when SPAM_CASCADE=1
+    first_stage.save(CASCADE_FILENAME)
+    print(f"✅ Cascade first stage saved as '{CASCADE_FILENAME}'")
+    
     # Save some metadata
     model_info = {
         'accuracy': float(accuracy),
         'training_samples': len(x_train),
         'test_samples': len(x_test),
         'total_samples': len(x),
-        'ham_samples': len(ham_emails),
-        'spam_samples': len(spam_emails),
-        'feature_count': x_train_tfvec.shape[1]
+        'ham_samples': ham_count,
+        'spam_samples': spam_count,
+        'feature_count': x_train_tfvec.shape[1],
+        'dedup': dedup_report,
+        'cascade': cascade_report
     }
     
     with open('model_info.json', 'w') as f:
@@ -175,6 +176,8 @@ except Exception as e:
 print("\n" + "="*50)
 print("TRAINING COMPLETE!")
 print("="*50)
+print("\nTo prune and shrink the model, run:")
+print("python compress_model.py")
 print("\nTo test the model, run:")
 print("python test_model.py")
 print("\nTo start the web app, run:")
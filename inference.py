@@ -0,0 +1,323 @@
+# inference.py - single-pass inference pipeline used by the web app
+import copy
+import hashlib
+import heapq
+import re
+import time
+
+import numpy as np
+
+from body_extractor import extract_body
+from linear_scorer import compile_linear_scorer
+from prediction_cache import make_cache_key
+
+# Precompiled cleaning patterns (same rules as the training preprocessor)
+URL_PATTERN = re.compile(r'http\S+')
+NUMBER_PATTERN = re.compile(r'\d+')
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+
+def clean_email(text):
+    """Clean email text - MUST MATCH THE TRAINING PREPROCESSOR"""
+    try:
+        # Headers removed, MIME text parts decoded, size bounded
+        text = extract_body(text).text
+
+        text = text.lower()
+        text = URL_PATTERN.sub('URL', text)
+        text = NUMBER_PATTERN.sub('NUMBER', text)
+        text = PUNCTUATION_PATTERN.sub('', text)
+        return text
+    except Exception as e:
+        print(f"Warning in clean_email: {e}")
+        return text.lower() if text else ""
+
+def _identity(text):
+    return text
+
+def cleaned_text_vectorizer(vectorizer):
+    """The vectorizer as it applies to already-cleaned texts
+
+    A copy with the preprocessor (clean_email in the saved vectorizers)
+    bypassed, or the vectorizer itself when it has none.
+    """
+    if getattr(vectorizer, 'preprocessor', None) is None:
+        return vectorizer
+    vectorizer = copy.copy(vectorizer)
+    vectorizer.preprocessor = _identity
+    return vectorizer
+
+def top_contributions(contributions, top_k):
+    """Explanation dict from [(term, contribution)]: the top_k terms each way
+
+    Ties (within float noise) are broken by term, so the sparse and fused
+    scoring paths list the same terms.
+    """
+    contributions = [(term, float(value)) for term, value in contributions]
+    spam = heapq.nsmallest(top_k, (item for item in contributions if item[1] > 0),
+                           key=lambda item: (-round(item[1], 12), item[0]))
+    ham = heapq.nsmallest(top_k, (item for item in contributions if item[1] < 0),
+                          key=lambda item: (round(item[1], 12), item[0]))
+    return {
+        'spam': [{'term': term, 'weight': round(value, 6)} for term, value in spam],
+        'ham': [{'term': term, 'weight': round(value, 6)} for term, value in ham],
+    }
+
+def model_fingerprint(vectorizer, model):
+    """Short content hash identifying a fitted vectorizer/model pair.
+
+    The same pair loaded from pickles or from the artifact gets the same
+    fingerprint, so it can be used as the model version.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{type(vectorizer).__name__}/{type(model).__name__}".encode('utf-8'))
+    for name in ('coef_', 'intercept_', 'classes_', 'feature_log_prob_', 'class_log_prior_'):
+        if hasattr(model, name):
+            digest.update(np.ascontiguousarray(getattr(model, name), dtype=np.float64).tobytes())
+    if hasattr(vectorizer, 'idf_'):
+        digest.update(np.ascontiguousarray(vectorizer.idf_, dtype=np.float64).tobytes())
+    vocabulary = getattr(vectorizer, 'vocabulary_', None)
+    if vocabulary:
+        terms = sorted(vocabulary, key=vocabulary.get)
+        digest.update('\n'.join(terms).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+class InferencePipeline:
+    """Cleaner, vectorizer and model for one loaded model version.
+
+    Each email is cleaned exactly once. The vectorizers saved by
+    create_model.py / train_model.py carry clean_email as their
+    preprocessor, so the pipeline scores through a copy of the vectorizer
+    with that preprocessor bypassed - the text the model sees is the same
+    text it was trained on. Labels are derived from a single probability
+    call instead of separate predict / predict_proba passes.
+
+    When the model is a binary LogisticRegression over a TfidfVectorizer,
+    score() uses the fused LinearScorer instead of sklearn. With a
+    PredictionCache attached, results are looked up by cleaned body and
+    model version before anything is scored; with a CampaignIndex attached,
+    near-duplicates of recent confident verdicts reuse those verdicts. With
+    a ServiceMetrics attached, the clean / vectorize / score stages of every
+    call are timed. With a cascade FirstStage attached (see cascade.py),
+    only the emails it is not confident about reach the full model.
+
+    explain() scores like score() and also returns the n-grams that pushed
+    each verdict toward spam and toward ham, read off the same feature
+    vector the prediction used. It always scores with the full model.
+    """
+
+    def __init__(self, vectorizer, model, cleaner=clean_email, cache=None,
+                 campaign_index=None, metrics=None, first_stage=None):
+        self.vectorizer = vectorizer
+        self.model = model
+        self.cleaner = cleaner
+        self.cache = cache
+        self.campaign_index = campaign_index
+        self.metrics = metrics
+        self.first_stage = first_stage
+        self.version = model_fingerprint(vectorizer, model)
+        if first_stage is not None:
+            # Cascade verdicts differ from the full model's, so they are cached apart
+            self.version = hashlib.sha256(
+                f"{self.version}/{first_stage.version}".encode('utf-8')).hexdigest()[:16]
+
+        self._vectorizer = cleaned_text_vectorizer(vectorizer)
+
+        # Fused featurize-and-score fast path, used when the model is linear
+        self.scorer = compile_linear_scorer(vectorizer, model)
+        self._feature_names = None
+
+    def clean(self, email_text):
+        return self.cleaner(email_text)
+
+    def vectorize(self, cleaned_texts):
+        """Turn already-cleaned texts into a sparse feature matrix"""
+        return self._vectorizer.transform(cleaned_texts)
+
+    def predict_proba(self, email_vecs):
+        """Return (predictions, [[ham_prob, spam_prob], ...]) for a feature matrix"""
+        if hasattr(self.model, 'predict_proba'):
+            probabilities = self.model.predict_proba(email_vecs)
+            predictions = self.model.classes_[probabilities.argmax(axis=1)]
+        elif hasattr(self.model, 'decision_function'):
+            # Convert decision scores to probability-like values
+            decisions = np.ravel(self.model.decision_function(email_vecs))
+            ham_probs = np.clip(100 - (decisions * 10), 0, 100) / 100
+            probabilities = np.column_stack([ham_probs, 1 - ham_probs])
+            predictions = (decisions > 0).astype(int)
+        else:
+            predictions = self.model.predict(email_vecs)
+            probabilities = np.full((len(predictions), 2), 0.5)
+        return predictions, probabilities
+
+    def score(self, email_texts):
+        """Clean, vectorize and score raw emails in one pass.
+
+        Returns a list of (prediction, [ham_prob, spam_prob]) tuples in
+        input order.
+        """
+        start = time.perf_counter()
+        cleaned_texts = [self.cleaner(text) for text in email_texts]
+        if self.metrics is not None:
+            self.metrics.observe_stage('clean', time.perf_counter() - start)
+        if self.cache is None and self.campaign_index is None:
+            return self.score_cleaned(cleaned_texts)
+
+        # Look up every distinct body once; score only the misses
+        results = [None] * len(cleaned_texts)
+        pending = {}     # cleaned text -> indices still to be scored
+        signatures = {}  # cleaned text -> campaign signature
+        for index, text in enumerate(cleaned_texts):
+            if text in pending:
+                pending[text].append(index)
+                continue
+            verdict = self._lookup(text, signatures)
+            if verdict is not None:
+                results[index] = verdict
+            else:
+                pending[text] = [index]
+
+        if pending:
+            texts = list(pending)
+            for text, (prediction, proba) in zip(texts, self.score_cleaned(texts)):
+                self._remember(text, (prediction, proba), signatures.get(text))
+                for index in pending[text]:
+                    results[index] = (prediction, list(proba))
+        return results
+
+    def _lookup(self, cleaned_text, signatures):
+        """Return a cached or near-duplicate verdict for a cleaned body, or None"""
+        key = None
+        if self.cache is not None:
+            key = make_cache_key(cleaned_text, self.version)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached[0], list(cached[1])
+
+        if self.campaign_index is not None:
+            signature = self.campaign_index.signature(cleaned_text)
+            verdict = self.campaign_index.lookup(cleaned_text, signature)
+            if verdict is not None:
+                if key is not None:
+                    self.cache.put(key, [verdict[0], verdict[1]])
+                return verdict[0], list(verdict[1])
+            signatures[cleaned_text] = signature
+        return None
+
+    def _remember(self, cleaned_text, verdict, signature=None):
+        if self.cache is not None:
+            self.cache.put(make_cache_key(cleaned_text, self.version), [verdict[0], verdict[1]])
+        if self.campaign_index is not None and signature is not None:
+            self.campaign_index.add(cleaned_text, verdict, signature)
+
+    def score_cleaned(self, cleaned_texts):
+        """Score already-cleaned texts, bypassing the cache"""
+        if self.first_stage is not None:
+            return self._score_cascade(cleaned_texts)
+        return self._score_full(cleaned_texts)
+
+    def _score_cascade(self, cleaned_texts):
+        """First stage for every text, the full model only for the uncertain ones"""
+        start = time.perf_counter()
+        results = self.first_stage.decide(cleaned_texts)
+        escalated = [index for index, verdict in enumerate(results) if verdict is None]
+        if self.metrics is not None:
+            self.metrics.observe_stage('first_stage', time.perf_counter() - start)
+            decided = len(cleaned_texts) - len(escalated)
+            self.metrics.emails_scored.inc(amount=decided)
+            self.metrics.cascade_emails.inc('first_stage', amount=decided)
+            self.metrics.cascade_emails.inc('escalated', amount=len(escalated))
+        if escalated:
+            verdicts = self._score_full([cleaned_texts[index] for index in escalated])
+            for index, verdict in zip(escalated, verdicts):
+                results[index] = verdict
+        return results
+
+    def _score_full(self, cleaned_texts):
+        """Score cleaned texts with the full model"""
+        if self.metrics is not None:
+            return self._score_cleaned_timed(cleaned_texts)
+        if self.scorer is not None:
+            return [self.scorer.score(text) for text in cleaned_texts]
+
+        predictions, probabilities = self.predict_proba(self.vectorize(cleaned_texts))
+        return [(int(prediction), [float(p) for p in proba])
+                for prediction, proba in zip(predictions, probabilities)]
+
+    def _score_cleaned_timed(self, cleaned_texts):
+        """score_cleaned() with the vectorize and score stages timed separately"""
+        start = time.perf_counter()
+        if self.scorer is not None:
+            features = [self.scorer.count_terms(text) for text in cleaned_texts]
+        else:
+            features = self.vectorize(cleaned_texts)
+        vectorized = time.perf_counter()
+
+        if self.scorer is not None:
+            results = [self.scorer.score_counts(counts) for counts in features]
+        else:
+            predictions, probabilities = self.predict_proba(features)
+            results = [(int(prediction), [float(p) for p in proba])
+                       for prediction, proba in zip(predictions, probabilities)]
+
+        self.metrics.observe_stage('vectorize', vectorized - start)
+        self.metrics.observe_stage('score', time.perf_counter() - vectorized)
+        self.metrics.emails_scored.inc(amount=len(cleaned_texts))
+        return results
+
+    def explain(self, email_texts, top_k=10):
+        """Score raw emails and explain each verdict.
+
+        Returns (prediction, [ham_prob, spam_prob], explanation) tuples in
+        input order. The explanation lists the top_k n-grams by their
+        contribution to the decision value in each direction. It is None
+        for models that are not linear over named features. Each
+        contribution is tf-idf value * coefficient for the n-grams present,
+        so the work is proportional to the row's non-zeros. The cache is
+        bypassed because a cached verdict has no feature vector to explain.
+        """
+        start = time.perf_counter()
+        cleaned_texts = [self.cleaner(text) for text in email_texts]
+        if self.metrics is not None:
+            self.metrics.observe_stage('clean', time.perf_counter() - start)
+
+        if self.scorer is not None:
+            results = []
+            for text in cleaned_texts:
+                counts = self.scorer.count_terms(text)
+                prediction, proba = self.scorer.score_counts(counts)
+                results.append((prediction, proba,
+                                top_contributions(self.scorer.term_contributions(counts), top_k)))
+        else:
+            results = self._explain_sparse(self.vectorize(cleaned_texts).tocsr(), top_k)
+        if self.metrics is not None:
+            self.metrics.emails_scored.inc(amount=len(cleaned_texts))
+        return results
+
+    def _explain_sparse(self, features, top_k):
+        """explain() for a feature matrix: each CSR row times the coefficients"""
+        predictions, probabilities = self.predict_proba(features)
+        coef = getattr(self.model, 'coef_', None)
+        names = self._get_feature_names() if coef is not None and coef.shape[0] == 1 else None
+        results = []
+        for row, (prediction, proba) in enumerate(zip(predictions, probabilities)):
+            explanation = None
+            if names is not None:
+                row_start, row_end = features.indptr[row], features.indptr[row + 1]
+                indices = features.indices[row_start:row_end]
+                values = features.data[row_start:row_end] * coef[0, indices]
+                explanation = top_contributions(zip(names[indices], values), top_k)
+            results.append((int(prediction), [float(p) for p in proba], explanation))
+        return results
+
+    def _get_feature_names(self):
+        # HashingVectorizer features have no names to report
+        if self._feature_names is None and hasattr(self.vectorizer, 'get_feature_names_out'):
+            try:
+                self._feature_names = self.vectorizer.get_feature_names_out()
+            except Exception:
+                return None
+        return self._feature_names
+
+    def classify(self, email_text):
+        """Score a single raw email, returning (prediction, [ham_prob, spam_prob])"""
+        return self.score([email_text])[0]
@@ -0,0 +1,277 @@
+# linear_scorer.py - fused featurize-and-score fast path for linear models
+"""Compile a fitted TfidfVectorizer + binary LogisticRegression into a flat
+n-gram -> (idf, coef) lookup and score emails without building a sparse
+matrix.
+
+For a linear model the decision value is just the dot product of the
+(L2-normalised) tf-idf vector with the coefficients, so the scorer counts
+the vocabulary n-grams while it tokenizes and then accumulates
+tf * idf * coef and the squared norm in one pass over the hits.
+
+Run as a script to check parity against sklearn on the whole data/ corpus:
+
+    python linear_scorer.py --check
+"""
+import argparse
+import math
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+class LinearScorer:
+    """Fused tokenizer + linear scorer for one compiled model"""
+
+    def __init__(self, vocabulary, idf, coef, intercept, token_pattern,
+                 ngram_range=(1, 1), stop_words=None, lowercase=False,
+                 norm='l2', sublinear_tf=False, binary=False, classes=(0, 1)):
+        if norm not in ('l2', None):
+            raise ValueError(f"Unsupported norm for fast scoring: {norm!r}")
+
+        # Flat lookup: n-gram -> (idf, coef)
+        self.weights = {
+            term: (float(idf[index]), float(coef[index]))
+            for term, index in vocabulary.items()
+        }
+        # Tokens that appear in at least one vocabulary n-gram; longer
+        # n-grams containing any other token can be skipped without joining
+        self.known_tokens = frozenset(
+            token for term in vocabulary for token in term.split(' ')
+        )
+        self.intercept = float(intercept)
+        self.tokenize = re.compile(token_pattern).findall
+        self.min_n, self.max_n = ngram_range
+        self.stop_words = frozenset(stop_words) if stop_words else None
+        self.lowercase = lowercase
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+        self.binary = binary
+        self.classes = tuple(int(c) for c in classes)
+
+    @classmethod
+    def from_sklearn(cls, vectorizer, model):
+        """Compile a fitted TfidfVectorizer / LogisticRegression pair.
+
+        Raises ValueError when the pair uses features the fast path does not
+        reproduce exactly (custom analyzers, multi-class models, ...).
+        """
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+
+        if not isinstance(vectorizer, TfidfVectorizer):
+            raise ValueError(f"Unsupported vectorizer: {type(vectorizer).__name__}")
+        if not isinstance(model, LogisticRegression):
+            raise ValueError(f"Unsupported model: {type(model).__name__}")
+        if len(model.classes_) != 2 or model.coef_.shape[0] != 1:
+            raise ValueError("Fast scoring only supports binary models")
+        if vectorizer.analyzer != 'word' or vectorizer.tokenizer is not None:
+            raise ValueError("Fast scoring only supports the default word analyzer")
+        if vectorizer.preprocessor is None and vectorizer.strip_accents is not None:
+            raise ValueError("Fast scoring does not support strip_accents")
+
+        idf = vectorizer.idf_ if vectorizer.use_idf else np.ones(len(vectorizer.vocabulary_))
+        return cls(
+            vocabulary=vectorizer.vocabulary_,
+            idf=idf,
+            coef=model.coef_[0],
+            intercept=model.intercept_[0],
+            token_pattern=vectorizer.token_pattern,
+            ngram_range=vectorizer.ngram_range,
+            stop_words=vectorizer.get_stop_words(),
+            # A custom preprocessor (clean_email) replaces sklearn's
+            # lowercasing; InferencePipeline has already applied it
+            lowercase=vectorizer.preprocessor is None and vectorizer.lowercase,
+            norm=vectorizer.norm,
+            sublinear_tf=vectorizer.sublinear_tf,
+            binary=vectorizer.binary,
+            classes=model.classes_,
+        )
+
+    def count_terms(self, cleaned_text):
+        """Count vocabulary n-grams in a cleaned email (same n-grams as sklearn)"""
+        if self.lowercase:
+            cleaned_text = cleaned_text.lower()
+        tokens = self.tokenize(cleaned_text)
+        if self.stop_words is not None:
+            stop_words = self.stop_words
+            tokens = [token for token in tokens if token not in stop_words]
+
+        weights = self.weights
+        counts = {}
+        n_tokens = len(tokens)
+
+        if self.min_n == 1:
+            for token in tokens:
+                if token in weights:
+                    counts[token] = counts.get(token, 0) + 1
+
+        if self.max_n > 1:
+            # known_run[i]: number of consecutive known tokens starting at i
+            known_tokens = self.known_tokens
+            known_run = [0] * (n_tokens + 1)
+            for i in range(n_tokens - 1, -1, -1):
+                if tokens[i] in known_tokens:
+                    known_run[i] = known_run[i + 1] + 1
+            for n in range(max(self.min_n, 2), min(self.max_n, n_tokens) + 1):
+                for i in range(n_tokens - n + 1):
+                    if known_run[i] < n:
+                        continue
+                    term = ' '.join(tokens[i:i + n])
+                    if term in weights:
+                        counts[term] = counts.get(term, 0) + 1
+        return counts
+
+    def decision_function(self, cleaned_text):
+        """Return the linear decision value for one cleaned email"""
+        return self.decision_from_counts(self.count_terms(cleaned_text))
+
+    def decision_from_counts(self, counts):
+        """Linear decision value for the n-gram counts from count_terms()"""
+        weights = self.weights
+        dot = 0.0
+        squared_norm = 0.0
+        for term, tf in counts.items():
+            if self.binary:
+                tf = 1
+            elif self.sublinear_tf:
+                tf = math.log(tf) + 1
+            idf, coef = weights[term]
+            weight = tf * idf
+            dot += weight * coef
+            squared_norm += weight * weight
+
+        if self.norm == 'l2' and squared_norm > 0:
+            dot /= math.sqrt(squared_norm)
+        return dot + self.intercept
+
+    def term_contributions(self, counts):
+        """[(term, share of the decision value)] for the n-gram counts from count_terms()
+
+        The shares are tf-idf weight * coef after normalisation, so they sum
+        to decision_from_counts(counts) - intercept.
+        """
+        weights = self.weights
+        contributions = []
+        squared_norm = 0.0
+        for term, tf in counts.items():
+            if self.binary:
+                tf = 1
+            elif self.sublinear_tf:
+                tf = math.log(tf) + 1
+            idf, coef = weights[term]
+            weight = tf * idf
+            contributions.append((term, weight * coef))
+            squared_norm += weight * weight
+
+        if self.norm == 'l2' and squared_norm > 0:
+            scale = 1.0 / math.sqrt(squared_norm)
+            contributions = [(term, value * scale) for term, value in contributions]
+        return contributions
+
+    def score(self, cleaned_text):
+        """Return (prediction, [ham_prob, spam_prob]) for one cleaned email"""
+        return self.score_counts(self.count_terms(cleaned_text))
+
+    def score_counts(self, counts):
+        """score() for n-gram counts already produced by count_terms()"""
+        decision = self.decision_from_counts(counts)
+        # Numerically stable sigmoid
+        if decision >= 0:
+            spam_prob = 1.0 / (1.0 + math.exp(-decision))
+        else:
+            exp_decision = math.exp(decision)
+            spam_prob = exp_decision / (1.0 + exp_decision)
+        ham_prob = 1.0 - spam_prob
+        prediction = self.classes[1] if spam_prob > ham_prob else self.classes[0]
+        return prediction, [ham_prob, spam_prob]
+
+def compile_linear_scorer(vectorizer, model):
+    """Return a LinearScorer for the pair, or None if it is not supported"""
+    try:
+        return LinearScorer.from_sklearn(vectorizer, model)
+    except (ValueError, AttributeError, ImportError):
+        return None
+
+def iter_corpus_files(data_dir):
+    """Yield every email file under the data/ folders"""
+    for folder in sorted(os.listdir(data_dir)):
+        folder_path = os.path.join(data_dir, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for filename in sorted(os.listdir(folder_path)):
+            filepath = os.path.join(folder_path, filename)
+            if os.path.isfile(filepath):
+                yield filepath
+
+def check_parity(vectorizer, model, data_dir, tolerance=1e-9):
+    """Compare the fast path with sklearn on every email in data_dir"""
+    from inference import InferencePipeline, clean_email, cleaned_text_vectorizer
+
+    pipeline = InferencePipeline(vectorizer, model)
+    scorer = LinearScorer.from_sklearn(vectorizer, model)
+
+    files = list(iter_corpus_files(data_dir))
+    cleaned_texts = []
+    for filepath in files:
+        with open(filepath, 'r', encoding='latin-1') as f:
+            cleaned_texts.append(clean_email(f.read()))
+
+    # The baseline is sklearn's own transform, whatever the pipeline vectorizes with
+    sklearn_vectorizer = cleaned_text_vectorizer(vectorizer)
+    start = time.perf_counter()
+    sklearn_predictions, sklearn_probs = pipeline.predict_proba(
+        sklearn_vectorizer.transform(cleaned_texts))
+    sklearn_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast_results = [scorer.score(text) for text in cleaned_texts]
+    fast_time = time.perf_counter() - start
+
+    max_diff = 0.0
+    label_mismatches = []
+    for filepath, expected_label, expected_probs, (label, probs) in zip(
+            files, sklearn_predictions, sklearn_probs, fast_results):
+        max_diff = max(max_diff, abs(probs[1] - expected_probs[1]))
+        if label != expected_label:
+            label_mismatches.append(filepath)
+
+    print(f"📧 Emails checked: {len(files)}")
+    print(f"📊 Max spam probability difference: {max_diff:.3e} (tolerance {tolerance:.0e})")
+    print(f"📊 Label mismatches: {len(label_mismatches)}")
+    for filepath in label_mismatches[:10]:
+        print(f"   - {filepath}")
+    print(f"⏱️ sklearn transform + predict_proba: {sklearn_time:.2f}s")
+    print(f"⏱️ fused fast path: {fast_time:.2f}s ({sklearn_time / fast_time:.1f}x)")
+    return max_diff <= tolerance and not label_mismatches
+
+def main():
+    import joblib
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--check', action='store_true',
+                        help='check parity against sklearn on the data/ corpus')
+    parser.add_argument('--vectorizer', default=os.path.join('models', 'tfidf_vectorizer.joblib'))
+    parser.add_argument('--model', default=os.path.join('models', 'spam_model.joblib'))
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--tolerance', type=float, default=1e-9)
+    args = parser.parse_args()
+
+    if not args.check:
+        parser.print_help()
+        return 0
+
+    from model_loader import provide_legacy_pickle_names
+
+    provide_legacy_pickle_names()
+    vectorizer = joblib.load(args.vectorizer)
+    model = joblib.load(args.model)
+    if check_parity(vectorizer, model, args.data_dir, args.tolerance):
+        print("✅ Fast path matches sklearn")
+        return 0
+    print("❌ Fast path does not match sklearn")
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,634 @@
+# mail_listener.py - SMTP/LMTP content filter hop that scores and tags mail in transit
+"""Score mail handed over by an MTA over SMTP or LMTP.
+
+An asyncio server speaks enough ESMTP (RFC 5321 with PIPELINING, SIZE and
+8BITMIME) or LMTP (RFC 2033) to sit behind an MTA as a content filter.
+Messages are scored with the model app.py serves - app.py is imported, so
+models/, the prediction cache, the cascade and hot reload all apply - and
+then either rejected (spam probability at or above --reject-threshold) or
+tagged with X-Spam-Flag / X-Spam-Score / X-Spam-Status headers and relayed
+over SMTP to --next-hop. X-Spam-* headers already on the message are
+dropped first, so senders cannot forge a verdict.
+
+Sessions only wait on the network; cleaning and scoring run on a thread
+pool. Messages that arrive while the pool is busy are scored together in
+one pipeline.score call, so throughput grows with the number of concurrent
+sessions. Replies to pipelined commands are written in one go. The reply
+to DATA is only sent once the next hop has accepted the message; relay
+failures answer 451 so the MTA keeps the message and retries.
+
+With Postfix as an after-queue content filter:
+
+    python mail_listener.py --port 10025 --next-hop 127.0.0.1:10026
+    python mail_listener.py --lmtp --port 2424 --next-hop 127.0.0.1:10026 --reject-threshold 0.99
+
+SIGHUP reloads the model, SIGTERM stops accepting and lets open sessions
+finish (up to --graceful-timeout). --workers forks listeners sharing the
+socket, like serve.py. Without --next-hop messages are scored and
+discarded, which is what benchmarks/mail_listener_bench.py measures.
+"""
+import argparse
+import asyncio
+import functools
+import gc
+import os
+import re
+import signal
+import smtplib
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+READ_SIZE = 65536
+
+# Longest command line accepted (RFC 5321 asks for at least 512)
+MAX_LINE_BYTES = 4096
+
+SPAM_HEADERS = (b'x-spam-flag', b'x-spam-score', b'x-spam-status')
+
+_PATH = re.compile(r'^(FROM|TO):\s*(?:<([^>]*)>|(\S+))\s*(.*)$', re.IGNORECASE)
+
+def parse_path(argument, keyword):
+    """(address, {PARAM: value}) from 'FROM:<a@b> SIZE=10'; address None on a syntax error"""
+    match = _PATH.match(argument)
+    if match is None or match.group(1).upper() != keyword:
+        return None, {}
+    address = match.group(2) if match.group(2) is not None else match.group(3)
+    params = {}
+    for param in match.group(4).split():
+        name, _, value = param.partition('=')
+        params[name.upper()] = value
+    return address, params
+
+def strip_spam_headers(message):
+    """The message without any X-Spam-Flag / -Score / -Status header lines"""
+    kept = []
+    dropping = dropped = False
+    position = 0
+    # Header lines up to the first blank line, keeping their own line endings
+    while position < len(message):
+        end = message.find(b'\n', position)
+        end = len(message) if end < 0 else end + 1
+        line = message[position:end]
+        if not line.strip():
+            break
+        # A folded continuation line belongs to the header before it
+        if line[:1] not in (b' ', b'\t'):
+            dropping = line.split(b':', 1)[0].strip().lower() in SPAM_HEADERS
+        if dropping:
+            dropped = True
+        else:
+            kept.append(line)
+        position = end
+    return b''.join(kept) + message[position:] if dropped else message
+
+def spam_headers(prediction, spam_probability, version):
+    verdict = 'Yes' if prediction == 1 else 'No'
+    return (f'X-Spam-Flag: {verdict.upper()}\r\n'
+            f'X-Spam-Score: {spam_probability:.6f}\r\n'
+            f'X-Spam-Status: {verdict}, score={spam_probability:.4f} model={version}\r\n').encode('ascii')
+
+class LineReader:
+    """Buffered reads from an asyncio stream: command lines and DATA bodies"""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.buffer = bytearray()
+
+    def pending(self):
+        """True if more input is already buffered (pipelined commands)"""
+        return bool(self.buffer)
+
+    async def readline(self, max_bytes=MAX_LINE_BYTES):
+        """Next line without its line ending; None at EOF, False if it was too long"""
+        too_long = False
+        start = 0
+        while True:
+            end = self.buffer.find(b'\n', start)
+            if end >= 0:
+                line = bytes(self.buffer[:end]).rstrip(b'\r')
+                del self.buffer[:end + 1]
+                return False if too_long or len(line) > max_bytes else line
+            if len(self.buffer) > max_bytes:
+                too_long = True
+                self.buffer.clear()
+            start = len(self.buffer)
+            chunk = await self.reader.read(READ_SIZE)
+            if not chunk:
+                return None
+            self.buffer += chunk
+
+    async def read_data(self, max_bytes, timeout=None):
+        """Message up to the lone '.' line, dot-unstuffed
+
+        None at EOF, False if the message was larger than max_bytes (it is
+        read to the end and discarded). Raises asyncio.TimeoutError if no
+        input arrives for timeout seconds.
+        """
+        # Starts with the DATA line's CRLF so a first line of '.' is found too
+        data = bytearray(b'\r\n')
+        data += self.buffer
+        self.buffer.clear()
+        too_big = False
+        start = 0
+        while True:
+            end = data.find(b'\r\n.\r\n', start)
+            if end >= 0:
+                self.buffer += data[end + 5:]
+                if too_big or end > max_bytes:
+                    return False
+                return bytes(data[:end + 2]).replace(b'\r\n..', b'\r\n.')[2:]
+            if len(data) > max_bytes + 2:
+                too_big = True
+                del data[:-4]
+            start = max(0, len(data) - 4)
+            chunk = await asyncio.wait_for(self.reader.read(READ_SIZE), timeout)
+            if not chunk:
+                return None
+            data += chunk
+
+class BatchScorer:
+    """Scores messages from all sessions on a thread pool, batching what queues up"""
+
+    def __init__(self, score_batch, threads=2, max_batch=32):
+        self.score_batch = score_batch
+        self.threads = threads
+        self.max_batch = max_batch
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='score')
+        self._queue = None
+        self._tasks = []
+        self.batches = 0
+        self.scored = 0
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.threads)]
+
+    async def score(self, text):
+        """(model version, prediction, [ham_prob, spam_prob]) for one message"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.score_batch, [text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.scored += len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self.executor.shutdown(wait=False)
+
+def score_with_app(app_module, texts):
+    """score_batch for BatchScorer: the model app.py is currently serving"""
+    handle = app_module.model_handle
+    if handle is None:
+        raise RuntimeError('Model not loaded')
+    verdicts = handle.pipeline.score(texts)
+    results = []
+    for text, (prediction, proba) in zip(texts, verdicts):
+        app_module.offer_to_shadow(handle, text, prediction, proba)
+        results.append((handle.version, prediction, proba))
+    return results
+
+class Relay:
+    """Hands accepted messages to the next hop over SMTP, reusing connections"""
+
+    def __init__(self, host, port, timeout=30.0, max_idle=8):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def send(self, sender, recipients, message):
+        """Relay one message; returns {recipient: (code, reply)} for refused recipients
+
+        Raises smtplib.SMTPRecipientsRefused / SMTPResponseException when the
+        next hop refuses the message and OSError when it cannot be reached.
+        """
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            fresh = connection is None
+            if fresh:
+                connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                refused = connection.sendmail(sender, recipients, message)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+                # The next hop answered (and smtplib sent RSET), so the connection is fine
+                self._release(connection)
+                raise
+            except OSError:
+                connection.close()
+                if fresh:
+                    raise
+                # A pooled connection the next hop had already closed
+                continue
+            self._release(connection)
+            return refused
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            try:
+                connection.quit()
+            except OSError:
+                connection.close()
+
+def _next_hop_reply(code, text):
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', 'replace')
+    if 500 <= code < 600:
+        return f'{code} 5.0.0 Next hop: {text}'
+    return f'451 4.4.1 Next hop: {code} {text}'
+
+class MailSession:
+    """One SMTP or LMTP connection"""
+
+    def __init__(self, listener, reader, writer):
+        self.listener = listener
+        self.lines = LineReader(reader)
+        self.writer = writer
+        self.lmtp = listener.lmtp
+        self.greeted = False
+        self._out = []
+        self.reset()
+
+    def reset(self):
+        self.sender = None
+        self.recipients = []
+
+    def reply(self, line):
+        self._out.append(line.encode('utf-8', 'replace') + b'\r\n')
+
+    async def flush(self):
+        if self._out:
+            self.writer.write(b''.join(self._out))
+            self._out = []
+            await self.writer.drain()
+
+    async def run(self):
+        listener = self.listener
+        self.reply(f"220 {listener.hostname} {'LMTP' if self.lmtp else 'ESMTP'} spam filter ready")
+        while True:
+            # Replies to pipelined commands go out together
+            if not self.lines.pending():
+                await self.flush()
+            try:
+                line = await asyncio.wait_for(self.lines.readline(), listener.timeout)
+            except asyncio.TimeoutError:
+                self.reply('421 4.4.2 Idle timeout, closing connection')
+                break
+            if line is None:
+                break
+            if line is False:
+                self.reply('500 5.5.2 Line too long')
+                continue
+            verb, _, argument = line.decode('latin-1').strip().partition(' ')
+            verb = verb.upper()
+            argument = argument.strip()
+
+            if verb == 'QUIT':
+                self.reply('221 2.0.0 Bye')
+                break
+            if verb in ('HELO', 'EHLO', 'LHLO'):
+                self.hello(verb, argument)
+            elif verb == 'MAIL':
+                self.mail(argument)
+            elif verb == 'RCPT':
+                self.rcpt(argument)
+            elif verb == 'DATA':
+                if not await self.data():
+                    return
+            elif verb == 'RSET':
+                self.reset()
+                self.reply('250 2.0.0 OK')
+            elif verb == 'NOOP':
+                self.reply('250 2.0.0 OK')
+            elif verb == 'VRFY':
+                self.reply('252 2.5.0 Cannot VRFY user')
+            else:
+                self.reply('500 5.5.2 Command not recognized')
+        await self.flush()
+
+    def hello(self, verb, argument):
+        if (verb == 'LHLO') != self.lmtp:
+            self.reply('500 5.5.2 Command not recognized')
+            return
+        if not argument:
+            self.reply(f'501 5.5.4 Syntax: {verb} hostname')
+            return
+        self.greeted = True
+        self.reset()
+        hostname = self.listener.hostname
+        if verb == 'HELO':
+            self.reply(f'250 {hostname}')
+            return
+        self.reply(f'250-{hostname}')
+        self.reply('250-PIPELINING')
+        self.reply('250-8BITMIME')
+        self.reply('250-ENHANCEDSTATUSCODES')
+        self.reply(f'250 SIZE {self.listener.max_message_bytes}')
+
+    def mail(self, argument):
+        if not self.greeted:
+            self.reply(f"503 5.5.1 Send {'LHLO' if self.lmtp else 'EHLO'} first")
+            return
+        if self.sender is not None:
+            self.reply('503 5.5.1 Nested MAIL command')
+            return
+        address, params = parse_path(argument, 'FROM')
+        if address is None:
+            self.reply('501 5.5.4 Syntax: MAIL FROM:<address>')
+            return
+        size = params.get('SIZE', '')
+        if size.isdigit() and int(size) > self.listener.max_message_bytes:
+            self.reply('552 5.3.4 Message size exceeds fixed maximum message size')
+            return
+        self.sender = address
+        self.reply('250 2.1.0 OK')
+
+    def rcpt(self, argument):
+        if self.sender is None:
+            self.reply('503 5.5.1 Need MAIL command')
+            return
+        address, _ = parse_path(argument, 'TO')
+        if not address:
+            self.reply('501 5.5.4 Syntax: RCPT TO:<address>')
+            return
+        if len(self.recipients) >= self.listener.max_recipients:
+            self.reply('452 4.5.3 Too many recipients')
+            return
+        self.recipients.append(address)
+        self.reply('250 2.1.5 OK')
+
+    async def data(self):
+        """Receive and deliver one message; False if the client went away"""
+        if self.sender is None:
+            self.reply('503 5.5.1 Need MAIL command')
+            return True
+        if not self.recipients:
+            # Every pipelined RCPT failed
+            self.reply('554 5.5.1 No valid recipients')
+            return True
+        self.reply('354 End data with <CR><LF>.<CR><LF>')
+        await self.flush()
+        try:
+            message = await self.lines.read_data(self.listener.max_message_bytes, self.listener.timeout)
+        except asyncio.TimeoutError:
+            self.reply('421 4.4.2 Idle timeout, closing connection')
+            await self.flush()
+            return False
+        if message is None:
+            return False
+
+        if message is False:
+            outcome = '552 5.3.4 Message too big'
+        else:
+            outcome = await self.listener.deliver(self.sender, self.recipients, message)
+        if self.lmtp:
+            # One reply per accepted recipient
+            for recipient in self.recipients:
+                self.reply(outcome.get(recipient, '250 2.0.0 OK') if isinstance(outcome, dict) else outcome)
+        elif isinstance(outcome, dict):
+            # Some recipients were refused by the next hop; the rest got the message
+            self.reply('250 2.0.0 OK' if len(outcome) < len(self.recipients) else next(iter(outcome.values())))
+        else:
+            self.reply(outcome)
+        self.reset()
+        return True
+
+class MailListener:
+    """asyncio SMTP/LMTP server in front of a BatchScorer and an optional Relay"""
+
+    def __init__(self, scorer, relay=None, lmtp=False, hostname=None, reject_threshold=None,
+                 max_message_bytes=10 * 2 ** 20, max_recipients=1000, max_sessions=1000,
+                 timeout=300.0, relay_threads=8, on_reload=None):
+        self.scorer = scorer
+        self.relay = relay
+        self.lmtp = lmtp
+        self.hostname = hostname or socket.getfqdn()
+        self.reject_threshold = reject_threshold
+        self.max_message_bytes = max_message_bytes
+        self.max_recipients = max_recipients
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self.on_reload = on_reload
+        self.relay_executor = ThreadPoolExecutor(max_workers=relay_threads, thread_name_prefix='relay')
+        self.sessions = set()
+        self.counts = {'sessions': 0, 'refused_sessions': 0, 'messages': 0, 'spam': 0,
+                       'rejected': 0, 'relayed': 0, 'discarded': 0, 'temp_failures': 0}
+
+    async def deliver(self, sender, recipients, message):
+        """Score, then reject or tag and relay: one reply, or {recipient: reply} after a partial relay"""
+        counts = self.counts
+        counts['messages'] += 1
+        message = strip_spam_headers(message)
+        try:
+            version, prediction, proba = await self.scorer.score(message.decode('latin-1'))
+        except Exception as e:
+            counts['temp_failures'] += 1
+            return f'451 4.3.0 Could not classify message: {e}'
+        spam_probability = float(proba[1])
+        if prediction == 1:
+            counts['spam'] += 1
+        if self.reject_threshold is not None and spam_probability >= self.reject_threshold:
+            counts['rejected'] += 1
+            return f'550 5.7.1 Message rejected as spam (score {spam_probability:.4f})'
+
+        if self.relay is None:
+            counts['discarded'] += 1
+            return '250 2.0.0 OK'
+        tagged = spam_headers(prediction, spam_probability, version) + message
+        loop = asyncio.get_running_loop()
+        try:
+            refused = await loop.run_in_executor(
+                self.relay_executor, self.relay.send, sender, recipients, tagged)
+        except smtplib.SMTPRecipientsRefused as e:
+            return {recipient: _next_hop_reply(*reply) for recipient, reply in e.recipients.items()}
+        except smtplib.SMTPResponseException as e:
+            if e.smtp_code < 500:
+                counts['temp_failures'] += 1
+            return _next_hop_reply(e.smtp_code, e.smtp_error)
+        except OSError as e:
+            counts['temp_failures'] += 1
+            return f'451 4.4.1 Next hop unavailable: {e}'
+        counts['relayed'] += 1
+        if refused:
+            return {recipient: _next_hop_reply(*reply) for recipient, reply in refused.items()}
+        return '250 2.0.0 OK'
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self.sessions.add(task)
+        try:
+            if len(self.sessions) > self.max_sessions:
+                self.counts['refused_sessions'] += 1
+                writer.write(b'421 4.3.2 Too many connections, try again later\r\n')
+                await writer.drain()
+                return
+            self.counts['sessions'] += 1
+            await MailSession(self, reader, writer).run()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.sessions.discard(task)
+            writer.close()
+
+    async def serve(self, sock, graceful_timeout=30.0):
+        """Serve on a bound listening socket until SIGTERM / SIGINT"""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+        if self.on_reload is not None:
+            loop.add_signal_handler(signal.SIGHUP, self.on_reload)
+
+        self.scorer.start()
+        server = await asyncio.start_server(self.handle, sock=sock, limit=READ_SIZE)
+        await stop.wait()
+
+        server.close()
+        if self.sessions:
+            print(f"🛑 Waiting for {len(self.sessions)} open session(s)...")
+            _, pending = await asyncio.wait(set(self.sessions), timeout=graceful_timeout)
+            for task in pending:
+                task.cancel()
+        self.scorer.stop()
+        self.relay_executor.shutdown(wait=True)
+        if self.relay is not None:
+            self.relay.close()
+        print(f"📊 {self.stats()}")
+
+    def stats(self):
+        stats = dict(self.counts)
+        stats['open_sessions'] = len(self.sessions)
+        stats['batches'] = self.scorer.batches
+        stats['mean_batch_size'] = (round(self.scorer.scored / self.scorer.batches, 2)
+                                    if self.scorer.batches else None)
+        return stats
+
+def run_worker(app_module, listen_socket, args):
+    """Build a listener around app.py's model and serve until SIGTERM"""
+    relay = None
+    if args.next_hop:
+        host, _, port = args.next_hop.rpartition(':')
+        relay = Relay(host or '127.0.0.1', int(port))
+    listener = MailListener(
+        BatchScorer(functools.partial(score_with_app, app_module), threads=args.threads,
+                    max_batch=args.max_batch),
+        relay=relay,
+        lmtp=args.lmtp,
+        hostname=args.hostname,
+        reject_threshold=args.reject_threshold,
+        max_message_bytes=args.max_message_bytes,
+        max_sessions=args.max_sessions,
+        on_reload=app_module.start_background_reload,
+    )
+    asyncio.run(listener.serve(listen_socket, args.graceful_timeout))
+
+def main():
+    from serve import bind_socket
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=os.environ.get('SPAM_MAIL_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('SPAM_MAIL_PORT', 10025)))
+    parser.add_argument('--lmtp', action='store_true', help='speak LMTP instead of SMTP')
+    parser.add_argument('--next-hop', default=os.environ.get('SPAM_MAIL_NEXT_HOP'),
+                        help='host:port to relay tagged messages to over SMTP')
+    parser.add_argument('--reject-threshold', type=float,
+                        default=float(os.environ['SPAM_MAIL_REJECT_THRESHOLD'])
+                        if os.environ.get('SPAM_MAIL_REJECT_THRESHOLD') else None,
+                        help='reject messages at or above this spam probability')
+    parser.add_argument('--hostname', help='name used in greetings (default: FQDN)')
+    parser.add_argument('--max-message-bytes', type=int,
+                        default=int(os.environ.get('SPAM_MAIL_MAX_BYTES', 10 * 2 ** 20)))
+    parser.add_argument('--max-sessions', type=int, default=1000, help='per worker')
+    parser.add_argument('--threads', type=int, default=2, help='scoring threads per worker')
+    parser.add_argument('--max-batch', type=int, default=32, help='messages per scoring call')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--graceful-timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    import app as app_module
+    if app_module.model_handle is None:
+        print("⚠️ Model not loaded; messages get 451 until a reload succeeds")
+    listen_socket = bind_socket(args.host, args.port, args.backlog)
+    print(f"✅ {'LMTP' if args.lmtp else 'SMTP'} listener on {args.host}:{args.port} "
+          f"with {args.workers} worker(s), relaying to {args.next_hop or 'nowhere (scored messages are discarded)'}")
+    if args.reject_threshold is not None:
+        print(f"   Rejecting messages with spam probability >= {args.reject_threshold}")
+
+    if args.workers == 1:
+        run_worker(app_module, listen_socket, args)
+        return 0
+
+    # Pre-fork like serve.py: workers share the model pages and the socket
+    if app_module.model_watcher is not None:
+        app_module.model_watcher.stop()
+        app_module.model_watcher = None
+    gc.collect()
+    gc.freeze()
+    workers = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                app_module.start_model_watcher()
+                run_worker(app_module, listen_socket, args)
+            except Exception as e:
+                print(f"❌ Worker {os.getpid()} crashed: {e}", file=sys.stderr)
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        workers.append(pid)
+
+    def forward(signum, frame):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM if signum == signal.SIGINT else signum)
+            except ProcessLookupError:
+                pass
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, forward)
+    for pid in workers:
+        os.waitpid(pid, 0)
+    listen_socket.close()
+    print("👋 All workers stopped")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+# metrics.py - Prometheus text-format metrics for the web app
+"""Minimal thread-safe counters, gauges and histograms rendered in the
+Prometheus text exposition format (served on /metrics).
+
+ServiceMetrics holds the app's metrics: per-stage latency histograms for
+clean / vectorize / score and the cascade first stage (recorded by
+InferencePipeline), request latency
+histograms, request counters by endpoint and outcome, in-flight gauges,
+cascade first-stage / escalated counts, micro-batch size and queue wait
+histograms (recorded by MicroBatcher) and the served model version.
+
+Metrics are per process. Behind serve.py every worker keeps its own
+counters, so scrape each worker (or run a single worker) for exact totals.
+"""
+import threading
+from bisect import bisect_left
+
+# Upper bounds in seconds
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+REQUEST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds in requests
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        # Unlabeled metrics are exported from the start, as 0
+        self._values = {} if self.label_names else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self, kind='counter'):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f'{self.name}{_format_labels(self.label_names, label_values)} '
+                         f'{_format_value(value)}')
+        return lines
+
+class Gauge(Counter):
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self):
+        return super().render(kind='gauge')
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[2] if series is not None else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, (list(series[0]), series[1], series[2]))
+                           for labels, series in self._series.items())
+        for label_values, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, label_values, ('le', _format_value(bound)))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+class ServiceMetrics:
+    """The metrics exposed by app.py on /metrics"""
+
+    def __init__(self):
+        self.stage_seconds = Histogram(
+            'spam_stage_duration_seconds',
+            'Time spent in each scoring stage per pipeline call.',
+            ('stage',), STAGE_BUCKETS)
+        self.request_seconds = Histogram(
+            'spam_request_duration_seconds',
+            'End-to-end request latency by endpoint.',
+            ('endpoint',), REQUEST_BUCKETS)
+        self.requests = Counter(
+            'spam_requests_total',
+            'Requests by endpoint and outcome.',
+            ('endpoint', 'outcome'))
+        self.in_flight = Gauge(
+            'spam_requests_in_flight',
+            'Requests currently being handled, by endpoint.',
+            ('endpoint',))
+        self.emails_scored = Counter(
+            'spam_emails_scored_total',
+            'Emails that went through the scoring pipeline.')
+        self.cascade_emails = Counter(
+            'spam_cascade_emails_total',
+            'Emails decided by the cascade first stage or escalated to the full model.',
+            ('stage',))
+        self.microbatch_size = Histogram(
+            'spam_microbatch_size',
+            'Requests per micro-batch sent to the model.',
+            buckets=BATCH_SIZE_BUCKETS)
+        self.microbatch_queue_seconds = Histogram(
+            'spam_microbatch_queue_wait_seconds',
+            'Time a request waited in the micro-batch queue before its batch was scored.',
+            buckets=STAGE_BUCKETS)
+
+    def observe_stage(self, stage, seconds):
+        self.stage_seconds.observe(seconds, stage)
+
+    def observe_microbatch(self, size, queue_delays):
+        self.microbatch_size.observe(size)
+        for seconds in queue_delays:
+            self.microbatch_queue_seconds.observe(seconds)
+
+    def request_started(self, endpoint):
+        self.in_flight.inc(endpoint)
+
+    def request_finished(self, endpoint, outcome, seconds):
+        self.in_flight.dec(endpoint)
+        self.requests.inc(endpoint, outcome)
+        self.request_seconds.observe(seconds, endpoint)
+
+    def render(self, model_handle=None, body_extraction=None):
+        """Prometheus text exposition of every metric"""
+        lines = []
+        for metric in (self.stage_seconds, self.request_seconds, self.requests,
+                       self.in_flight, self.emails_scored, self.cascade_emails,
+                       self.microbatch_size, self.microbatch_queue_seconds):
+            lines.extend(metric.render())
+        if body_extraction is not None:
+            lines.append('# HELP spam_body_truncated_total Emails cut by the body extraction budget.')
+            lines.append('# TYPE spam_body_truncated_total counter')
+            lines.append(f"spam_body_truncated_total {body_extraction['truncated']}")
+            lines.append('# HELP spam_body_skipped_parts_total Binary MIME parts skipped without decoding.')
+            lines.append('# TYPE spam_body_skipped_parts_total counter')
+            lines.append(f"spam_body_skipped_parts_total {body_extraction['skipped_parts']}")
+        lines.append('# HELP spam_model_info Currently served model version.')
+        lines.append('# TYPE spam_model_info gauge')
+        if model_handle is not None:
+            labels = _format_labels(('version', 'loaded_at'),
+                                    (model_handle.version, model_handle.loaded_at))
+            lines.append(f'spam_model_info{labels} 1')
+        return '\n'.join(lines) + '\n'
+
+def outcome_for_status(status_code):
+    if status_code < 400:
+        return 'ok'
+    if status_code < 500:
+        return 'client_error'
+    return 'server_error'
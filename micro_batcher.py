@@ -0,0 +1,172 @@
+# micro_batcher.py - coalesce concurrent single-email requests into batches
+"""Adaptive micro-batching for /api/predict.
+
+Request threads hand their email to a MicroBatcher and block until the
+verdict is ready. A single dispatcher thread takes the oldest waiting
+request, gathers whatever else arrives within the batching window (up to
+max_batch_size) and scores them with one pipeline.score() call - one
+vectorizer transform and one predict_proba for the whole batch.
+
+Requests that arrive while a batch is being scored queue up and form the
+next batch, so batch size grows with load even with no window at all. On
+top of that the dispatcher can wait up to max_wait for more requests, but
+only while a moving average of recent batch sizes shows that requests
+overlap; while they keep arriving alone the window is zero and a lone
+request is scored as soon as the dispatcher picks it up. The default
+window is 0: with callers that block on their result (as request threads
+do) waiting mostly adds latency, so only set it for heavy open-loop load.
+
+Batch sizes and queueing delays are summarised by stats() (in /health) and,
+given a ServiceMetrics, recorded as /metrics histograms.
+"""
+import os
+import queue
+import threading
+import time
+
+from metrics import BATCH_SIZE_BUCKETS
+
+class _PendingRequest:
+    __slots__ = ('pipeline', 'email_text', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, pipeline, email_text):
+        self.pipeline = pipeline
+        self.email_text = email_text
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class MicroBatcher:
+    """Thread-safe request coalescer in front of InferencePipeline.score()"""
+
+    def __init__(self, max_batch_size=32, max_wait=0.0, smoothing=0.2,
+                 busy_batch_size=1.5, metrics=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.smoothing = smoothing
+        self.busy_batch_size = busy_batch_size
+        self.metrics = metrics
+
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._average_batch_size = 1.0
+        self.batches = 0
+        self.requests = 0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.max_batch_seen = 0
+        self.total_queue_delay = 0.0
+        self.max_queue_delay = 0.0
+
+    def classify(self, pipeline, email_text):
+        """Score one raw email on pipeline, batched with concurrent callers"""
+        self._ensure_running()
+        pending = _PendingRequest(pipeline, email_text)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _ensure_running(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+
+    def current_window(self):
+        """Seconds the dispatcher will wait for more requests right now"""
+        return self.max_wait if self._average_batch_size >= self.busy_batch_size else 0.0
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            deadline = first.enqueued_at + self.current_window()
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        started = time.monotonic()
+        self._record(batch, started)
+
+        # A reload can land mid-window; each request is scored on the model
+        # it started with
+        groups = {}
+        for pending in batch:
+            groups.setdefault(id(pending.pipeline), []).append(pending)
+        for group in groups.values():
+            try:
+                verdicts = group[0].pipeline.score([pending.email_text for pending in group])
+                for pending, verdict in zip(group, verdicts):
+                    pending.result = verdict
+            except Exception as e:
+                for pending in group:
+                    pending.error = e
+            for pending in group:
+                pending.done.set()
+
+    def _record(self, batch, started):
+        size = len(batch)
+        delays = [started - pending.enqueued_at for pending in batch]
+        with self._stats_lock:
+            self._average_batch_size += self.smoothing * (size - self._average_batch_size)
+            self.batches += 1
+            self.requests += size
+            self.max_batch_seen = max(self.max_batch_seen, size)
+            bucket = 0
+            while bucket < len(BATCH_SIZE_BUCKETS) and size > BATCH_SIZE_BUCKETS[bucket]:
+                bucket += 1
+            self.batch_size_counts[bucket] += 1
+            self.total_queue_delay += sum(delays)
+            self.max_queue_delay = max(self.max_queue_delay, max(delays))
+        if self.metrics is not None:
+            self.metrics.observe_microbatch(size, delays)
+
+    def stats(self):
+        with self._stats_lock:
+            labels = [str(bound) for bound in BATCH_SIZE_BUCKETS] + [f'>{BATCH_SIZE_BUCKETS[-1]}']
+            return {
+                'enabled': True,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'current_window_ms': round(self.current_window() * 1000, 3),
+                'batches': self.batches,
+                'requests': self.requests,
+                'mean_batch_size': round(self.requests / self.batches, 3) if self.batches else 0.0,
+                'recent_batch_size': round(self._average_batch_size, 3),
+                'max_batch_size_seen': self.max_batch_seen,
+                'batch_size_histogram': dict(zip(labels, self.batch_size_counts)),
+                'mean_queue_delay_ms': round(self.total_queue_delay * 1000 / self.requests, 3) if self.requests else 0.0,
+                'max_queue_delay_ms': round(self.max_queue_delay * 1000, 3),
+            }
+
+def micro_batcher_from_env(metrics=None):
+    """Build the app's micro-batcher from SPAM_MICROBATCH_* variables (None if disabled)"""
+    if os.environ.get('SPAM_MICROBATCH', '0').lower() not in ('1', 'true', 'yes'):
+        return None
+    return MicroBatcher(
+        max_batch_size=int(os.environ.get('SPAM_MICROBATCH_MAX_SIZE', 32)),
+        max_wait=float(os.environ.get('SPAM_MICROBATCH_MAX_WAIT_MS', 0)) / 1000,
+        metrics=metrics,
+    )
@@ -0,0 +1,366 @@
+# model_artifact.py - compact, memory-mappable model artifact
+"""Single-file, versioned model artifact for the TF-IDF + LogisticRegression
+spam model.
+
+Layout (all integers little-endian):
+
+    8 bytes   magic b'SPAMMDL\\0'
+    uint32    format version
+    uint32    reserved (0)
+    uint64    header length in bytes
+    ...       JSON header (utf-8)
+    ...       zero padding up to a 64-byte boundary
+    ...       data section: raw arrays, each starting on a 64-byte boundary
+
+The header holds the preprocessing config, the intercept and classes, a
+sha256 checksum of the arrays (in name order) and, for every array, its dtype, shape
+and offset inside the data section. The numeric arrays (idf, coef) are
+loaded with np.memmap so worker processes share the same read-only pages
+instead of each unpickling its own sklearn objects.
+
+Usage:
+
+    python model_artifact.py convert      # joblib pair -> models/spam_model.artifact
+    python model_artifact.py info models/spam_model.artifact
+    python model_artifact.py bench        # load time / RSS: pickle vs artifact
+"""
+import argparse
+import hashlib
+import json
+import os
+import struct
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from body_extractor import DEFAULT_SETTINGS
+
+MAGIC = b'SPAMMDL\x00'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+PREFIX = struct.Struct('<8sIIQ')
+
+ARTIFACT_FILENAME = 'spam_model.artifact'
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def write_artifact(path, vectorizer, model, dtype='<f8'):
+    """Write a fitted TfidfVectorizer / binary LogisticRegression pair to path
+
+    dtype sets the precision idf and coef are stored with ('<f8', '<f4' or
+    '<f2'); see compress_model.py.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    if not isinstance(vectorizer, TfidfVectorizer):
+        raise ValueError(f"Unsupported vectorizer: {type(vectorizer).__name__}")
+    if not isinstance(model, LogisticRegression) or model.coef_.shape[0] != 1:
+        raise ValueError("Only binary LogisticRegression models can be exported")
+    if vectorizer.analyzer != 'word' or vectorizer.tokenizer is not None:
+        raise ValueError("Only the default word analyzer can be exported")
+
+    preprocessor = vectorizer.preprocessor
+    if preprocessor is not None and getattr(preprocessor, '__name__', None) != 'clean_email':
+        raise ValueError(f"Unsupported preprocessor: {preprocessor!r}")
+
+    # Terms ordered by feature index, one per line
+    terms = vectorizer.get_feature_names_out()
+    vocabulary_blob = np.frombuffer('\n'.join(terms).encode('utf-8'), dtype=np.uint8)
+    idf = vectorizer.idf_ if vectorizer.use_idf else np.ones(len(terms))
+
+    arrays = {
+        'idf': np.ascontiguousarray(idf, dtype=dtype),
+        'coef': np.ascontiguousarray(model.coef_[0], dtype=dtype),
+        'vocabulary': vocabulary_blob,
+    }
+
+    array_specs = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        array_specs[name] = {
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'offset': offset,
+        }
+        offset += array.nbytes
+
+    checksum = hashlib.sha256()
+    for name in sorted(arrays):
+        checksum.update(arrays[name].tobytes())
+
+    stop_words = vectorizer.get_stop_words()
+    header = {
+        'format_version': FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'vectorizer_type': type(vectorizer).__name__,
+        'model_type': type(model).__name__,
+        'n_features': len(terms),
+        'intercept': float(model.intercept_[0]),
+        'classes': [int(c) for c in model.classes_],
+        'preprocessing': {
+            'preprocessor': 'clean_email' if preprocessor is not None else None,
+            # clean_email's body extraction settings the model was trained with
+            'body_extraction': dict(DEFAULT_SETTINGS._asdict()) if preprocessor is not None else None,
+            'lowercase': vectorizer.lowercase,
+            'strip_accents': vectorizer.strip_accents,
+            'token_pattern': vectorizer.token_pattern,
+            'ngram_range': list(vectorizer.ngram_range),
+            'stop_words': sorted(stop_words) if stop_words else None,
+            'max_features': vectorizer.max_features,
+            'norm': vectorizer.norm,
+            'use_idf': vectorizer.use_idf,
+            'smooth_idf': vectorizer.smooth_idf,
+            'sublinear_tf': vectorizer.sublinear_tf,
+            'binary': vectorizer.binary,
+        },
+        'arrays': array_specs,
+        'checksum': checksum.hexdigest(),
+    }
+    header_bytes = json.dumps(header, sort_keys=True).encode('utf-8')
+    data_start = _align(PREFIX.size + len(header_bytes))
+
+    # Write to a temporary file and rename so readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, FORMAT_VERSION, 0, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + array_specs[name]['offset'])
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+    return header
+
+class ModelArtifact:
+    """A loaded artifact: header plus (memory-mapped) arrays"""
+
+    def __init__(self, path, header, arrays):
+        self.path = path
+        self.header = header
+        self.arrays = arrays
+        self._vocabulary = None
+
+    @property
+    def version(self):
+        """Content checksum, used as the model version"""
+        return self.header['checksum']
+
+    @property
+    def idf(self):
+        return self.arrays['idf']
+
+    @property
+    def coef(self):
+        return self.arrays['coef']
+
+    @property
+    def terms(self):
+        return self.arrays['vocabulary'].tobytes().decode('utf-8').split('\n')
+
+    @property
+    def vocabulary(self):
+        if self._vocabulary is None:
+            self._vocabulary = {term: index for index, term in enumerate(self.terms)}
+        return self._vocabulary
+
+    def to_sklearn(self):
+        """Rebuild a (TfidfVectorizer, LogisticRegression) pair for serving.
+
+        Only the fitted attributes needed for transform / predict_proba are
+        set; coef_ is a view on the memory-mapped array. Reduced-precision
+        weights are widened to float64 once here.
+        """
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from inference import clean_email
+
+        config = self.header['preprocessing']
+        trained_with = config.get('body_extraction')
+        if trained_with and trained_with != dict(DEFAULT_SETTINGS._asdict()):
+            print(f"⚠️ Model was trained with body extraction settings {trained_with}, "
+                  f"serving with {dict(DEFAULT_SETTINGS._asdict())}")
+        vectorizer = TfidfVectorizer(
+            preprocessor=clean_email if config['preprocessor'] == 'clean_email' else None,
+            lowercase=config['lowercase'],
+            strip_accents=config['strip_accents'],
+            token_pattern=config['token_pattern'],
+            ngram_range=tuple(config['ngram_range']),
+            stop_words=config['stop_words'],
+            max_features=config['max_features'],
+            norm=config['norm'],
+            use_idf=config['use_idf'],
+            smooth_idf=config['smooth_idf'],
+            sublinear_tf=config['sublinear_tf'],
+            binary=config['binary'],
+        )
+        idf = self.idf if self.idf.dtype == np.float64 else self.idf.astype(np.float64)
+        coef = self.coef if self.coef.dtype == np.float64 else self.coef.astype(np.float64)
+
+        vectorizer.vocabulary_ = self.vocabulary
+        vectorizer.fixed_vocabulary_ = False
+        if config['use_idf']:
+            vectorizer.idf_ = idf
+
+        model = LogisticRegression()
+        model.coef_ = coef.reshape(1, -1)
+        model.intercept_ = np.array([self.header['intercept']])
+        model.classes_ = np.array(self.header['classes'])
+        model.n_features_in_ = self.header['n_features']
+        return vectorizer, model
+
+def read_header(path):
+    """Read and validate the fixed prefix and JSON header of an artifact"""
+    with open(path, 'rb') as f:
+        prefix = f.read(PREFIX.size)
+        if len(prefix) != PREFIX.size:
+            raise ValueError(f"{path}: file too short to be a model artifact")
+        magic, version, _, header_length = PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a model artifact")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported artifact version {version}")
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    return header, _align(PREFIX.size + header_length)
+
+def load_artifact(path, mmap=True, verify=True):
+    """Load an artifact, memory-mapping its arrays read-only.
+
+    Raises ValueError if the file is not a valid artifact or, with
+    verify=True, if the data section does not match the stored checksum.
+    """
+    header, data_start = read_header(path)
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        shape = tuple(spec['shape'])
+        if mmap:
+            array = np.memmap(path, dtype=dtype, mode='r',
+                              offset=data_start + spec['offset'], shape=shape)
+        else:
+            with open(path, 'rb') as f:
+                f.seek(data_start + spec['offset'])
+                count = int(np.prod(shape))
+                array = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+        arrays[name] = array
+
+    if verify:
+        checksum = hashlib.sha256()
+        for name in sorted(arrays):
+            checksum.update(np.asarray(arrays[name]).tobytes())
+        if checksum.hexdigest() != header['checksum']:
+            raise ValueError(f"{path}: checksum mismatch, artifact is corrupt")
+
+    return ModelArtifact(path, header, arrays)
+
+def convert(model_path, vectorizer_path, output_path):
+    """Convert an existing joblib/pickle model + vectorizer pair to an artifact"""
+    import joblib
+    from model_loader import provide_legacy_pickle_names
+
+    provide_legacy_pickle_names()
+    vectorizer = joblib.load(vectorizer_path)
+    model = joblib.load(model_path)
+    return write_artifact(output_path, vectorizer, model)
+
+def _rss_kb():
+    """Current resident set size in KB (Linux), falling back to peak RSS"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _probe(kind, paths):
+    """Load a model in this process and print load time / RSS as JSON"""
+    import importlib
+
+    import joblib
+    from inference import InferencePipeline
+    from model_loader import provide_legacy_pickle_names
+
+    # Import cost is not load cost
+    importlib.import_module('sklearn.linear_model')
+    provide_legacy_pickle_names()
+
+    rss_before = _rss_kb()
+    start = time.perf_counter()
+    if kind == 'artifact':
+        vectorizer, model = load_artifact(paths[0]).to_sklearn()
+    else:
+        vectorizer = joblib.load(paths[1])
+        model = joblib.load(paths[0])
+    pipeline = InferencePipeline(vectorizer, model)
+    pipeline.classify("This is a test email")
+    load_time = time.perf_counter() - start
+
+    print(json.dumps({
+        'kind': kind,
+        'load_seconds': round(load_time, 4),
+        'rss_delta_mb': round((_rss_kb() - rss_before) / 1024, 1),
+        'rss_total_mb': round(_rss_kb() / 1024, 1),
+    }))
+
+def bench(model_path, vectorizer_path, artifact_path):
+    """Compare cold load time and RSS of the pickle pair and the artifact"""
+    results = []
+    for kind, paths in (('pickle', [model_path, vectorizer_path]),
+                        ('artifact', [artifact_path])):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '_probe', kind, *paths],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'format':<10} {'load (s)':>10} {'RSS +MB':>10} {'RSS MB':>10}")
+    for result in results:
+        print(f"{result['kind']:<10} {result['load_seconds']:>10.3f} "
+              f"{result['rss_delta_mb']:>10.1f} {result['rss_total_mb']:>10.1f}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Spam model artifact tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='convert a joblib/pickle pair')
+    convert_parser.add_argument('--model', default=os.path.join('models', 'spam_model.joblib'))
+    convert_parser.add_argument('--vectorizer', default=os.path.join('models', 'tfidf_vectorizer.joblib'))
+    convert_parser.add_argument('--output', default=os.path.join('models', ARTIFACT_FILENAME))
+
+    info_parser = subparsers.add_parser('info', help='print an artifact header')
+    info_parser.add_argument('path', nargs='?', default=os.path.join('models', ARTIFACT_FILENAME))
+
+    bench_parser = subparsers.add_parser('bench', help='compare load time and RSS')
+    bench_parser.add_argument('--model', default=os.path.join('models', 'spam_model.joblib'))
+    bench_parser.add_argument('--vectorizer', default=os.path.join('models', 'tfidf_vectorizer.joblib'))
+    bench_parser.add_argument('--artifact', default=os.path.join('models', ARTIFACT_FILENAME))
+
+    probe_parser = subparsers.add_parser('_probe')
+    probe_parser.add_argument('kind', choices=['pickle', 'artifact'])
+    probe_parser.add_argument('paths', nargs='+')
+
+    args = parser.parse_args()
+    if args.command == 'convert':
+        header = convert(args.model, args.vectorizer, args.output)
+        print(f"✅ Wrote {args.output} ({header['n_features']} features, "
+              f"{os.path.getsize(args.output) / 1024:.1f} KB)")
+    elif args.command == 'info':
+        header, _ = read_header(args.path)
+        header['preprocessing']['stop_words'] = len(header['preprocessing']['stop_words'] or [])
+        print(json.dumps(header, indent=2))
+    elif args.command == 'bench':
+        bench(args.model, args.vectorizer, args.artifact)
+    elif args.command == '_probe':
+        _probe(args.kind, args.paths)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
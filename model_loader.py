@@ -0,0 +1,106 @@
+# model_loader.py - locate and load the trained vectorizer/model pair
+import os
+import pickle
+import sys
+
+import joblib
+
+from inference import clean_email
+from model_artifact import ARTIFACT_FILENAME, load_artifact
+
+def provide_legacy_pickle_names():
+    """Let older vectorizer pickles load outside the training scripts
+
+    Vectorizers pickled by earlier versions of create_model.py /
+    train_model.py reference __main__.clean_email, which only exists when
+    the training script runs.
+    """
+    main_module = sys.modules['__main__']
+    if not hasattr(main_module, 'clean_email'):
+        main_module.clean_email = clean_email
+
+def load_pickled_model(models_dir='models'):
+    """Probe models_dir for a pickled vectorizer and model pair
+
+    Returns (vectorizer, model), or None if either could not be loaded.
+    """
+    # Check if model files exist - try different formats
+    model_files = [
+        ('spam_model.joblib', 'joblib'),
+        ('spam_model.pkl', 'pickle'),
+        ('best_spam_model.pkl', 'pickle')
+    ]
+    
+    vectorizer_files = [
+        ('tfidf_vectorizer.joblib', 'joblib'),
+        ('tfidf_vectorizer.pkl', 'pickle'),
+        ('count_vectorizer.pkl', 'pickle')
+    ]
+    
+    provide_legacy_pickle_names()
+    
+    # Try to load vectorizer
+    vectorizer_loaded = False
+    for filename, loader_type in vectorizer_files:
+        filepath = os.path.join(models_dir, filename)
+        if os.path.exists(filepath):
+            print(f"📦 Loading vectorizer from: {filename}")
+            try:
+                if loader_type == 'joblib':
+                    vectorizer = joblib.load(filepath)
+                else:  # pickle
+                    with open(filepath, 'rb') as f:
+                        vectorizer = pickle.load(f)
+                print(f"✅ Vectorizer loaded from {filename}")
+                vectorizer_loaded = True
+                break
+            except Exception as e:
+                print(f"⚠️ Failed to load {filename}: {e}")
+                continue
+    
+    if not vectorizer_loaded:
+        print("❌ Could not load any vectorizer file!")
+        return None
+    
+    # Try to load model
+    model_loaded_flag = False
+    for filename, loader_type in model_files:
+        filepath = os.path.join(models_dir, filename)
+        if os.path.exists(filepath):
+            print(f"🤖 Loading model from: {filename}")
+            try:
+                if loader_type == 'joblib':
+                    model = joblib.load(filepath)
+                else:  # pickle
+                    with open(filepath, 'rb') as f:
+                        model = pickle.load(f)
+                print(f"✅ Model loaded from {filename}")
+                model_loaded_flag = True
+                break
+            except Exception as e:
+                print(f"⚠️ Failed to load {filename}: {e}")
+                continue
+    
+    if not model_loaded_flag:
+        print("❌ Could not load any model file!")
+        return None
+    
+    return vectorizer, model
+
+def load_model_pair(models_dir='models'):
+    """Load (vectorizer, model) from models_dir, or return None
+
+    Prefers the compact artifact (no unpickling, arrays are memory-mapped)
+    and falls back to the pickle/joblib files.
+    """
+    artifact_path = os.path.join(models_dir, ARTIFACT_FILENAME)
+    if os.path.exists(artifact_path):
+        print(f"📦 Loading model artifact from: {ARTIFACT_FILENAME}")
+        try:
+            pair = load_artifact(artifact_path).to_sklearn()
+            print(f"✅ Model artifact loaded from {ARTIFACT_FILENAME}")
+            return pair
+        except Exception as e:
+            print(f"⚠️ Failed to load {ARTIFACT_FILENAME}: {e}")
+    
+    return load_pickled_model(models_dir)
@@ -0,0 +1,72 @@
+# model_reload.py - immutable model handle and models/ directory watcher
+import os
+import threading
+import time
+from collections import namedtuple
+
+# Everything a request needs from one loaded model. Handles are never
+# mutated; a reload builds a new one and swaps the global reference, so a
+# request that already grabbed the old handle finishes on the old model.
+ModelHandle = namedtuple('ModelHandle', ['pipeline', 'version', 'loaded_at'])
+
+MODEL_FILE_EXTENSIONS = ('.artifact', '.joblib', '.pkl')
+
+def new_model_handle(pipeline):
+    return ModelHandle(
+        pipeline=pipeline,
+        version=pipeline.version,
+        loaded_at=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    )
+
+def models_dir_signature(models_dir):
+    """(name, size, mtime) of every model file, used to detect changes"""
+    try:
+        names = sorted(os.listdir(models_dir))
+    except OSError:
+        return ()
+
+    signature = []
+    for name in names:
+        if not name.endswith(MODEL_FILE_EXTENSIONS):
+            continue
+        try:
+            stat = os.stat(os.path.join(models_dir, name))
+        except OSError:
+            continue
+        signature.append((name, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+class ModelWatcher(threading.Thread):
+    """Poll models_dir and call on_change() when its model files change.
+
+    A change is only acted on once the directory has looked the same for
+    two polls in a row, so a retrain that is still writing files is not
+    picked up half-way.
+    """
+
+    def __init__(self, models_dir, on_change, interval=5.0):
+        super().__init__(name='model-watcher', daemon=True)
+        self.models_dir = models_dir
+        self.on_change = on_change
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        current = models_dir_signature(self.models_dir)
+        pending = None
+        while not self._stop_event.wait(self.interval):
+            signature = models_dir_signature(self.models_dir)
+            if signature == current:
+                pending = None
+            elif signature != pending:
+                pending = signature
+            else:
+                current = signature
+                pending = None
+                try:
+                    self.on_change()
+                except Exception as e:
+                    print(f"⚠️ Model reload after change failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
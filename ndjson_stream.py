@@ -0,0 +1,134 @@
+# ndjson_stream.py - incremental NDJSON scoring for /api/predict/stream
+"""Score a newline-delimited JSON request body without buffering it.
+
+Every input line is one JSON object like the /api/predict/batch items,
+{"id": "msg-1", "email": "..."}. The body is read one line at a time,
+lines are grouped into chunks of at most chunk_size emails or chunk_bytes
+bytes, and each chunk is scored with one pipeline call and yielded as
+NDJSON result lines before the next chunk is read.
+
+Memory stays bounded by one chunk (plus one line of max_line_bytes)
+whatever the payload size. The generator is pull-based: the WSGI server
+only asks for the next chunk once the previous one has been written to
+the socket, so a slow client stalls reading instead of piling up results.
+Clients must read the response while they are still sending the body.
+
+Bad lines (invalid JSON, no "email" string, longer than max_line_bytes)
+become per-line error results. The last line is a summary,
+{"done": true, "count": ..., "errors": ...}; a stream without it was cut
+short.
+"""
+import io
+import json
+
+READ_SIZE = 65536
+
+def iter_lines(stream, max_line_bytes):
+    """Yield (line number, line bytes) from a binary stream
+
+    Lines longer than max_line_bytes are drained without being kept and
+    yielded as None.
+    """
+    if isinstance(stream, io.RawIOBase):
+        # Raw streams (werkzeug's chunked input among them) read a line one byte at a time
+        stream = io.BufferedReader(stream, READ_SIZE)
+    number = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        number += 1
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            while True:
+                rest = stream.readline(READ_SIZE)
+                if not rest or rest.endswith(b'\n'):
+                    break
+            yield number, None
+            continue
+        yield number, line
+
+def parse_line(number, line, max_line_bytes):
+    """(id, email text, error) for one input line; None for a blank line"""
+    if line is None:
+        return number, None, f'Line longer than {max_line_bytes} bytes'
+    if not line.strip():
+        return None
+    try:
+        item = json.loads(line)
+    except ValueError:
+        return number, None, 'Line is not valid JSON'
+    if not isinstance(item, dict):
+        return number, None, 'Line must be an object with an "email" string'
+    item_id = item.get('id', number)
+    email_text = item.get('email')
+    if not isinstance(email_text, str):
+        return item_id, None, 'Line must be an object with an "email" string'
+    if not email_text.strip():
+        return item_id, None, 'Email text is required'
+    return item_id, email_text, None
+
+def _dump(record):
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+class StreamScorer:
+    """Turns (line number, line) pairs into NDJSON result chunks"""
+
+    def __init__(self, pipeline, format_result, chunk_size=64, chunk_bytes=8 * 2 ** 20,
+                 max_line_bytes=4 * 2 ** 20, top_k=None, on_error=None):
+        self.pipeline = pipeline
+        self.format_result = format_result
+        self.chunk_size = chunk_size
+        self.chunk_bytes = chunk_bytes
+        self.max_line_bytes = max_line_bytes
+        self.top_k = top_k
+        self.on_error = on_error
+        self.count = 0
+        self.errors = 0
+
+    def _score_chunk(self, items):
+        results = []
+        texts = [text for _, text, error in items if error is None]
+        scores = iter(())
+        if texts:
+            try:
+                if self.top_k:
+                    scores = iter(self.pipeline.explain(texts, self.top_k))
+                else:
+                    scores = iter(self.pipeline.score(texts))
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(e)
+                items = [(item_id, None, str(e)) if error is None else (item_id, text, error)
+                         for item_id, text, error in items]
+        for item_id, _, error in items:
+            if error is not None:
+                results.append({'id': item_id, 'error': error})
+                continue
+            score = next(scores)
+            result = {'id': item_id}
+            result.update(self.format_result(score[0], score[1]))
+            if self.top_k:
+                result['explanation'] = score[2]
+            results.append(result)
+        self.count += len(results)
+        self.errors += sum('error' in result for result in results)
+        return ''.join(_dump(result) for result in results).encode('utf-8')
+
+    def iter_results(self, lines, summary=None):
+        """Yield one bytes block of NDJSON results per chunk, then the summary line"""
+        items = []
+        size = 0
+        for number, line in lines:
+            item = parse_line(number, line, self.max_line_bytes)
+            if item is None:
+                continue
+            items.append(item)
+            size += len(line) if line is not None else 0
+            if len(items) >= self.chunk_size or size >= self.chunk_bytes:
+                chunk, items, size = items, [], 0
+                yield self._score_chunk(chunk)
+        if items:
+            yield self._score_chunk(items)
+        trailer = {'done': True, 'count': self.count, 'errors': self.errors}
+        trailer.update(summary or {})
+        yield _dump(trailer).encode('utf-8')
@@ -0,0 +1,266 @@
+# online_model.py - incrementally updated model fed by user feedback
+"""Online learning variant of the spam model.
+
+The feature space is a stateless HashingVectorizer, so there is no
+vocabulary to refit, and the classifier is an SGDClassifier with log loss,
+which supports partial_fit and predict_proba. Labeled feedback is queued
+by OnlineLearner and applied in mini-batches on a background thread.
+
+Every update is applied to a copy of the classifier, and the copy is then
+handed to on_update(), which swaps it in. Requests keep scoring on the
+previous model and never wait for an update. Snapshots are written
+atomically to models/online/ (SPAM_ONLINE_DIR) every snapshot_interval
+seconds and on shutdown.
+
+    python online_model.py bootstrap    # initial model from the data/ corpus
+
+Learning happens per process: run the app with a single worker when
+online mode is on, otherwise each worker learns only from its own feedback.
+"""
+import argparse
+import copy
+import os
+import queue
+import sys
+import threading
+import time
+
+import joblib
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+from inference import _identity, clean_email
+
+ONLINE_VECTORIZER_FILENAME = 'online_vectorizer.joblib'
+ONLINE_MODEL_FILENAME = 'online_model.joblib'
+DEFAULT_ONLINE_DIR = os.path.join('models', 'online')
+CLASSES = [0, 1]
+
+def build_online_vectorizer(n_features=2 ** 20):
+    """Stateless vectorizer over the same tokens as the TF-IDF model"""
+    return HashingVectorizer(
+        preprocessor=clean_email,
+        stop_words='english',
+        ngram_range=(1, 2),
+        token_pattern=r'\b[a-zA-Z]{2,}\b',
+        n_features=n_features,
+        alternate_sign=False,
+        norm='l2'
+    )
+
+def build_online_classifier(alpha=1e-6):
+    return SGDClassifier(loss='log_loss', alpha=alpha, random_state=42)
+
+def save_online_pair(online_dir, vectorizer, model):
+    """Write the pair atomically (temporary files + os.replace)"""
+    os.makedirs(online_dir, exist_ok=True)
+    for filename, obj in ((ONLINE_VECTORIZER_FILENAME, vectorizer), (ONLINE_MODEL_FILENAME, model)):
+        path = os.path.join(online_dir, filename)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(obj, tmp_path)
+        os.replace(tmp_path, path)
+
+def load_online_pair(online_dir=DEFAULT_ONLINE_DIR):
+    """Load (vectorizer, model) from online_dir, or return None"""
+    vectorizer_path = os.path.join(online_dir, ONLINE_VECTORIZER_FILENAME)
+    model_path = os.path.join(online_dir, ONLINE_MODEL_FILENAME)
+    if not (os.path.exists(vectorizer_path) and os.path.exists(model_path)):
+        print(f"❌ No online model in {online_dir}; run 'python online_model.py bootstrap'")
+        return None
+    print(f"📦 Loading online model from: {online_dir}")
+    return joblib.load(vectorizer_path), joblib.load(model_path)
+
+def partial_fit_cleaned(vectorizer, model, cleaned_texts, labels):
+    """One partial_fit step on already-cleaned texts
+
+    Goes through a copy of the vectorizer with clean_email bypassed, exactly
+    like InferencePipeline does when scoring.
+    """
+    fit_vectorizer = copy.copy(vectorizer)
+    fit_vectorizer.preprocessor = _identity
+    model.partial_fit(fit_vectorizer.transform(cleaned_texts), labels, classes=CLASSES)
+
+class OnlineLearner:
+    """Background thread that applies queued feedback in mini-batches"""
+
+    def __init__(self, vectorizer, model, on_update, batch_size=32, max_delay=5.0,
+                 max_queue=10000, snapshot_dir=DEFAULT_ONLINE_DIR, snapshot_interval=300.0):
+        self.vectorizer = vectorizer
+        self.model = model
+        self.on_update = on_update
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_interval = snapshot_interval
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._reset_to = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._last_snapshot = time.monotonic()
+        self._dirty = False
+        self.received = 0
+        self.applied = 0
+        self.updates = 0
+        self.snapshots = 0
+        self.last_update_seconds = None
+        self.last_error = None
+
+    def submit(self, email_text, label):
+        """Queue one labeled email (label 0 = ham, 1 = spam); raises queue.Full"""
+        self._ensure_running()
+        self._queue.put_nowait((clean_email(email_text), int(label)))
+        self.received += 1
+
+    def reset(self, vectorizer, model):
+        """Continue learning from a freshly loaded pair (picked up before the next update)"""
+        self._reset_to = (vectorizer, model)
+
+    def _ensure_running(self):
+        # Threads do not survive fork, so each process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='online-learner', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        """Block for the first item, then collect up to batch_size within max_delay"""
+        try:
+            batch = [self._queue.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._next_batch()
+            if batch:
+                self.apply(batch)
+            if self._dirty and time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+                self.snapshot()
+
+    def apply(self, batch):
+        """Fit a copy of the model on [(cleaned text, label), ...] and publish it"""
+        start_time = time.perf_counter()
+        if self._reset_to is not None:
+            (self.vectorizer, self.model), self._reset_to = self._reset_to, None
+        try:
+            updated = copy.deepcopy(self.model)
+            partial_fit_cleaned(self.vectorizer, updated, [text for text, _ in batch],
+                                [label for _, label in batch])
+            self.on_update(self.vectorizer, updated)
+            self.model = updated
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"⚠️ Online update failed: {e}")
+            return False
+        self.applied += len(batch)
+        self.updates += 1
+        self.last_update_seconds = time.perf_counter() - start_time
+        self._dirty = True
+        return True
+
+    def snapshot(self):
+        try:
+            save_online_pair(self.snapshot_dir, self.vectorizer, self.model)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"⚠️ Online model snapshot failed: {e}")
+            return False
+        self._last_snapshot = time.monotonic()
+        self._dirty = False
+        self.snapshots += 1
+        return True
+
+    def stop(self):
+        """Stop the thread and write a final snapshot if anything changed"""
+        self._stop_event.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+        if self._dirty:
+            self.snapshot()
+
+    def stats(self):
+        return {
+            'enabled': True,
+            'queued': self._queue.qsize(),
+            'received': self.received,
+            'applied': self.applied,
+            'updates': self.updates,
+            'snapshots': self.snapshots,
+            'batch_size': self.batch_size,
+            'last_update_ms': round(self.last_update_seconds * 1000, 3) if self.last_update_seconds else None,
+            'last_error': self.last_error,
+            'snapshot_dir': self.snapshot_dir,
+        }
+
+def online_enabled():
+    return os.environ.get('SPAM_ONLINE', '0').lower() in ('1', 'true', 'yes')
+
+def online_learner_from_env(vectorizer, model, on_update):
+    """Build the app's learner from SPAM_ONLINE_* variables"""
+    return OnlineLearner(
+        vectorizer, model, on_update,
+        batch_size=int(os.environ.get('SPAM_ONLINE_BATCH_SIZE', 32)),
+        max_delay=float(os.environ.get('SPAM_ONLINE_MAX_DELAY', 5.0)),
+        max_queue=int(os.environ.get('SPAM_ONLINE_MAX_QUEUE', 10000)),
+        snapshot_dir=os.environ.get('SPAM_ONLINE_DIR', DEFAULT_ONLINE_DIR),
+        snapshot_interval=float(os.environ.get('SPAM_ONLINE_SNAPSHOT_INTERVAL', 300)),
+    )
+
+def bootstrap(online_dir, epochs=3, batch_size=1000):
+    """Train the initial online model from the data/ corpus with partial_fit passes"""
+    from corpus import HAM_FOLDERS, SPAM_FOLDERS, load_corpus
+    import random
+
+    texts, labels = load_corpus(HAM_FOLDERS, SPAM_FOLDERS)
+    if not texts:
+        print("❌ No emails loaded from data/")
+        return 1
+
+    vectorizer = build_online_vectorizer()
+    model = build_online_classifier()
+    order = list(range(len(texts)))
+    rng = random.Random(42)
+    start_time = time.perf_counter()
+    for epoch in range(epochs):
+        rng.shuffle(order)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            partial_fit_cleaned(vectorizer, model, [texts[i] for i in indices],
+                                [labels[i] for i in indices])
+        print(f"🔁 Epoch {epoch + 1}/{epochs} done")
+    print(f"⏱️ Trained on {len(texts)} emails in {time.perf_counter() - start_time:.2f}s")
+
+    save_online_pair(online_dir, vectorizer, model)
+    print(f"✅ Online model saved in {online_dir}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the online (incremental) spam model")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    bootstrap_parser = subparsers.add_parser('bootstrap', help='train the initial online model')
+    bootstrap_parser.add_argument('--online-dir', default=os.environ.get('SPAM_ONLINE_DIR', DEFAULT_ONLINE_DIR))
+    bootstrap_parser.add_argument('--epochs', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == 'bootstrap':
+        return bootstrap(args.online_dir, epochs=args.epochs)
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
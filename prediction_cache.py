@@ -0,0 +1,232 @@
+# prediction_cache.py - content-addressed prediction cache
+"""In-process LRU cache of predictions keyed by the cleaned email body.
+
+Keys are sha256(model_version + cleaned text), so header-only variants of
+the same campaign hit the same entry, and entries from an older model can
+never be served for a newer one. The cache is bounded by entry count and by
+approximate bytes, evicts least-recently-used entries first and can expire
+entries after a TTL.
+
+An optional FileCacheBackend stores entries in a shared directory so several
+worker processes on one host can reuse each other's results.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Rough per-entry overhead of the OrderedDict slot, key and tuple
+ENTRY_OVERHEAD_BYTES = 200
+
+def make_cache_key(cleaned_text, model_version):
+    """Content-addressed key for a cleaned email under one model version"""
+    digest = hashlib.sha256()
+    digest.update(str(model_version).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(cleaned_text.encode('utf-8', 'surrogatepass'))
+    return digest.hexdigest()
+
+class FileCacheBackend:
+    """Shared on-disk store: one small JSON file per key.
+
+    Writes go through a temporary file and os.replace, so concurrent readers
+    in other processes only ever see complete entries. Every prune_interval
+    writes, a background thread prunes the directory back to max_entries
+    (oldest first), so no request waits for the walk.
+    """
+
+    def __init__(self, directory, max_entries=100000, ttl=None, prune_interval=1000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._pruner = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        with self._lock:
+            self._writes += 1
+            if self._writes % self.prune_interval or (self._pruner is not None and self._pruner.is_alive()):
+                return
+            self._pruner = threading.Thread(target=self.prune, name='cache-prune', daemon=True)
+            self._pruner.start()
+
+    def prune(self):
+        """Drop the oldest entries beyond max_entries and anything past the TTL"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        entries.sort()
+
+        now = time.time()
+        excess = len(entries) - self.max_entries
+        for index, (mtime, path) in enumerate(entries):
+            expired = self.ttl is not None and now - mtime > self.ttl
+            if index < excess or expired:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                try:
+                    os.remove(os.path.join(root, filename))
+                except OSError:
+                    pass
+
+class PredictionCache:
+    """Thread-safe LRU cache with entry/byte bounds and an optional TTL"""
+
+    def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024, ttl=None, backend=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.backend = backend
+
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires_at = entry
+                if expires_at is not None and time.monotonic() > expires_at:
+                    self._remove(key)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+        if self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """Cache a JSON-serialisable value"""
+        if not self.enabled:
+            return
+        self._store(key, value)
+        if self.backend is not None:
+            self.backend.put(key, value)
+
+    def _store(self, key, value):
+        size = len(key) + len(json.dumps(value)) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def flush(self):
+        """Drop every local entry (called when a new model is loaded)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared_hits': self.shared_hits,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'shared_backend': self.backend.directory if self.backend is not None else None,
+            }
+
+def cache_from_env():
+    """Build the app's prediction cache from SPAM_CACHE_* environment variables"""
+    ttl = os.environ.get('SPAM_CACHE_TTL')
+    ttl = float(ttl) if ttl else None
+
+    backend = None
+    shared_dir = os.environ.get('SPAM_CACHE_DIR')
+    if shared_dir:
+        backend = FileCacheBackend(
+            shared_dir,
+            max_entries=int(os.environ.get('SPAM_CACHE_SHARED_MAX_ENTRIES', 100000)),
+            ttl=ttl,
+        )
+
+    return PredictionCache(
+        max_entries=int(os.environ.get('SPAM_CACHE_MAX_ENTRIES', 10000)),
+        max_bytes=int(os.environ.get('SPAM_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+        ttl=ttl,
+        backend=backend,
+    )
@@ -0,0 +1,252 @@
+# serve.py - production pre-fork server for the spam detector
+"""Production serving entry point.
+
+The parent process imports app.py, which loads the model once, then binds
+the listening socket and forks the workers. The workers share the model
+pages copy-on-write and accept connections from the same socket. Each worker
+serves requests from a bounded thread pool.
+
+    python serve.py --workers 4 --threads 8 --port 5000
+
+Signals sent to the parent:
+    SIGTERM / SIGINT  graceful shutdown: workers stop accepting, finish
+                      in-flight requests (up to --graceful-timeout) and exit
+    SIGHUP            every worker reloads the model from models/
+
+Readiness: GET /ready returns 200 once the model is loaded.
+
+A worker that dies is forked again; one that dies within seconds of
+starting is restarted with exponential backoff instead of in a tight loop.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# A worker that exits sooner than this after being forked counts as a
+# crash loop; its restarts are delayed 0.5s, 1s, 2s, ... up to the maximum
+WORKER_STABLE_SECONDS = 10.0
+RESTART_BACKOFF_MIN = 0.5
+RESTART_BACKOFF_MAX = 30.0
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler without per-request access logging.
+
+    Connections are closed after each response, so an idle keep-alive
+    client can never hold one of the worker's pool threads.
+    """
+    protocol_version = 'HTTP/1.0'
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server that handles connections on a fixed-size thread pool.
+
+    When every thread is busy the accept loop blocks, so excess connections
+    wait in the kernel backlog instead of piling up in memory.
+    """
+    multithread = True
+
+    def __init__(self, host, port, app, fd, threads, handler=QuietRequestHandler):
+        super().__init__(host, port, app, handler=handler, fd=fd)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+        self.slots = threading.BoundedSemaphore(threads)
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        self.pool.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+def run_worker(app_module, listen_fd, host, port, threads):
+    """Worker process body: serve until SIGTERM, then finish in-flight requests"""
+    server = PooledWSGIServer(host, port, app_module.app, fd=listen_fd, threads=threads)
+
+    def handle_term(signum, frame):
+        # shutdown() blocks until serve_forever() returns, so call it from
+        # another thread rather than from the main thread's signal handler
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    def handle_hup(signum, frame):
+        app_module.start_background_reload()
+
+    signal.signal(signal.SIGTERM, handle_term)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, handle_hup)
+
+    # Threads do not survive fork
+    app_module.start_model_watcher()
+
+    server.serve_forever(poll_interval=0.2)
+    # The parent SIGKILLs workers that overrun --graceful-timeout
+    server.pool.shutdown(wait=True)
+    # os._exit() skips atexit, so flush this worker's log events here
+    app_module.request_log.close()
+
+class Arbiter:
+    """Parent process: owns the socket, forks and supervises workers"""
+
+    def __init__(self, app_module, listen_socket, args):
+        self.app_module = app_module
+        self.listen_socket = listen_socket
+        self.args = args
+        self.workers = {}
+        self.stopping = False
+        self.restart_delay = 0.0
+        self.restart_at = []
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                # The parent's log queue and writer thread are not usable here
+                self.app_module.request_log.after_fork()
+                run_worker(self.app_module, self.listen_socket.fileno(),
+                           self.args.host, self.args.port, self.args.threads)
+            except Exception as e:
+                print(f"❌ Worker {os.getpid()} crashed: {e}", file=sys.stderr)
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self.workers[pid] = time.monotonic()
+        return pid
+
+    def schedule_restart(self, pid, status):
+        """Queue a replacement for a dead worker, backing off if it died young"""
+        now = time.monotonic()
+        uptime = now - self.workers.pop(pid, now)
+        if uptime >= WORKER_STABLE_SECONDS:
+            self.restart_delay = 0.0
+        else:
+            self.restart_delay = min(RESTART_BACKOFF_MAX,
+                                     max(RESTART_BACKOFF_MIN, self.restart_delay * 2))
+        if self.restart_delay:
+            print(f"⚠️ Worker {pid} exited with status {status} after {uptime:.1f}s, "
+                  f"restarting in {self.restart_delay:.1f}s")
+        else:
+            print(f"⚠️ Worker {pid} exited with status {status}, restarting")
+        self.restart_at.append(now + self.restart_delay)
+
+    def spawn_due_workers(self):
+        now = time.monotonic()
+        due = [at for at in self.restart_at if at <= now]
+        self.restart_at = [at for at in self.restart_at if at > now]
+        for _ in due:
+            self.spawn_worker()
+
+    def signal_workers(self, signum):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                self.workers.pop(pid, None)
+
+    def handle_stop(self, signum, frame):
+        if not self.stopping:
+            print(f"🛑 Shutting down {len(self.workers)} worker(s) gracefully...")
+            self.stopping = True
+            self.signal_workers(signal.SIGTERM)
+
+    def handle_hup(self, signum, frame):
+        print("🔄 Reloading model in all workers...")
+        self.signal_workers(signal.SIGHUP)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_hup)
+
+        for _ in range(self.args.workers):
+            self.spawn_worker()
+        print(f"✅ Serving on http://{self.args.host}:{self.args.port} "
+              f"with {self.args.workers} worker(s) x {self.args.threads} thread(s)")
+
+        stop_deadline = None
+        while self.workers or (self.restart_at and not self.stopping):
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                # No live children; only restarts that are backing off remain
+                self.workers.clear()
+                pid, status = 0, 0
+
+            if pid == 0:
+                if self.stopping:
+                    if stop_deadline is None:
+                        stop_deadline = time.monotonic() + self.args.graceful_timeout
+                    elif time.monotonic() > stop_deadline:
+                        print("⚠️ Workers did not exit in time, killing them")
+                        self.signal_workers(signal.SIGKILL)
+                else:
+                    self.spawn_due_workers()
+                time.sleep(0.2)
+                continue
+
+            if self.stopping:
+                self.workers.pop(pid, None)
+            else:
+                self.schedule_restart(pid, status)
+
+        self.listen_socket.close()
+        print("👋 All workers stopped")
+
+def bind_socket(host, port, backlog):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    listen_socket = socket.socket(family, socket.SOCK_STREAM)
+    listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listen_socket.bind((host, port))
+    listen_socket.listen(backlog)
+    listen_socket.set_inheritable(True)
+    return listen_socket
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork production server for the spam detector")
+    parser.add_argument('--host', default=os.environ.get('SPAM_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('SPAM_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SPAM_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('SPAM_THREADS', 4)))
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--graceful-timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        print("❌ serve.py needs os.fork(); use a WSGI server with wsgi:app on this platform")
+        return 1
+
+    # Load the model once in the parent; workers inherit it copy-on-write
+    import app as app_module
+    if app_module.model_handle is None:
+        print("⚠️ Model not loaded; workers will report not ready until a reload succeeds")
+
+    # The parent's watcher thread would not be inherited by the workers
+    if app_module.model_watcher is not None:
+        app_module.model_watcher.stop()
+        app_module.model_watcher = None
+
+    # Move everything allocated so far out of the GC's reach, so collections
+    # in the workers do not touch (and copy) the shared model pages
+    gc.collect()
+    gc.freeze()
+
+    listen_socket = bind_socket(args.host, args.port, args.backlog)
+    Arbiter(app_module, listen_socket, args).run()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+# shadow_eval.py - score sampled live traffic with a candidate model
+"""Shadow evaluation of a candidate model off the request path.
+
+The primary model answers every request. offer() samples a fraction of
+them and puts (email, primary verdict) on a bounded queue with
+put_nowait, so a full queue drops the sample instead of blocking the
+request. A small pool of background threads scores the queued emails
+with the candidate model and aggregates how the two compare: agreement
+rate, a confusion matrix of the verdicts, spam probability deltas and
+the candidate's per-email latency.
+
+Candidates are retrained models (create_model.py / train_model.py
+output) saved to their own directory, SPAM_SHADOW_DIR. Stats are reset
+whenever either model changes; samples queued for an older primary model
+are discarded.
+
+Configured with SPAM_SHADOW_DIR (enables shadow mode),
+SPAM_SHADOW_SAMPLE_RATE (default 0.1), SPAM_SHADOW_MAX_QUEUE and
+SPAM_SHADOW_WORKERS. Like the other background helpers it runs per
+process: behind serve.py each worker keeps its own stats.
+"""
+import os
+import queue
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+# Upper bounds of the |candidate - primary| spam probability histogram
+DELTA_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5)
+
+# Per-email candidate latencies kept for the percentiles
+LATENCY_WINDOW = 2048
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+class ShadowEvaluator:
+    """Bounded queue + worker threads comparing a candidate with the primary model"""
+
+    def __init__(self, candidate_dir, sample_rate=0.1, max_queue=1000, workers=1):
+        self.candidate_dir = candidate_dir
+        self.sample_rate = sample_rate
+        self.workers = workers
+        self.candidate = None
+        self.primary_version = None
+        self.last_error = None
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.offered = 0
+        self.sampled = 0
+        self.dropped = 0
+        self.stale = 0
+        self.errors = 0
+        self.since = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        # (primary, candidate) verdict -> count
+        self.confusion = {(0, 0): 0, (0, 1): 0, (1, 0): 0, (1, 1): 0}
+        self.delta_sum = 0.0
+        self.abs_delta_sum = 0.0
+        self.max_abs_delta = 0.0
+        self.delta_counts = [0] * (len(DELTA_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def reset(self, primary_version, candidate=None):
+        """Compare against a new primary (and optionally candidate) from now on"""
+        with self._stats_lock:
+            self.primary_version = primary_version
+            if candidate is not None:
+                self.candidate = candidate
+            self._reset_stats()
+
+    def offer(self, email_text, primary_version, prediction, spam_probability):
+        """Maybe queue one primary verdict for shadow scoring; never blocks
+
+        Returns True if the email was queued.
+        """
+        # Request threads and shadow workers all update the counters
+        with self._stats_lock:
+            self.offered += 1
+        if self.candidate is None or random.random() >= self.sample_rate:
+            return False
+        self._ensure_running()
+        try:
+            self._queue.put_nowait((email_text, primary_version, int(prediction), float(spam_probability)))
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+        with self._stats_lock:
+            self.sampled += 1
+        return True
+
+    def _ensure_running(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._threads and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if not self._threads or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._threads = [threading.Thread(target=self._run, name=f'shadow-{index}', daemon=True)
+                                 for index in range(self.workers)]
+                for thread in self._threads:
+                    thread.start()
+
+    def _run(self):
+        while True:
+            email_text, primary_version, prediction, spam_probability = self._queue.get()
+            candidate = self.candidate
+            if primary_version != self.primary_version or candidate is None:
+                with self._stats_lock:
+                    self.stale += 1
+                continue
+            try:
+                start = time.perf_counter()
+                candidate_prediction, candidate_proba = candidate.score([email_text])[0]
+                seconds = time.perf_counter() - start
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                    self.last_error = str(e)
+                continue
+            self._record(primary_version, prediction, spam_probability,
+                         int(candidate_prediction), float(candidate_proba[1]), seconds)
+
+    def _record(self, primary_version, prediction, spam_probability,
+                candidate_prediction, candidate_spam_probability, seconds):
+        delta = candidate_spam_probability - spam_probability
+        with self._stats_lock:
+            if primary_version != self.primary_version:
+                self.stale += 1
+                return
+            self.confusion[(prediction, candidate_prediction)] += 1
+            self.delta_sum += delta
+            self.abs_delta_sum += abs(delta)
+            self.max_abs_delta = max(self.max_abs_delta, abs(delta))
+            self.delta_counts[bisect_left(DELTA_BUCKETS, abs(delta))] += 1
+            self.latency_sum += seconds
+            self.latencies.append(seconds)
+
+    def stats(self):
+        with self._stats_lock:
+            compared = sum(self.confusion.values())
+            agreed = self.confusion[(0, 0)] + self.confusion[(1, 1)]
+            latencies = sorted(self.latencies)
+            labels = [f'<={bound}' for bound in DELTA_BUCKETS] + [f'>{DELTA_BUCKETS[-1]}']
+            return {
+                'enabled': True,
+                'candidate_dir': self.candidate_dir,
+                'candidate_version': self.candidate.version if self.candidate is not None else None,
+                'primary_version': self.primary_version,
+                'since': self.since,
+                'sample_rate': self.sample_rate,
+                'workers': self.workers,
+                'queued': self._queue.qsize(),
+                'offered': self.offered,
+                'sampled': self.sampled,
+                'dropped': self.dropped,
+                'stale': self.stale,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                'compared': compared,
+                'agreement_rate': round(agreed / compared, 6) if compared else None,
+                'verdicts': {
+                    'both_ham': self.confusion[(0, 0)],
+                    'both_spam': self.confusion[(1, 1)],
+                    'primary_ham_candidate_spam': self.confusion[(0, 1)],
+                    'primary_spam_candidate_ham': self.confusion[(1, 0)],
+                },
+                'spam_probability_delta': {
+                    'mean': round(self.delta_sum / compared, 6) if compared else None,
+                    'mean_abs': round(self.abs_delta_sum / compared, 6) if compared else None,
+                    'max_abs': round(self.max_abs_delta, 6),
+                    'abs_histogram': dict(zip(labels, self.delta_counts)),
+                },
+                'candidate_latency_ms': {
+                    'mean': round(self.latency_sum * 1000 / compared, 3) if compared else None,
+                    'p50': round(_percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+                    'p95': round(_percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+                    'p99': round(_percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+                },
+            }
+
+def shadow_from_env():
+    """Build the app's shadow evaluator from SPAM_SHADOW_* variables (None if disabled)"""
+    candidate_dir = os.environ.get('SPAM_SHADOW_DIR')
+    if not candidate_dir:
+        return None
+    return ShadowEvaluator(
+        candidate_dir,
+        sample_rate=float(os.environ.get('SPAM_SHADOW_SAMPLE_RATE', 0.1)),
+        max_queue=int(os.environ.get('SPAM_SHADOW_MAX_QUEUE', 1000)),
+        workers=int(os.environ.get('SPAM_SHADOW_WORKERS', 1)),
+    )
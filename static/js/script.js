@@ -17,9 +17,11 @@ const hamPercent = document.getElementById('hamPercent');
 const spamPercent = document.getElementById('spamPercent');
 const hamBar = document.getElementById('hamBar');
 const spamBar = document.getElementById('spamBar');
-const urlCount = document.getElementById('urlCount');
-const numberCount = document.getElementById('numberCount');
-const suspiciousCount = document.getElementById('suspiciousCount');
+const spamSignalCount = document.getElementById('spamSignalCount');
+const hamSignalCount = document.getElementById('hamSignalCount');
+const topSignal = document.getElementById('topSignal');
+const spamSignals = document.getElementById('spamSignals');
+const hamSignals = document.getElementById('hamSignals');
 const analysisTime = document.getElementById('analysisTime');
 const toast = document.getElementById('toast');
 const toastMessage = document.getElementById('toastMessage');
@@ -32,9 +34,15 @@ const exportResultsBtn = document.getElementById('exportResults');
 const refreshModelBtn = document.getElementById('refreshModel');
 const resultsSection = document.getElementById('resultsSection');
 const resultsHighlight = document.getElementById('resultsHighlight');
-const featureURLs = document.getElementById('featureURLs');
-const featureNumbers = document.getElementById('featureNumbers');
-const featureSuspicious = document.getElementById('featureSuspicious');
+const featureSpamSignals = document.getElementById('featureSpamSignals');
+const featureHamSignals = document.getElementById('featureHamSignals');
+const featureTopSignal = document.getElementById('featureTopSignal');
+
+// N-grams per direction the server explains each verdict with
+const EXPLAIN_TOP_K = 8;
+
+// Explanation of the last verdict (exported with the results)
+let lastExplanation = null;
 
 // Sample Emails
 const sampleEmails = {
@@ -145,19 +153,6 @@ PayPal Security Team
 24/7 Customer Support`
 };
 
-// Suspicious words for feature detection
-const suspiciousWords = [
-    'win', 'won', 'winner', 'prize', 'reward', 'award', 'gift', 'free',
-    'congratulations', 'congrats', 'urgent', 'immediate', 'alert', 'warning',
-    'limited', 'offer', 'deal', 'discount', 'sale', 'bonus', 'cash', 'money',
-    'million', 'thousand', 'hundred', 'dollar', '£', '$', '€', 'click', 'link',
-    'http', 'www', 'subscribe', 'unsubscribe', 'guaranteed', 'risk-free',
-    'act now', 'don\'t miss', 'last chance', 'expire', 'expires', 'expiring',
-    'claim', 'verify', 'confirm', 'validate', 'update', 'suspend', 'suspended',
-    'compromise', 'compromised', 'hack', 'hacked', 'security', 'secure',
-    'password', 'login', 'credentials', 'account', 'bank', 'credit', 'card'
-];
-
 // Initialize
 document.addEventListener('DOMContentLoaded', function() {
     console.log('Spam Detector Initialized');
@@ -165,7 +160,6 @@ document.addEventListener('DOMContentLoaded', function() {
     // Set up event listeners
     if (emailInput) {
         emailInput.addEventListener('input', updateCounters);
-        emailInput.addEventListener('input', analyzeTextFeatures);
     }
     
     if (clearBtn) {
@@ -173,7 +167,6 @@ document.addEventListener('DOMContentLoaded', function() {
             if (emailInput) {
                 emailInput.value = '';
                 updateCounters();
-                analyzeTextFeatures();
                 resetResults();
                 showToast('Email content cleared', 'info');
             }
@@ -203,7 +196,6 @@ document.addEventListener('DOMContentLoaded', function() {
             if (sampleEmails[type] && emailInput) {
                 emailInput.value = sampleEmails[type];
                 updateCounters();
-                analyzeTextFeatures();
                 
                 // Add visual feedback
                 this.classList.add('active');
@@ -277,7 +269,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Initialize UI
     updateCounters();
-    analyzeTextFeatures();
+    renderExplanation(null);
     setStatus('ready', 'Ready to analyze');
     
     // Auto-hide toast
@@ -306,29 +298,62 @@ function updateCounters() {
     }
 }
 
-// Analyze text features
-function analyzeTextFeatures() {
-    if (!emailInput || !urlCount || !numberCount || !suspiciousCount) return;
+// Show the n-grams the model weighed for the last verdict
+function renderExplanation(explanation) {
+    lastExplanation = explanation || null;
+    const spam = explanation ? explanation.spam : [];
+    const ham = explanation ? explanation.ham : [];
     
-    const text = emailInput.value.toLowerCase();
+    if (spamSignalCount) spamSignalCount.textContent = spam.length;
+    if (hamSignalCount) hamSignalCount.textContent = ham.length;
     
-    // Count URLs
-    const urls = (text.match(/https?:\/\/[^\s]+/g) || []).length;
-    if (urlCount) urlCount.textContent = urls;
+    if (topSignal) {
+        const strongest = spam.concat(ham).sort((a, b) => Math.abs(b.weight) - Math.abs(a.weight))[0];
+        topSignal.textContent = strongest ? strongest.term : '--';
+    }
     
-    // Count numbers
-    const numbers = (text.match(/\d+/g) || []).length;
-    if (numberCount) numberCount.textContent = numbers;
+    // Bars are relative to the strongest term in either direction
+    const maxWeight = Math.max(0, ...spam.concat(ham).map(signal => Math.abs(signal.weight)));
+    const emptyText = explanation === undefined
+        ? 'Not available in demo mode'
+        : 'Analyze an email to see the terms the model weighed';
+    fillSignalList(spamSignals, spam, maxWeight, emptyText);
+    fillSignalList(hamSignals, ham, maxWeight, emptyText);
+}
+
+function fillSignalList(list, signals, maxWeight, emptyText) {
+    if (!list) return;
+    list.innerHTML = '';
     
-    // Count suspicious words
-    let suspicious = 0;
-    suspiciousWords.forEach(word => {
-        const regex = new RegExp(`\\b${word}\\b`, 'i');
-        if (regex.test(text)) {
-            suspicious++;
-        }
+    if (!signals.length) {
+        const item = document.createElement('li');
+        item.className = 'signal-empty';
+        item.textContent = emptyText;
+        list.appendChild(item);
+        return;
+    }
+    
+    signals.forEach(signal => {
+        const item = document.createElement('li');
+        
+        const term = document.createElement('span');
+        term.className = 'signal-term';
+        term.textContent = signal.term;
+        term.title = signal.term;
+        
+        const bar = document.createElement('span');
+        bar.className = 'signal-bar';
+        const fill = document.createElement('span');
+        fill.style.width = `${maxWeight ? Math.abs(signal.weight) / maxWeight * 100 : 0}%`;
+        bar.appendChild(fill);
+        
+        const weight = document.createElement('span');
+        weight.className = 'signal-weight';
+        weight.textContent = (signal.weight > 0 ? '+' : '') + signal.weight.toFixed(3);
+        
+        item.append(term, bar, weight);
+        list.appendChild(item);
     });
-    if (suspiciousCount) suspiciousCount.textContent = suspicious;
 }
 
 // Set status
@@ -413,7 +438,7 @@ function highlightResults() {
     }
     
     // Highlight features one by one
-    const features = [featureURLs, featureNumbers, featureSuspicious];
+    const features = [featureSpamSignals, featureHamSignals, featureTopSignal];
     features.forEach((feature, index) => {
         if (feature) {
             setTimeout(() => {
@@ -446,6 +471,7 @@ async function analyzeEmail() {
         // Send to backend
         const formData = new FormData();
         formData.append('email', emailInput.value);
+        formData.append('explain', EXPLAIN_TOP_K);
         
         const response = await fetch('/predict', {
             method: 'POST',
@@ -534,6 +560,9 @@ function updateResults(data) {
         if (spamBar) spamBar.style.width = `${spamProb}%`;
     }, 100);
     
+    // Terms the model weighed (absent in demo mode)
+    renderExplanation(data.explanation);
+    
     // Smooth scroll to results
     if (resultsSection) {
         resultsSection.scrollIntoView({ 
@@ -594,6 +623,7 @@ function resetResults() {
     if (hamBar) hamBar.style.width = '0%';
     if (spamBar) spamBar.style.width = '0%';
     if (analysisTime) analysisTime.textContent = '0.00';
+    renderExplanation(null);
     
     setStatus('ready', 'Ready to analyze');
 }
@@ -607,11 +637,7 @@ function exportResults() {
         hamProbability: hamPercent ? hamPercent.textContent : '0%',
         spamProbability: spamPercent ? spamPercent.textContent : '0%',
         analysisTime: analysisTime ? analysisTime.textContent : '0.00',
-        features: {
-            urls: urlCount ? urlCount.textContent : '0',
-            numbers: numberCount ? numberCount.textContent : '0',
-            suspiciousWords: suspiciousCount ? suspiciousCount.textContent : '0'
-        },
+        explanation: lastExplanation,
         timestamp: new Date().toISOString()
     };
     
@@ -0,0 +1,141 @@
+# structured_log.py - non-blocking JSON-lines logger
+"""Structured logging that never blocks a request.
+
+log() builds a small dict and puts it on a bounded queue; a background
+thread serializes each event as one JSON line and writes it to stdout (or
+a file). When the queue is full the event is dropped and counted instead
+of waiting. Routine events can be sampled with sample_rate; warnings and
+errors are always kept.
+
+Configured with SPAM_LOG_SAMPLE_RATE (0..1, default 1), SPAM_LOG_FILE
+(default stdout) and SPAM_LOG_MAX_QUEUE.
+"""
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+ALWAYS_KEPT_LEVELS = ('warning', 'error')
+
+class StructuredLogger:
+    """Queue-backed JSON-lines logger with sampling"""
+
+    def __init__(self, path=None, sample_rate=1.0, max_queue=10000):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.logged = 0
+        self.sampled_out = 0
+        self.dropped = 0
+
+    def log(self, event, level='info', **fields):
+        """Queue one event; returns False if it was sampled out or dropped"""
+        if level not in ALWAYS_KEPT_LEVELS and self.sample_rate < 1.0:
+            if random.random() >= self.sample_rate:
+                self.sampled_out += 1
+                return False
+        record = {'ts': round(time.time(), 6), 'level': level, 'event': event}
+        record.update(fields)
+        self._ensure_running()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _ensure_running(self):
+        # Threads do not survive fork, so each worker process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                if self._pid is not None and self._pid != os.getpid():
+                    # Events queued by the parent are the parent's to write
+                    self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='structured-log', daemon=True)
+                self._thread.start()
+
+    def after_fork(self):
+        """Give a freshly forked child its own queue, lock and counters
+
+        The parent's writer thread may hold the queue's or the start lock's
+        mutex at the moment of the fork, and the child would wait on it
+        forever. Call this in the child before it logs anything.
+        """
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.logged = 0
+        self.sampled_out = 0
+        self.dropped = 0
+
+    def _open(self):
+        if self.path:
+            return open(self.path, 'a', encoding='utf-8')
+        return None
+
+    def _run(self):
+        stream = self._open()
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            # Write everything already queued before flushing once
+            records = [record]
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            lines = ''.join(json.dumps(r, default=str) + '\n' for r in records if r is not None)
+            try:
+                out = stream if stream is not None else sys.stdout
+                out.write(lines)
+                out.flush()
+                self.logged += len(records) - stop
+            except Exception:
+                self.dropped += len(records) - stop
+            if stop:
+                break
+        if stream is not None:
+            stream.close()
+
+    def close(self, timeout=2.0):
+        """Flush queued events and stop the writer thread"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout=timeout)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'logged': self.logged,
+            'sampled_out': self.sampled_out,
+            'dropped': self.dropped,
+            'sample_rate': self.sample_rate,
+        }
+
+def logger_from_env():
+    """Build the app's logger from SPAM_LOG_* variables"""
+    logger = StructuredLogger(
+        path=os.environ.get('SPAM_LOG_FILE') or None,
+        sample_rate=float(os.environ.get('SPAM_LOG_SAMPLE_RATE', 1.0)),
+        max_queue=int(os.environ.get('SPAM_LOG_MAX_QUEUE', 10000)),
+    )
+    atexit.register(logger.close)
+    return logger
@@ -0,0 +1,101 @@
+# test_parity.py - the fast paths must reproduce sklearn exactly
+"""Parity of BatchFeaturizer and LinearScorer with sklearn on a small
+generated corpus, so no trained model or data/ tree is needed.
+
+    python -m pytest -q
+
+`python batch_featurizer.py` and `python linear_scorer.py --check` run the
+same comparisons on the full data/ corpus.
+"""
+import random
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+from batch_featurizer import BatchFeaturizer, _same_fit, _same_matrix
+from inference import _identity, clean_email, cleaned_text_vectorizer
+from linear_scorer import LinearScorer
+
+HAM_WORDS = ('meeting', 'project', 'report', 'schedule', 'team', 'review', 'attached',
+             'thanks', 'the', 'and', 'for', 'with', 'this', 'we', 'notes', 'agenda')
+SPAM_WORDS = ('free', 'winner', 'money', 'offer', 'click', 'cash', 'prize', 'credit',
+              'the', 'and', 'for', 'now', 'you', 'limited', 'viagra', 'unsubscribe')
+
+def make_emails(count, seed):
+    """Raw emails with headers, URLs and numbers, alternating ham and spam"""
+    rng = random.Random(seed)
+    emails, labels = [], []
+    for index in range(count):
+        label = index % 2
+        words = SPAM_WORDS if label else HAM_WORDS
+        body = ' '.join(rng.choice(words + HAM_WORDS[:4] + SPAM_WORDS[:4])
+                        for _ in range(rng.randint(5, 60)))
+        if rng.random() < 0.3:
+            body += f" http://example.com/{rng.randint(1, 999)} call {rng.randint(100, 99999)}!"
+        subject = rng.choice(words).title()
+        emails.append(f"From: sender{index}@example.com\nSubject: {subject}\n\n{body}\n")
+        labels.append(label)
+    return emails, labels
+
+@pytest.fixture(scope='module')
+def corpus():
+    emails, labels = make_emails(160, seed=7)
+    return [clean_email(email) for email in emails], labels
+
+@pytest.fixture(scope='module')
+def unseen():
+    emails, _ = make_emails(40, seed=8)
+    return [clean_email(email) for email in emails]
+
+def production_vectorizer():
+    """The vectorizer create_model.py trains, with clean_email as preprocessor"""
+    return TfidfVectorizer(preprocessor=clean_email, lowercase=True, stop_words='english',
+                           max_features=300, ngram_range=(1, 3),
+                           token_pattern=r'\b[a-zA-Z]{2,}\b')
+
+VECTORIZERS = {
+    'production': lambda: cleaned_text_vectorizer(production_vectorizer()),
+    'tfidf-bigrams': lambda: TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=2),
+    'tfidf-trigrams-only': lambda: TfidfVectorizer(ngram_range=(3, 3), norm='l1', smooth_idf=False),
+    'count-limited': lambda: CountVectorizer(ngram_range=(1, 2), max_df=0.9, max_features=50,
+                                             stop_words=['the', 'and']),
+    'count-binary': lambda: CountVectorizer(ngram_range=(2, 3), binary=True, dtype=np.float32),
+}
+
+@pytest.mark.parametrize('name', sorted(VECTORIZERS))
+def test_batch_featurizer_matches_sklearn(name, corpus, unseen):
+    texts, _ = corpus
+    expected, ours = VECTORIZERS[name](), VECTORIZERS[name]()
+
+    assert _same_matrix(BatchFeaturizer(ours, workers=1).fit_transform(texts),
+                        expected.fit_transform(texts))
+    assert _same_fit(ours, expected)
+    assert _same_matrix(BatchFeaturizer(ours, workers=1).transform(unseen), expected.transform(unseen))
+
+def test_batch_featurizer_pool_matches_sklearn(corpus):
+    texts, _ = corpus
+    expected, ours = VECTORIZERS['production'](), VECTORIZERS['production']()
+
+    assert _same_matrix(BatchFeaturizer(ours, workers=2, chunk_size=25).fit_transform(texts),
+                        expected.fit_transform(texts))
+    assert _same_fit(ours, expected)
+
+def test_linear_scorer_matches_sklearn(corpus, unseen):
+    texts, labels = corpus
+    # Fitted the way the training scripts do: on cleaned texts, clean_email kept
+    vectorizer = production_vectorizer().set_params(preprocessor=_identity)
+    features = vectorizer.fit_transform(texts)
+    vectorizer.set_params(preprocessor=clean_email)
+    model = LogisticRegression(max_iter=1000, random_state=42).fit(features, labels)
+
+    sklearn_vectorizer = cleaned_text_vectorizer(vectorizer)
+    scorer = LinearScorer.from_sklearn(vectorizer, model)
+    documents = texts + unseen
+    expected_probs = model.predict_proba(sklearn_vectorizer.transform(documents))
+    expected_labels = model.predict(sklearn_vectorizer.transform(documents))
+    for text, expected_label, expected in zip(documents, expected_labels, expected_probs):
+        label, probs = scorer.score(text)
+        assert label == expected_label
+        assert probs == pytest.approx(list(expected), abs=1e-9)
@@ -1,30 +1,13 @@
 # train_model.py
 import pickle
-import re
 import os
+from corpus import fit_on_cleaned, load_corpus, transform_cleaned
+from corpus_dedup import print_report as print_dedup_report, split_corpus
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
 
-# Load Emails Function (same as original)
-def load_emails_from_folder(folder_list):
-    emails = []
-    for folder_path in folder_list:
-        for filename in os.listdir(folder_path):
-            filepath = os.path.join(folder_path, filename)
-            if os.path.isfile(filepath):
-                with open(filepath, 'r', encoding='latin-1') as file:
-                    emails.append(file.read())
-    return emails
-
-# Clean email function
-def clean_email(text):
-    text = text.split('\n\n', 1)[-1]
-    text = text.lower()
-    text = re.sub(r'http\S+', 'URL', text)
-    text = re.sub(r'\d+', 'NUMBER', text)
-    text = re.sub(r'[^\w\s]', '', text)
-    return text
+# Clean email function, shared with the app (MIME-aware, see body_extractor.py)
+from inference import clean_email
 
 # Main training function
 def train_and_save_model():
@@ -55,21 +38,17 @@ def train_and_save_model():
         print("Please make sure the 'data' folder exists with the required subfolders.")
         return
     
-    # Load emails
-    ham_emails = load_emails_from_folder(ham_folders)
-    spam_emails = load_emails_from_folder(spam_folders)
-    
-    x = ham_emails + spam_emails
-    y = [0] * len(ham_emails) + [1] * len(spam_emails)
+    # Load cleaned emails (read in parallel, cached between runs - see corpus.py)
+    x, y = load_corpus(ham_folders, spam_folders)
     
-    print(f"✅ Total Ham: {len(ham_emails)}")
-    print(f"✅ Total Spam: {len(spam_emails)}")
+    print(f"✅ Total Ham: {y.count(0)}")
+    print(f"✅ Total Spam: {y.count(1)}")
     print(f"✅ Total Emails: {len(x)}")
     
-    # Train-test split
-    x_train, x_test, y_train, y_test = train_test_split(
-        x, y, random_state=42, test_size=0.2, stratify=y
-    )
+    # Train-test split without duplicates across it (see corpus_dedup.py)
+    x_train, x_test, y_train, y_test, dedup_report = split_corpus(x, y)
+    if dedup_report is not None:
+        print_dedup_report(dedup_report)
     
     print(f"📊 Training samples: {len(x_train)}")
     print(f"📊 Testing samples: {len(x_test)}")
@@ -82,9 +61,9 @@ def train_and_save_model():
         max_features=5000
     )
     
-    # Transform training data
-    x_train_vec = vectorizer.fit_transform(x_train)
-    x_test_vec = vectorizer.transform(x_test)
+    # Transform training data (already cleaned, so the preprocessor is bypassed)
+    x_train_vec = fit_on_cleaned(vectorizer, x_train)
+    x_test_vec = transform_cleaned(vectorizer, x_test)
     
     print(f"📐 Feature vector shape: {x_train_vec.shape}")
     
@@ -143,7 +122,7 @@ def train_and_save_model():
     print("\n🧪 Quick Test Predictions:")
     for i, email in enumerate(test_emails, 1):
         cleaned = clean_email(email)
-        vectorized = vectorizer.transform([cleaned])
+        vectorized = transform_cleaned(vectorizer, [cleaned])
         prediction = model.predict(vectorized)[0]
         probability = model.predict_proba(vectorized)[0]
         
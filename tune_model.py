@@ -0,0 +1,225 @@
+# tune_model.py - cross-validated hyperparameter search for the TF-IDF model
+"""Tune the TfidfVectorizer / LogisticRegression settings of create_model.py.
+
+Candidates are every combination of --ngram-ranges, --max-features and
+--C. The expensive part, tokenizing a fold, only depends on the analyzer
+settings (ngram range, token pattern, stop words), so each pool task takes
+one analyzer setting and one fold. It counts n-grams once over the full
+fold vocabulary, then derives every max_features cut the way sklearn does
+(top terms by training-fold frequency), applies TF-IDF and fits every C on
+those shared counts.
+
+The search runs on the same 80% training split create_model.py uses. The
+best candidate is refit on that split, scored on the held-out 20% and
+written to --output-dir in the format app.py loads (joblib pickles plus
+the model artifact) together with tuning_report.json.
+
+    python tune_model.py
+    python tune_model.py --ngram-ranges 1,1 1,2 --max-features 8000 16000 --C 1 10 --workers 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import StratifiedKFold
+
+from corpus import HAM_FOLDERS, SPAM_FOLDERS, fit_on_cleaned, load_corpus, transform_cleaned
+from corpus_dedup import split_corpus
+from inference import _identity, clean_email
+from model_artifact import ARTIFACT_FILENAME, write_artifact
+
+TOKEN_PATTERN = r'\b[a-zA-Z]{2,}\b'
+
+# Approximate bytes per feature in memory: idf + coef (float64) + dict slot
+BYTES_PER_FEATURE = 8 + 8 + 100
+
+def model_size_bytes(terms):
+    return sum(len(term.encode('utf-8')) for term in terms) + BYTES_PER_FEATURE * len(terms)
+
+# Cleaned texts and labels, sent to every worker once by the pool initializer
+_texts = None
+_labels = None
+
+def _init_worker(texts, labels):
+    global _texts, _labels
+    _texts = texts
+    _labels = np.asarray(labels)
+
+def top_features(counts, max_features):
+    """Column indices sklearn would keep for max_features (most frequent terms)"""
+    if max_features is None or max_features >= counts.shape[1]:
+        return np.arange(counts.shape[1])
+    term_frequencies = np.asarray(counts.sum(axis=0)).ravel()
+    return np.sort((-term_frequencies).argsort()[:max_features])
+
+def evaluate_fold(task):
+    """Score every (max_features, C) candidate for one analyzer setting and fold"""
+    ngram_range, fold, train_index, test_index, max_features_list, c_values = task
+    train_texts = [_texts[i] for i in train_index]
+    test_texts = [_texts[i] for i in test_index]
+    y_train = _labels[train_index]
+    y_test = _labels[test_index]
+
+    # Tokenize the fold once for every candidate that shares these analyzer settings
+    start = time.perf_counter()
+    counter = CountVectorizer(preprocessor=_identity, stop_words='english',
+                              ngram_range=ngram_range, token_pattern=TOKEN_PATTERN)
+    train_counts = counter.fit_transform(train_texts)
+    tokenize_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    test_counts = counter.transform(test_texts)
+    test_tokenize_seconds = time.perf_counter() - start
+    terms = counter.get_feature_names_out()
+
+    results = []
+    for max_features in max_features_list:
+        columns = top_features(train_counts, max_features)
+        start = time.perf_counter()
+        tfidf = TfidfTransformer()
+        x_train = tfidf.fit_transform(train_counts[:, columns])
+        tfidf_seconds = time.perf_counter() - start
+        size = model_size_bytes(terms[columns])
+
+        for c_value in c_values:
+            start = time.perf_counter()
+            model = LogisticRegression(C=c_value, max_iter=1000, random_state=42)
+            model.fit(x_train, y_train)
+            fit_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            predictions = model.predict(tfidf.transform(test_counts[:, columns]))
+            predict_seconds = time.perf_counter() - start
+
+            results.append({
+                'ngram_range': list(ngram_range),
+                'max_features': max_features,
+                'C': c_value,
+                'fold': fold,
+                'accuracy': float(accuracy_score(y_test, predictions)),
+                # Training time as a standalone fit would see it
+                'train_seconds': tokenize_seconds + tfidf_seconds + fit_seconds,
+                'latency_ms': (test_tokenize_seconds + predict_seconds) * 1000 / len(test_index),
+                'model_bytes': size,
+            })
+    return results
+
+def summarize(fold_results):
+    """Average the per-fold results of each candidate, best first"""
+    grouped = defaultdict(list)
+    for result in fold_results:
+        key = (tuple(result['ngram_range']), result['max_features'], result['C'])
+        grouped[key].append(result)
+
+    candidates = []
+    for (ngram_range, max_features, c_value), results in grouped.items():
+        accuracies = [result['accuracy'] for result in results]
+        candidates.append({
+            'ngram_range': list(ngram_range),
+            'max_features': max_features,
+            'C': c_value,
+            'accuracy': float(np.mean(accuracies)),
+            'accuracy_std': float(np.std(accuracies)),
+            'train_seconds': float(np.mean([result['train_seconds'] for result in results])),
+            'latency_ms': float(np.mean([result['latency_ms'] for result in results])),
+            'model_bytes': int(np.mean([result['model_bytes'] for result in results])),
+        })
+    # Highest accuracy first; smaller models win ties
+    candidates.sort(key=lambda c: (-round(c['accuracy'], 6), c['model_bytes']))
+    return candidates
+
+def parse_ngram_range(value):
+    low, high = value.split(',')
+    return int(low), int(high)
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validated search over TF-IDF / LR settings")
+    parser.add_argument('--ngram-ranges', type=parse_ngram_range, nargs='+',
+                        default=[(1, 1), (1, 2), (1, 3)], help='e.g. 1,1 1,2 1,3')
+    parser.add_argument('--max-features', type=int, nargs='+', default=[4000, 8000, 16000, 32000])
+    parser.add_argument('--C', type=float, nargs='+', default=[0.3, 1.0, 3.0, 10.0])
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--output-dir', default=os.path.join('models', 'tuned'))
+    args = parser.parse_args()
+
+    texts, labels = load_corpus(HAM_FOLDERS, SPAM_FOLDERS)
+    if not texts:
+        print("❌ No emails loaded from data/")
+        return 1
+
+    # Same split as create_model.py; the test split is only used for the final model
+    x_train, x_test, y_train, y_test, _ = split_corpus(texts, labels)
+    folds = list(StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=42)
+                 .split(x_train, y_train))
+    tasks = [(ngram_range, fold, train_index, test_index, args.max_features, args.C)
+             for ngram_range in args.ngram_ranges
+             for fold, (train_index, test_index) in enumerate(folds)]
+
+    candidate_count = len(args.ngram_ranges) * len(args.max_features) * len(args.C)
+    print(f"🔎 {candidate_count} candidates x {args.folds} folds on {len(x_train)} emails, "
+          f"{len(tasks)} tokenization task(s) on {args.workers} worker(s)")
+    start_time = time.perf_counter()
+    fold_results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(x_train, y_train)) as pool:
+        for results in pool.map(evaluate_fold, tasks):
+            fold_results.extend(results)
+    print(f"⏱️ Search took {time.perf_counter() - start_time:.1f}s")
+
+    candidates = summarize(fold_results)
+    print(f"\n{'ngrams':>7} {'max_feat':>9} {'C':>6} {'accuracy':>15} {'train s':>8} "
+          f"{'ms/email':>9} {'size KB':>8}")
+    for candidate in candidates:
+        print(f"{'%d-%d' % tuple(candidate['ngram_range']):>7} {candidate['max_features']:>9} "
+              f"{candidate['C']:>6g} {candidate['accuracy']:>8.4f} ±{candidate['accuracy_std']:.4f} "
+              f"{candidate['train_seconds']:>8.2f} {candidate['latency_ms']:>9.3f} "
+              f"{candidate['model_bytes'] / 1024:>8.0f}")
+
+    # Refit the winner on the whole training split and evaluate on the held-out test split
+    best = candidates[0]
+    print(f"\n🏆 Best: ngram_range={tuple(best['ngram_range'])}, "
+          f"max_features={best['max_features']}, C={best['C']:g}")
+    tfidf = TfidfVectorizer(
+        preprocessor=clean_email,
+        lowercase=True,
+        stop_words='english',
+        max_features=best['max_features'],
+        ngram_range=tuple(best['ngram_range']),
+        token_pattern=TOKEN_PATTERN
+    )
+    lr_model = LogisticRegression(C=best['C'], max_iter=1000, random_state=42)
+    lr_model.fit(fit_on_cleaned(tfidf, x_train), y_train)
+    test_accuracy = accuracy_score(y_test, lr_model.predict(transform_cleaned(tfidf, x_test)))
+    print(f"✅ Held-out accuracy: {test_accuracy:.4f}")
+
+    # Introspection-only and most of the pickle (see compress_model.py)
+    if hasattr(tfidf, 'stop_words_'):
+        del tfidf.stop_words_
+    os.makedirs(args.output_dir, exist_ok=True)
+    joblib.dump(tfidf, os.path.join(args.output_dir, 'tfidf_vectorizer.joblib'))
+    joblib.dump(lr_model, os.path.join(args.output_dir, 'spam_model.joblib'))
+    write_artifact(os.path.join(args.output_dir, ARTIFACT_FILENAME), tfidf, lr_model)
+    with open(os.path.join(args.output_dir, 'tuning_report.json'), 'w') as f:
+        json.dump({
+            'best': best,
+            'test_accuracy': float(test_accuracy),
+            'folds': args.folds,
+            'training_samples': len(x_train),
+            'test_samples': len(x_test),
+            'candidates': candidates,
+        }, f, indent=2)
+    print(f"💾 Best model written to {args.output_dir}/ "
+          f"(copy its files into models/ to serve it)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,10 @@
+# wsgi.py - WSGI entry point for production servers
+#
+#   python serve.py                 # bundled pre-fork server (see serve.py)
+#   gunicorn --preload wsgi:app     # or any other WSGI server
+#
+# Importing app loads the model, so servers that import this module before
+# forking (gunicorn --preload, serve.py) load it once in the parent.
+from app import app
+
+application = app